@@ -51,6 +51,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'driver27.middleware.CacheMemoMiddleware',
 ]
 
 ROOT_URLCONF = 'dr27demo.dr27app.urls'
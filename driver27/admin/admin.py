@@ -1,4 +1,5 @@
 from django.conf.urls import url
+from django.core.exceptions import ValidationError
 from django.shortcuts import render
 from django.utils.translation import ugettext as _
 from .common import CommonTabbedModelAdmin
@@ -7,6 +8,7 @@ from .forms import *
 from .inlines import *
 from ..models import Driver, Competition, Circuit, Season, Result, CompetitionTeam, SeatPeriod
 from .. import lr_diff, lr_intr
+from ..batch import result_write_batch
 
 from django.contrib.admin import SimpleListFilter
 
@@ -280,11 +282,25 @@ class RaceAdmin(admin.ModelAdmin):
     def edit_positions(self, request, pk, *args, **kwargs):
         race = Race.objects.get(pk=pk)
         if request.method == 'POST':
+            try:
+                created_results, to_delete = self.save_positions(request, race)
+            except ValidationError as e:
+                messages.error(request, ', '.join(e.messages))
+            else:
+                messages.success(request, 'Positions are updated. Created: {created},  Deleted: {to_delete}'\
+                                 .format(created=created_results, to_delete=len(to_delete)))
+        context = {'race': race}
+        return render(request, 'driver27/admin/positions.html', context, *args, **kwargs)
 
+    @staticmethod
+    def save_positions(request, race):
+        """ Save the results of positions editor in a write batch: standings and cache are refreshed once """
+        with result_write_batch() as write_batch:
             to_delete = request.POST.get('to_delete', [])
             if to_delete:
                 to_delete = json.loads(to_delete)
                 Result.objects.filter(race=race, pk__in=list(to_delete)).delete()
+                write_batch.add_race(race)
 
             created_results = 0
 
@@ -300,19 +316,7 @@ class RaceAdmin(admin.ModelAdmin):
                     )
                     if created:
                         created_results += 1
-                    else:
-                        has_changed = False
-                        for attr in ['qualifying', 'finish', 'retired', 'wildcard']:
-                            if getattr(result, attr) != position[attr]:
-                                has_changed = True
-
-                        if not has_changed:
-                            continue
-
-            messages.success(request, 'Positions are updated. Created: {created},  Deleted: {to_delete}'\
-                             .format(created=created_results, to_delete=len(to_delete)))
-        context = {'race': race}
-        return render(request, 'driver27/admin/positions.html', context, *args, **kwargs)
+        return created_results, to_delete
 
     def print_seat(self, seat):
         return u"{driver}".format(driver=seat.driver) if seat else None
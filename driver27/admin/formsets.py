@@ -1,4 +1,5 @@
 from django import forms
+from ..batch import result_write_batch
 from ..models import Race
 from ..models import Seat
 from ..models import TeamSeason
@@ -35,3 +36,12 @@ class RaceFormSet(RelatedWithSeasonFormSet):
 
 class TeamSeasonFormSet(RelatedWithSeasonFormSet):
     model = TeamSeason
+
+
+class ResultFormSet(forms.models.BaseInlineFormSet):
+    def save(self, commit=True):
+        """ Results of the formset are saved in a write batch: standings and cache are refreshed once """
+        if not commit:
+            return super(ResultFormSet, self).save(commit=commit)
+        with result_write_batch():
+            return super(ResultFormSet, self).save(commit=commit)
@@ -49,6 +49,7 @@ class TeamInline(admin.TabularInline):
 class ResultInline(CompetitionFilterInline):
     model = Result
     extra = 1
+    formset = ResultFormSet
     ordering = ('retired', 'finish', 'qualifying',)
     readonly_fields = ('points',)
 
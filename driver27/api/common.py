@@ -28,21 +28,45 @@ def get_dict_from_races(races):
     ]
 
 
+def get_dict_from_driver(driver):
+    return {
+        'id': driver.id,
+        'last_name': driver.last_name,
+        'first_name': driver.first_name,
+        'country': driver.country.code
+    }
+
+
 def get_dict_from_rank_entry(rank_entry):
 
     return {
         'points': rank_entry['points'],
-        'driver': {
-            'id': rank_entry['driver'].id,
-            'last_name': rank_entry['driver'].last_name,
-            'first_name': rank_entry['driver'].first_name,
-            'country': rank_entry['driver'].country.code
-        },
+        'driver': get_dict_from_driver(rank_entry['driver']),
         'teams': rank_entry['teams'],
         'positions_order': rank_entry['pos_str']
      }
 
 
+def get_dict_from_compared_rank_entry(rank_entry, get_dict_method):
+    """ Dict of rank entry with the points and position of each punctuation code (see compared_points_rank) """
+    compared_entry = get_dict_method(rank_entry)
+    compared_entry['positions'] = rank_entry['positions']
+    return compared_entry
+
+
+def get_dict_from_progression_entry(progression_entry):
+    """ Dict of an entry of Season.points_progression, with points and position by round """
+    progression_dict = {
+        'points': progression_entry['points'],
+        'positions': progression_entry['positions']
+    }
+    if 'team' in progression_entry:
+        progression_dict['team'] = progression_entry['team'].name
+    else:
+        progression_dict['driver'] = get_dict_from_driver(progression_entry['driver'])
+    return progression_dict
+
+
 class DR27Serializer(object):
     def __init__(self, *args, **kwargs):
         self.exclude_fields = kwargs.pop('exclude_fields', None)
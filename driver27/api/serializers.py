@@ -151,6 +151,16 @@ class SeatRecapSerializer(serializers.ModelSerializer):
         fields = ('driver_details', 'team')
 
 
+class ResultGridSerializer(serializers.Serializer):
+    """ Result of a race in a grid of results (see RaceResultsGrid) """
+    seat = serializers.IntegerField()
+    qualifying = serializers.IntegerField(required=False, allow_null=True, min_value=1)
+    finish = serializers.IntegerField(required=False, allow_null=True, min_value=1)
+    retired = serializers.BooleanField(required=False)
+    wildcard = serializers.BooleanField(required=False)
+    comment = serializers.CharField(required=False, allow_null=True, allow_blank=True, max_length=250)
+
+
 class ResultSerializer(serializers.ModelSerializer):
     id = serializers.ReadOnlyField()
     seat_details = serializers.SerializerMethodField()
@@ -1,15 +1,26 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.utils.timezone import datetime  # important if using timezones
+from django.utils.translation import ugettext as _
+from rest_framework import status
 from rest_framework.decorators import detail_route
+from rest_framework.exceptions import ValidationError
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from .common import DR27ViewSet
-from .serializers import RaceSerializer, ResultSerializer, SeatSerializer, SeasonSerializer
+from .serializers import RaceSerializer, ResultGridSerializer, ResultSerializer, SeatSerializer, SeasonSerializer
 from .serializers import CircuitSerializer, GrandPrixSerializer, CompetitionSerializer
 from .serializers import TeamSerializer, DriverSerializer, SeatPeriodSerializer
 from .common import get_dict_from_rank_entry, get_dict_from_team_rank_entry, get_dict_from_races
+from .common import get_dict_from_compared_rank_entry, get_dict_from_driver, get_dict_from_progression_entry
+from ..bulk import RaceResultsGrid
 from ..models import Competition, Driver, Race, Result, Season, Seat, Team, GrandPrix, Circuit, SeatPeriod
 from django.db.models import Q
-from ..punctuation import get_punctuation_config
+from ..punctuation import get_punctuation_config, get_punctuation_label_dict
+
+# simulations allowed by the API (the first one by default). Each one is cached by season with a fixed seed,
+# so clients can not run or cache a simulation by request
+API_SIMULATIONS = (10000, 1000)
+
 
 class ShortPagePagination(PageNumberPagination):
     page_size = 20
@@ -50,6 +61,20 @@ class RaceViewSet(DR27ViewSet, AbstractCommonSeatViewSet):
     def results(self, request, pk=None):
         return self.get_common_detail_route(request, 'results', ResultSerializer)
 
+    @detail_route(methods=['post'], url_path='results/bulk', url_name='results-bulk')
+    def results_bulk(self, request, pk=None):
+        """ Save a grid of results in one transaction (see RaceResultsGrid). ?replace=1 deletes the others """
+        race = self.get_object()
+        serializer = ResultGridSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        replace = request.query_params.get('replace') in ('1', 'true')
+        try:
+            results = RaceResultsGrid(race, serializer.validated_data, replace=replace).save()
+        except DjangoValidationError as e:
+            raise ValidationError(e.messages)
+        serializer = ResultSerializer(instance=results, many=True, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
 
 
 
@@ -133,6 +158,68 @@ class SeasonViewSet(DR27CommonCompetitionViewSet, AbstractCommonSeatViewSet):
     def standings_team(self, request, pk=None):
         return self._abstract_rank('team_points_rank', get_dict_from_team_rank_entry)
 
+    @detail_route(methods=['get'], url_path='standings-compared')
+    def standings_compared(self, request, pk=None):
+        """
+        Driver and team standings with every punctuation, ordered by the punctuation of season
+        (or by the first configured punctuation, if season has not one of them)
+        """
+        season = self.get_object()
+        ranks = {'standings': (season.compared_points_rank(), get_dict_from_rank_entry),
+                 'standings_team': (season.compared_team_points_rank(), get_dict_from_team_rank_entry)}
+        punctuation_labels = get_punctuation_label_dict() or []
+        serializer_rank = {
+            'punctuation': season.punctuation,
+            'punctuation_labels': dict(punctuation_labels)
+        }
+        order_code = season.punctuation
+        if order_code not in serializer_rank['punctuation_labels'] and punctuation_labels:
+            order_code = punctuation_labels[0][0]
+        for rank_key, (rank, dict_method) in ranks.items():
+            if order_code in serializer_rank['punctuation_labels']:
+                rank = sorted(rank, key=lambda x: x['positions'][order_code])
+            serializer_rank[rank_key] = [get_dict_from_compared_rank_entry(entry, dict_method) for entry in rank]
+        return Response(serializer_rank)
+
+    @detail_route(methods=['get'], url_path='standings-progression')
+    def standings_progression(self, request, pk=None):
+        """ Points and position after every round. Teams with ?model=team, other punctuation with ?punctuation """
+        season = self.get_object()
+        progression = season.points_progression(team=request.query_params.get('model') == 'team',
+                                                punctuation_code=request.query_params.get('punctuation', None))
+        serializer_rank = {
+            'rounds': progression['rounds'],
+            'standings': [get_dict_from_progression_entry(entry) for entry in progression['rank']]
+        }
+        return Response(serializer_rank)
+
+    @detail_route(methods=['get'])
+    def simulation(self, request, pk=None):
+        """
+        Probabilities of title, podium and positions simulating pending races, with one of API_SIMULATIONS
+        (?simulations) and a configured punctuation (?punctuation)
+        """
+        season = self.get_object()
+        simulations = request.query_params.get('simulations', str(API_SIMULATIONS[0]))
+        if simulations not in [str(api_simulations) for api_simulations in API_SIMULATIONS]:
+            raise ValidationError(_('Simulations must be one of {simulations}').format(
+                simulations=', '.join(str(api_simulations) for api_simulations in API_SIMULATIONS)))
+        punctuation_code = request.query_params.get('punctuation', None)
+        if punctuation_code is not None and punctuation_code not in dict(get_punctuation_label_dict() or []):
+            raise ValidationError(_('Punctuation is not valid'))
+        simulation = season.simulate(simulations=int(simulations), punctuation_code=punctuation_code)
+        drivers = Driver.objects.in_bulk(list(simulation['drivers']))
+        teams = Team.objects.in_bulk(list(simulation['teams']))
+        serializer_rank = {
+            'simulations': simulation['simulations'],
+            'seed': simulation['seed'],
+            'drivers': [dict(probabilities, driver=get_dict_from_driver(drivers[driver_id]))
+                        for driver_id, probabilities in simulation['drivers'].items()],
+            'teams': [dict(probabilities, team=teams[team_id].name)
+                      for team_id, probabilities in simulation['teams'].items()]
+        }
+        return Response(serializer_rank)
+
     @detail_route(methods=['get'])
     def title(self, request, pk=None):
         return self._abstract_rank('only_title_contenders', get_dict_from_rank_entry)
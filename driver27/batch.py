@@ -0,0 +1,99 @@
+import threading
+from contextlib import contextmanager
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count
+
+from .standings import refresh_season_standings
+
+
+class ResultWriteBatch(object):
+    """
+    Results saved or deleted in a batch (e.g. every result of a race). Checks of seats are read once by season,
+    and the checks between results (a driver only once by race), points of results, saved standings and cache
+    versions are done once by race or season at the end of the batch, instead of after each result.
+    """
+
+    def __init__(self):
+        self.seasons = {}
+        self.race_ids = set()
+        # races whose points of results are not updated yet
+        self.points_race_ids = set()
+        self.seat_checks = {}
+
+    def get_seat_checks(self, result):
+        """ (team of seat is in competition, seat is in season) of result, from sets read once by season """
+        season = result.race.season
+        if season.pk not in self.seat_checks:
+            team_ids = set(season.competition.teams.values_list('pk', flat=True))
+            seat_teams = dict(season.seats.values_list('pk', 'team_id'))
+            self.seat_checks[season.pk] = (team_ids, seat_teams)
+        team_ids, seat_teams = self.seat_checks[season.pk]
+        seat_in_season = result.seat_id in seat_teams
+        team_id = seat_teams[result.seat_id] if seat_in_season else result.seat.team_id
+        return team_id in team_ids, seat_in_season
+
+    def add_season(self, season):
+        self.seasons[season.pk] = season
+
+    def add_race(self, race, points_updated=False):
+        """ Race with saved results. With points_updated, points of its results are already saved by the caller """
+        self.race_ids.add(race.pk)
+        if not points_updated:
+            self.points_race_ids.add(race.pk)
+        self.add_season(race.season)
+
+    def validate(self):
+        """ A driver can not have two results (with different seats) in a race. Each repeated one is an error """
+        from .models import Result
+        repeated_drivers = Result.objects.filter(race_id__in=self.race_ids).order_by('race_id', 'seat__driver_id') \
+            .values_list('race_id', 'seat__driver_id').annotate(count_results=Count('pk')) \
+            .filter(count_results__gt=1)
+        errors = [u'Exists a result with the same driver in this race (different Seat): '
+                  u'race {race_id}, driver {driver_id}'.format(race_id=race_id, driver_id=driver_id)
+                  for race_id, driver_id, count_results in repeated_drivers]
+        if errors:
+            raise ValidationError({'seat': errors})
+
+    def update_points(self):
+        from .models import Race
+        for race in Race.objects.filter(pk__in=self.points_race_ids):
+            race.update_results_points()
+
+    def flush(self):
+        self.validate()
+        self.update_points()
+        for season in self.seasons.values():
+            refresh_season_standings(season)
+            season.invalidate_cache()
+        self.seasons = {}
+        self.race_ids = set()
+        self.points_race_ids = set()
+
+
+_batch_local = threading.local()
+
+
+def get_write_batch():
+    """ Write batch of the current thread, None if there is not any """
+    return getattr(_batch_local, 'batch', None)
+
+
+@contextmanager
+def result_write_batch():
+    """
+    Transaction of a write batch of results, flushed at the end (a ValidationError rolls back every change).
+    A nested context uses the batch of the outer one
+    """
+    batch = get_write_batch()
+    if batch is not None:
+        yield batch
+        return
+    batch = _batch_local.batch = ResultWriteBatch()
+    try:
+        with transaction.atomic():
+            yield batch
+            batch.flush()
+    finally:
+        _batch_local.batch = None
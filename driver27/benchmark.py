@@ -0,0 +1,211 @@
+import json
+import time
+from collections import deque
+
+import six
+
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection
+from django.db.models import Count
+from django.test import RequestFactory
+
+from . import views, views_ajax
+from .caching import GLOBAL_CACHE_SCOPE, bump_cache_versions, get_cache_scope, rank_cache
+from .models import Driver, RankModel, Result, Season, Team
+from .recompute import get_rank_scopes
+from .records import get_record_config
+
+BENCHMARK_SCOPES = ('season', 'competition', 'global')
+BENCHMARK_RECORD = 'PODIUM'
+BENCHMARK_REPEAT = 3
+# a case is a regression if it is THRESHOLD times slower than baseline (and MIN_SECONDS slower at least,
+# to skip the noise of fast cases) or it does more queries
+BENCHMARK_THRESHOLD = 1.25
+BENCHMARK_MIN_SECONDS = 0.005
+
+
+def get_benchmark_scopes(season=None):
+    """ {scope: Season, Competition or RankModel}, with the season with more results by default """
+    if season is None:
+        season = Season.objects.annotate(count_results=Count('races__results')).order_by('-count_results', 'pk') \
+            .select_related('competition').first()
+    scopes = {'global': RankModel()}
+    if season is not None:
+        scopes.update(season=season, competition=season.competition)
+    return scopes
+
+
+def get_rank_cases(record_code=BENCHMARK_RECORD):
+    """ (name, function of a rank model) of each rank. Lazy ranks are evaluated """
+    record_filter = get_record_config(record_code).get('filter')
+    return [
+        ('points_rank', lambda rank_model: rank_model.points_rank()),
+        ('team_points_rank', lambda rank_model: rank_model.team_points_rank()),
+        ('olympic_rank', lambda rank_model: rank_model.olympic_rank()),
+        ('team_olympic_rank', lambda rank_model: rank_model.team_olympic_rank()),
+        ('stats_rank', lambda rank_model: rank_model.stats_rank(**dict(record_filter))),
+        ('seasons_rank', lambda rank_model: rank_model.seasons_rank(**dict(record_filter))),
+        ('streak_rank', lambda rank_model: rank_model.streak_rank(**dict(record_filter))),
+        ('comeback_rank', lambda rank_model: list(rank_model.comeback_rank())),
+        ('get_positions_draw', lambda rank_model: rank_model.get_positions_draw()),
+    ]
+
+
+def get_ajax_params(rank_model):
+    """ GET params of ajax views to choose the season or competition of rank model """
+    params = {}
+    competition = getattr(rank_model, 'competition', None)
+    year = getattr(rank_model, 'year', None)
+    if year is not None:
+        params.update(competition_slug=competition.slug, year=year)
+    elif getattr(rank_model, 'slug', None):
+        params['competition_slug'] = rank_model.slug
+    return params
+
+
+def render_view(view, params=None, ajax=False, **kwargs):
+    """ Content of a view, requested without middlewares """
+    extra = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'} if ajax else {}
+    request = RequestFactory().get('/', data=params or {}, **extra)
+    request.user = AnonymousUser()
+    response = view(request, **kwargs)
+    if response.status_code != 200:
+        raise ValueError(u'{view} returned {status_code}'.format(view=view.__name__,
+                                                                 status_code=response.status_code))
+    return response.content
+
+
+def get_view_cases(record_code=BENCHMARK_RECORD):
+    """ (name, function of a rank model) of each ajax view """
+
+    def get_standing_case(params):
+        return lambda rank_model: render_view(views_ajax.standing_view, dict(get_ajax_params(rank_model), **params),
+                                              ajax=True)
+
+    def get_stats_case(params):
+        return lambda rank_model: render_view(views_ajax.stats_view, dict(get_ajax_params(rank_model),
+                                                                          record=record_code, **params), ajax=True)
+
+    return [
+        ('standing_view', get_standing_case({'model': 'driver'})),
+        ('standing_view_team', get_standing_case({'model': 'team'})),
+        ('standing_view_olympic', get_standing_case({'model': 'driver', 'olympic': 1})),
+        ('stats_view', get_stats_case({'model': 'driver'})),
+        ('stats_view_streak', get_stats_case({'model': 'driver', 'rank_opt': 'streak'})),
+        ('stats_view_seasons', get_stats_case({'model': 'driver', 'rank_opt': 'seasons'})),
+    ]
+
+
+def get_profile_cases():
+    """ (name, function) of profile views of the driver and the team with more results """
+    driver = Driver.objects.annotate(count_results=Count('seats__results')).order_by('-count_results', 'pk').first()
+    team = Team.objects.annotate(count_results=Count('seats__results')).order_by('-count_results', 'pk').first()
+    cases = []
+    if driver is not None:
+        cases.append(('driver_profile_view', lambda: render_view(views.driver_profile_view, driver_id=driver.pk)))
+    if team is not None:
+        cases.append(('team_profile_view', lambda: render_view(views.team_profile_view, team_id=team.pk)))
+    return cases
+
+
+def invalidate_rank_caches():
+    """ Ranks cached in every scope are not read again (other keys of cache are kept) """
+    bump_cache_versions([get_cache_scope(model_name, pk) if model_name != 'global' else GLOBAL_CACHE_SCOPE
+                         for model_name, pk in get_rank_scopes()])
+    rank_cache.l1_cache.clear()
+
+
+class QueryCounter(object):
+    """ Number of queries run in the context, even beyond the limit of the queries log of connection """
+
+    def __init__(self):
+        self.count = 0
+
+    def __enter__(self):
+        self.force_debug_cursor = connection.force_debug_cursor
+        self.queries_log = connection.queries_log
+        connection.force_debug_cursor = True
+        connection.queries_log = deque()
+        connection.ensure_connection()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.count = len(connection.queries_log)
+        connection.queries_log = self.queries_log
+        connection.force_debug_cursor = self.force_debug_cursor
+
+
+def measure(function, repeat=BENCHMARK_REPEAT):
+    """
+    Seconds (the best of repeat) and queries of a call without cached ranks, and seconds and queries of a
+    call with the ranks cached by the previous one
+    """
+    seconds = []
+    for index in range(repeat):
+        invalidate_rank_caches()
+        with QueryCounter() as queries:
+            start = time.time()
+            function()
+            seconds.append(time.time() - start)
+    with QueryCounter() as cached_queries:
+        start = time.time()
+        function()
+        cached_seconds = time.time() - start
+    return {'seconds': min(seconds), 'queries': queries.count, 'cached_seconds': cached_seconds,
+            'cached_queries': cached_queries.count}
+
+
+def run_benchmark(scopes=BENCHMARK_SCOPES, repeat=BENCHMARK_REPEAT, season=None, names=None, progress=None):
+    """
+    Measure every rank and ajax view in each scope, and profile views once. Return {case: measure}, with
+    cases named as season.points_rank or profile.driver_profile_view
+    """
+    rank_models = get_benchmark_scopes(season=season)
+    cases = []
+    for scope in scopes:
+        rank_model = rank_models.get(scope)
+        if rank_model is None:
+            continue
+        for name, function in get_rank_cases() + get_view_cases():
+            if name == 'get_positions_draw' and scope != 'season':
+                continue
+            cases.append((u'{scope}.{name}'.format(scope=scope, name=name),
+                          lambda function=function, rank_model=rank_model: function(rank_model)))
+    cases.extend((u'profile.{name}'.format(name=name), function) for name, function in get_profile_cases())
+
+    benchmarks = {}
+    for case_name, function in cases:
+        if names and case_name.split('.')[-1] not in names:
+            continue
+        benchmarks[case_name] = measure(function, repeat=repeat)
+        if progress is not None:
+            progress(case_name, benchmarks[case_name])
+    season = rank_models.get('season')
+    return {'results': Result.objects.count(), 'season': six.text_type(season) if season else None,
+            'benchmarks': benchmarks}
+
+
+def compare_benchmarks(baseline, current, threshold=BENCHMARK_THRESHOLD, min_seconds=BENCHMARK_MIN_SECONDS):
+    """ Regressions of current run against baseline: [(case, field, baseline value, current value)] """
+    regressions = []
+    for case_name, current_measure in sorted(current['benchmarks'].items()):
+        baseline_measure = baseline['benchmarks'].get(case_name)
+        if baseline_measure is None:
+            continue
+        baseline_seconds, seconds = baseline_measure['seconds'], current_measure['seconds']
+        if seconds > baseline_seconds * threshold and seconds - baseline_seconds > min_seconds:
+            regressions.append((case_name, 'seconds', baseline_seconds, seconds))
+        for field in ('queries', 'cached_queries'):
+            if current_measure[field] > baseline_measure[field]:
+                regressions.append((case_name, field, baseline_measure[field], current_measure[field]))
+    return regressions
+
+
+def write_benchmark(benchmark, path):
+    with open(path, 'w') as json_file:
+        json.dump(benchmark, json_file, indent=2, sort_keys=True)
+
+
+def read_benchmark(path):
+    with open(path) as json_file:
+        return json.load(json_file)
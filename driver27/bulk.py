@@ -0,0 +1,345 @@
+import csv
+import io
+from itertools import islice
+
+import six
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .batch import result_write_batch
+from .models import Driver, Race, Result, Seat, Team, get_tuple_from_result
+from .points_calculator import PointsCalculator
+from .standings import refresh_season_standings
+
+CSV_CHUNK_SIZE = 1000
+CSV_TRUE_VALUES = ('1', 'true', 'yes', 'y', 'x')
+
+GRID_FIELDS = ('qualifying', 'finish', 'retired', 'wildcard', 'comment')
+GRID_POSITION_FIELDS = ('qualifying', 'finish')
+
+
+class RaceResultsGrid(object):
+    """
+    Whole classification of a race (a dict with seat and the fields of GRID_FIELDS by result), saved in
+    one transaction. Results of race are updated by seat, the others are created in bulk. Positions taken
+    from results out of the grid are swapped in memory (as SwapIntegerField), and standings and cache
+    of season are refreshed once. With replace, results of seats out of the grid are deleted.
+    """
+
+    def __init__(self, race, rows, replace=False):
+        self.race = race
+        self.rows = rows
+        self.replace = replace
+
+    def validate(self):
+        """ Seats of season (in one query), without repeated seats, drivers or positions """
+        errors = []
+        season = self.race.season
+        seat_drivers = dict(season.seats.values_list('pk', 'driver_id'))
+        for row in self.rows:
+            if row['seat'] not in seat_drivers:
+                errors.append(u'Seat {seat} is not valid in {season_year}'.format(seat=row['seat'],
+                                                                                   season_year=season.year))
+        values_by_field = {
+            'seat': [row['seat'] for row in self.rows],
+            'driver': [seat_drivers.get(row['seat']) for row in self.rows if row['seat'] in seat_drivers]
+        }
+        for field in GRID_POSITION_FIELDS:
+            values_by_field[field] = [row.get(field) for row in self.rows if row.get(field)]
+        for field, values in values_by_field.items():
+            if len(values) != len(set(values)):
+                errors.append(u'Repeated {field} in results'.format(field=field))
+        if errors:
+            raise ValidationError(errors)
+
+    @staticmethod
+    def resolve_positions(grid_results, other_results, saved_positions):
+        """
+        Positions of results out of the grid taken by the grid are swapped with the saved ones of the grid
+        seats (or the next free position). Return the results out of the grid whose positions changed
+        """
+        changed_results = set()
+        for field in GRID_POSITION_FIELDS:
+            taken = set(getattr(result, field) for result in grid_results if getattr(result, field))
+            taken.update(getattr(result, field) for result in other_results if getattr(result, field))
+            free = sorted(set(positions[field] for seat_id, positions in saved_positions.items()
+                              if positions[field]) - taken)
+            grid_taken = set(getattr(result, field) for result in grid_results if getattr(result, field))
+            for result in sorted(other_results, key=lambda x: getattr(x, field) or 0):
+                if getattr(result, field) in grid_taken:
+                    if free:
+                        new_position = free.pop(0)
+                    else:
+                        new_position = max(taken) + 1
+                    taken.add(new_position)
+                    setattr(result, field, new_position)
+                    changed_results.add(result)
+        return changed_results
+
+    def save(self):
+        """ Save the grid. Return the results of the grid """
+        self.validate()
+        race = Race.objects.select_related('season__competition', 'grand_prix', 'circuit', 'fastest_car') \
+            .get(pk=self.race.pk)
+        saved_results = dict((result.seat_id, result) for result in race.results.all())
+        saved_positions = dict((seat_id, dict((field, getattr(result, field)) for field in GRID_POSITION_FIELDS))
+                               for seat_id, result in saved_results.items())
+        grid_results = []
+        for row in self.rows:
+            result = saved_results.pop(row['seat'], None) or Result(race=race, seat_id=row['seat'])
+            result.race = race
+            for field in GRID_FIELDS:
+                if field in row:
+                    setattr(result, field, row[field])
+            grid_results.append(result)
+        other_results = list(saved_results.values()) if not self.replace else []
+        changed_results = self.resolve_positions(grid_results, other_results, saved_positions)
+
+        # points of every result with the punctuation of season, read once
+        calculator = PointsCalculator(race.season.get_punctuation_config())
+        for result in grid_results + list(changed_results):
+            result.points = calculator.calculator(get_tuple_from_result(result))
+
+        with result_write_batch() as write_batch:
+            if self.replace and saved_results:
+                Result.objects.filter(pk__in=[result.pk for result in saved_results.values()]).delete()
+            # update, without signals of SwapIntegerField (positions are already swapped)
+            for result in grid_results + list(changed_results):
+                if result.pk:
+                    Result.objects.filter(pk=result.pk).update(points=result.points, **dict(
+                        (field, getattr(result, field)) for field in GRID_FIELDS))
+            Result.objects.bulk_create([result for result in grid_results if not result.pk])
+            # a driver with other seat in race is checked at the end of batch (points are already saved)
+            write_batch.add_race(race, points_updated=True)
+        # pks of created results are not returned by every database
+        results = dict((result.seat_id, result) for result in race.results.all())
+        return [results[row['seat']] for row in self.rows]
+
+
+def open_csv(path, mode='r'):
+    """ CSV file to read or write (mode w) with csv module (bytes in Python 2, text in Python 3) """
+    if six.PY2:
+        return open(path, mode + 'b')
+    return io.open(path, mode, newline='', encoding='utf-8')
+
+
+def parse_csv_int(value):
+    return int(value) if value not in (None, '') else None
+
+
+def parse_csv_bool(value):
+    return (value or '').strip().lower() in CSV_TRUE_VALUES
+
+
+class CSVBulkLoader(object):
+    """
+    Streaming loader of a CSV file, read in chunks of rows. Foreign keys are checked against dicts preloaded
+    once (see get_maps), each chunk is validated at once and saved with bulk_create in its own transaction.
+    Invalid rows are skipped and reported in errors (line, message). With dry_run, nothing is saved.
+    """
+    model = None
+    fields = ()
+
+    def __init__(self, csvfile, chunk_size=CSV_CHUNK_SIZE, dry_run=False, progress=None):
+        self.csvfile = csvfile
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.progress = progress
+        self.errors = []
+        self.loaded = 0
+
+    def get_maps(self):
+        """ Dicts to resolve foreign keys, read before the first chunk """
+        pass
+
+    def get_object(self, row):
+        """ Unsaved object of row. A ValueError skips the row """
+        return self.model(**dict((field, row[field]) for field in self.fields if row.get(field) not in (None, '')))
+
+    def validate_chunk(self, objects):
+        """ Valid (line, object) of a chunk, checked with the database at once """
+        return objects
+
+    def save_chunk(self, objects):
+        with transaction.atomic():
+            self.model.objects.bulk_create(objects)
+
+    def finish(self):
+        """ Called once after the last chunk (if it is not a dry run) """
+        pass
+
+    def get_chunks(self):
+        reader = enumerate(csv.DictReader(self.csvfile, delimiter=','), start=2)
+        while True:
+            chunk = list(islice(reader, self.chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def load(self):
+        """ Load every row. Return the number of loaded rows (valid rows with dry_run) """
+        self.get_maps()
+        for chunk in self.get_chunks():
+            objects = []
+            for line, row in chunk:
+                try:
+                    objects.append((line, self.get_object(row)))
+                except (ValueError, KeyError) as e:
+                    self.errors.append((line, six.text_type(e)))
+            objects = [obj for line, obj in self.validate_chunk(objects)]
+            if not self.dry_run:
+                self.save_chunk(objects)
+            self.loaded += len(objects)
+            if self.progress is not None:
+                self.progress(self.loaded, len(self.errors))
+        self.errors.sort()
+        if not self.dry_run:
+            self.finish()
+        return self.loaded
+
+
+class ResultCSVLoader(CSVBulkLoader):
+    """
+    Results with race_id and seat_id (as create_csv_for_result), other columns are ignored. Points are computed
+    in memory with the punctuation of each season, and standings and cache of each season are refreshed
+    once at the end.
+    """
+    model = Result
+
+    def __init__(self, *args, **kwargs):
+        super(ResultCSVLoader, self).__init__(*args, **kwargs)
+        self.races = {}
+        self.seat_drivers = {}
+        self.season_seats = {}
+        self.calculators = {}
+        self.seen_drivers = set()
+        self.seen_positions = set()
+        self.seasons = {}
+
+    def get_maps(self):
+        self.races = Race.objects.select_related('season__competition', 'grand_prix', 'circuit').in_bulk()
+        self.seat_drivers = dict(Seat.objects.values_list('pk', 'driver_id'))
+
+    def get_season_seats(self, season):
+        if season.pk not in self.season_seats:
+            self.season_seats[season.pk] = set(season.seats.values_list('pk', flat=True))
+            self.calculators[season.pk] = PointsCalculator(season.get_punctuation_config())
+        return self.season_seats[season.pk]
+
+    def get_object(self, row):
+        race = self.races.get(parse_csv_int(row['race_id']))
+        seat_id = parse_csv_int(row['seat_id'])
+        if race is None:
+            raise ValueError(u'Race {race_id} does not exist'.format(race_id=row['race_id']))
+        if seat_id not in self.get_season_seats(race.season):
+            raise ValueError(u'{seat_id} is not valid in {season_year}'.format(seat_id=row['seat_id'],
+                                                                               season_year=race.season.year))
+        result = self.model(race=race, seat_id=seat_id, qualifying=parse_csv_int(row.get('qualifying')),
+                            finish=parse_csv_int(row.get('finish')), retired=parse_csv_bool(row.get('retired')),
+                            wildcard=parse_csv_bool(row.get('wildcard')), comment=row.get('comment') or None)
+        result.points = self.calculators[race.season_id].calculator(get_tuple_from_result(result))
+        return result
+
+    def validate_chunk(self, objects):
+        """
+        A driver and a position (qualifying or finish) only once by race, in the file and in the database.
+        Positions are not swapped as SwapIntegerField does, because results are saved with bulk_create
+        """
+        race_ids = set(result.race_id for line, result in objects)
+        saved_drivers = set()
+        saved_positions = set()
+        for race_id, driver_id, qualifying, finish in self.model.objects.filter(race_id__in=race_ids) \
+                .values_list('race_id', 'seat__driver_id', 'qualifying', 'finish'):
+            saved_drivers.add((race_id, driver_id))
+            saved_positions.update((race_id, field, position) for field, position
+                                   in zip(GRID_POSITION_FIELDS, (qualifying, finish)) if position)
+        valid_objects = []
+        for line, result in objects:
+            race_driver = (result.race_id, self.seat_drivers[result.seat_id])
+            if race_driver in saved_drivers or race_driver in self.seen_drivers:
+                self.errors.append((line, u'Exists a result with the same driver in race {race_id}'.format(
+                    race_id=result.race_id)))
+                continue
+            race_positions = [(result.race_id, field, getattr(result, field)) for field in GRID_POSITION_FIELDS
+                              if getattr(result, field)]
+            repeated_positions = [race_position for race_position in race_positions
+                                  if race_position in saved_positions or race_position in self.seen_positions]
+            if repeated_positions:
+                self.errors.extend((line, u'Exists a result with {field} {position} in race {race_id}'.format(
+                    field=field, position=position, race_id=race_id))
+                    for race_id, field, position in repeated_positions)
+                continue
+            self.seen_drivers.add(race_driver)
+            self.seen_positions.update(race_positions)
+            self.seasons[result.race.season_id] = result.race.season
+            valid_objects.append((line, result))
+        return valid_objects
+
+    def finish(self):
+        for season in self.seasons.values():
+            refresh_season_standings(season)
+            season.invalidate_cache()
+
+
+class SeatCSVLoader(CSVBulkLoader):
+    """
+    Drivers, teams or seats (as export_seats_for_csv). Rows of existing ids or natural keys (name of driver
+    or team, driver and team of seat) are skipped, so a file can be loaded again.
+    """
+    fields_by_import = {
+        'drivers': ('id', 'first_name', 'last_name', 'country', 'year_of_birth'),
+        'teams': ('id', 'name', 'full_name', 'country'),
+        'seats': ('id', 'driver_id', 'team_id')
+    }
+
+    def __init__(self, csvfile, import_opt, **kwargs):
+        super(SeatCSVLoader, self).__init__(csvfile, **kwargs)
+        if import_opt not in self.fields_by_import:
+            raise ValueError('Import param is invalid')
+        self.import_opt = import_opt
+        self.model = {'drivers': Driver, 'teams': Team, 'seats': Seat}[import_opt]
+        self.fields = self.fields_by_import[import_opt]
+        self.ids = set()
+        self.natural_keys = set()
+        self.driver_ids = set()
+        self.team_ids = set()
+
+    def get_natural_key(self, obj):
+        if self.import_opt == 'drivers':
+            return obj.last_name, obj.first_name
+        elif self.import_opt == 'teams':
+            return obj.name
+        return obj.driver_id, obj.team_id
+
+    def get_maps(self):
+        self.ids = set(self.model.objects.values_list('pk', flat=True))
+        self.natural_keys = set(self.get_natural_key(obj) for obj in self.model.objects.all())
+        if self.import_opt == 'seats':
+            self.driver_ids = set(Driver.objects.values_list('pk', flat=True))
+            self.team_ids = set(Team.objects.values_list('pk', flat=True))
+
+    def get_object(self, row):
+        obj = super(SeatCSVLoader, self).get_object(row)
+        if self.import_opt == 'seats':
+            obj.driver_id = parse_csv_int(row.get('driver_id'))
+            obj.team_id = parse_csv_int(row.get('team_id'))
+            if obj.driver_id not in self.driver_ids or obj.team_id not in self.team_ids:
+                raise ValueError(u'Driver {driver_id} or team {team_id} does not exist'.format(**row))
+        elif self.import_opt == 'drivers':
+            obj.year_of_birth = parse_csv_int(row.get('year_of_birth'))
+        if obj.pk is not None:
+            obj.pk = parse_csv_int(obj.pk)
+        return obj
+
+    def validate_chunk(self, objects):
+        valid_objects = []
+        for line, obj in objects:
+            natural_key = self.get_natural_key(obj)
+            if obj.pk in self.ids or natural_key in self.natural_keys:
+                self.errors.append((line, u'{obj} already exists'.format(obj=natural_key)))
+                continue
+            if obj.pk is not None:
+                self.ids.add(obj.pk)
+            self.natural_keys.add(natural_key)
+            valid_objects.append((line, obj))
+        return valid_objects
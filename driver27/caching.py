@@ -0,0 +1,310 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+
+from six.moves import cPickle as pickle
+
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db.models import Model
+
+from .config import get_config
+from .standings import get_positions_count_list
+
+GLOBAL_CACHE_SCOPE = 'global'
+# seconds a lock of rank computation lasts (if its worker dies) and seconds others wait for its value
+RANK_LOCK_TIMEOUT = 60
+RANK_LOCK_WAIT = 10
+RANK_LOCK_POLL_INTERVAL = 0.05
+
+
+def get_cache_scope(scope, pk=None):
+    """ Name of a cache namespace, e.g. season_3, competition_1 or global """
+    if pk is None:
+        return scope
+    return u'{scope}_{pk}'.format(scope=scope, pk=pk)
+
+
+def get_cache_version_key(cache_scope):
+    return u'driver27_version_{cache_scope}'.format(cache_scope=cache_scope)
+
+
+def _new_cache_version():
+    """ A version never used before, even if the version key has been evicted from cache """
+    return int(time.time() * 1000)
+
+
+class CacheMemo(object):
+    """
+    Values read from cache in a request (or a unit of work, e.g. a command), so the same rank is read or
+    computed once. Keys include the version of their scope, so a write in the request does not read old values.
+    Values are shared by every caller of the request, so they must not be modified.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key in self.values:
+            self.hits += 1
+            return self.values[key]
+        self.misses += 1
+        return None
+
+    def set(self, key, value):
+        self.values[key] = value
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+
+_memo_local = threading.local()
+
+
+def get_cache_memo():
+    """ Memo of the current request or unit of work, None if there is not any """
+    return getattr(_memo_local, 'memo', None)
+
+
+@contextmanager
+def cache_memo():
+    """ Context of a request or unit of work. A nested context uses the memo of the outer one """
+    memo = get_cache_memo()
+    if memo is not None:
+        yield memo
+        return
+    memo = _memo_local.memo = CacheMemo()
+    try:
+        yield memo
+    finally:
+        _memo_local.memo = None
+
+
+class LRUCache(object):
+    """
+    In-process cache (L1) bounded by number of entries and approximate size (pickled bytes of values).
+    The least recently used entries are evicted first. Keys include the version of their scope, so entries
+    of old versions are never read again and they are evicted as the cache fills.
+    Values are shared by every request of the process, so they must not be modified.
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_size(value):
+        return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        if not self.max_entries:
+            return
+        size = self.get_size(value)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            previous_entry = self.entries.pop(key, None)
+            if previous_entry is not None:
+                self.bytes -= previous_entry[1]
+            self.entries[key] = (value, size)
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                evicted_key, (evicted_value, evicted_size) = self.entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        return {'entries': len(self.entries), 'bytes': self.bytes, 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions}
+
+
+ModelRef = namedtuple('ModelRef', ['model', 'pk'])
+
+
+def compact_value(value):
+    """
+    Value to store in shared cache: model instances (also in lists, tuples and dicts, as keys or values)
+    are replaced by a ModelRef, so only ids and scalars are pickled. Positions count of rank entries is
+    only kept as string (pos_str)
+    """
+    if isinstance(value, Model):
+        return ModelRef(value._meta.concrete_model, value.pk)
+    if isinstance(value, dict):
+        value = dict((compact_value(key), compact_value(item)) for key, item in value.items())
+        if 'pos_str' in value and value.get('pos_list') == get_positions_count_list(value['pos_str']):
+            # positions count of rank entry is rebuilt from its string
+            value['pos_list'] = None
+        return value
+    if type(value) in (list, tuple):
+        return type(value)(compact_value(item) for item in value)
+    return value
+
+
+def _collect_model_refs(value, model_refs):
+    if isinstance(value, ModelRef):
+        model_refs.setdefault(value.model, set()).add(value.pk)
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            _collect_model_refs(key, model_refs)
+            _collect_model_refs(item, model_refs)
+    elif type(value) in (list, tuple):
+        for item in value:
+            _collect_model_refs(item, model_refs)
+
+
+def _replace_model_refs(value, instances):
+    if isinstance(value, ModelRef):
+        return instances[value.model].get(value.pk)
+    if isinstance(value, dict):
+        value = dict((_replace_model_refs(key, instances), _replace_model_refs(item, instances))
+                     for key, item in value.items())
+        if 'pos_str' in value and 'pos_list' in value and value['pos_list'] is None:
+            value['pos_list'] = get_positions_count_list(value['pos_str'])
+        return value
+    if type(value) in (list, tuple):
+        return type(value)(_replace_model_refs(item, instances) for item in value)
+    return value
+
+
+def hydrate_value(value):
+    """ Value read from shared cache with its model instances, read with one in_bulk by model """
+    model_refs = {}
+    _collect_model_refs(value, model_refs)
+    instances = {}
+    for model, pks in model_refs.items():
+        # with their foreign keys, e.g. str of season needs its competition
+        instances[model] = model._default_manager.select_related().in_bulk(list(pks))
+    return _replace_model_refs(value, instances)
+
+
+class RankCache(object):
+    """
+    Django cache with two levels in front of it: the memo of the current request (if any) and an in-process
+    LRU cache. Versions of scopes are always read from Django cache (once by request), so a bump in any
+    process invalidates the entries of the others.
+    Django cache stores the compact value (see compact_value), it is hydrated when it is read.
+    """
+
+    def __init__(self):
+        self._l1_cache = None
+
+    @property
+    def l1_cache(self):
+        if self._l1_cache is None:
+            l1_config = get_config('L1_CACHE')
+            self._l1_cache = LRUCache(max_entries=l1_config.get('MAX_ENTRIES'), max_bytes=l1_config.get('MAX_BYTES'))
+        return self._l1_cache
+
+    def get(self, key):
+        memo = get_cache_memo()
+        if memo is not None:
+            value = memo.get(key)
+            if value is not None:
+                return value
+        value = self.l1_cache.get(key)
+        if value is None:
+            value = cache.get(key)
+            if value is not None:
+                value = hydrate_value(value)
+                self.l1_cache.set(key, value)
+        if memo is not None and value is not None:
+            memo.set(key, value)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        cache.set(key, compact_value(value), timeout=timeout)
+        self.l1_cache.set(key, value)
+        memo = get_cache_memo()
+        if memo is not None:
+            memo.set(key, value)
+
+    def get_or_set(self, key, compute, timeout=DEFAULT_TIMEOUT, wait=RANK_LOCK_WAIT):
+        """
+        Value of key, computed (calling compute) and saved if it is not in cache. Only one worker computes it
+        at the same time (single-flight): the lock is added to Django cache (cache.add is atomic), the others
+        wait for the value until wait seconds and then they compute it too.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        lock_key = u'driver27_lock_{key}'.format(key=key)
+        if not cache.add(lock_key, True, timeout=RANK_LOCK_TIMEOUT):
+            deadline = time.time() + wait
+            while time.time() < deadline:
+                time.sleep(RANK_LOCK_POLL_INTERVAL)
+                value = self.get(key)
+                if value is not None:
+                    return value
+            lock_key = None
+        try:
+            value = compute()
+            self.set(key, value, timeout=timeout)
+        finally:
+            if lock_key is not None:
+                cache.delete(lock_key)
+        return value
+
+    def stats(self):
+        """ Hits, misses and evictions of in-process cache """
+        return self.l1_cache.stats()
+
+
+rank_cache = RankCache()
+
+
+def get_cache_version(cache_scope):
+    """ Current version of the namespace. It is part of each cache key in the namespace """
+    version_key = get_cache_version_key(cache_scope)
+    memo = get_cache_memo()
+    version = memo.get(version_key) if memo is not None else None
+    if version is not None:
+        return version
+    version = cache.get(version_key)
+    if version is None:
+        version = _new_cache_version()
+        if not cache.add(version_key, version, timeout=None):
+            version = cache.get(version_key, version)
+    if memo is not None:
+        memo.set(version_key, version)
+    return version
+
+
+def bump_cache_version(cache_scope):
+    """ Invalidate all keys of the namespace, without removing other keys of cache """
+    version_key = get_cache_version_key(cache_scope)
+    memo = get_cache_memo()
+    if memo is not None:
+        memo.delete(version_key)
+    try:
+        cache.incr(version_key)
+    except ValueError:
+        cache.set(version_key, _new_cache_version(), timeout=None)
+
+
+def bump_cache_versions(cache_scopes):
+    for cache_scope in cache_scopes:
+        bump_cache_version(cache_scope)
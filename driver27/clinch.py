@@ -0,0 +1,124 @@
+from bisect import bisect_right
+
+from .standings import get_positions_count_str
+
+
+def get_best_points(points_list, rounds=None):
+    """ Sum of points, only the best results if season has rounds (as ContenderSeason.get_points) """
+    if rounds:
+        points_list = sorted(points_list, reverse=True)[:rounds]
+    return sum(points_list)
+
+
+def get_rank_key(points, positions, wins=0):
+    """ Key to order a driver as order_points (points, then countback of positions), adding some wins """
+    if wins:
+        positions = [positions[0] + wins] + list(positions[1:])
+    return points, get_positions_count_str(positions)
+
+
+class ClinchSolver(object):
+    """
+    Title fight of a season from a snapshot of its standings: the points of each result of every driver,
+    its positions count (countback) and the maximum points of each pending race (win, pole and fastest lap).
+
+    For each driver it computes the best and the worst final position it can reach, and the earliest pending
+    round after which it can be out of the title fight. A driver reaches its best position winning every
+    pending race while the others do not score. The worst position counts the rivals that can overtake it
+    one by one, so it is an upper bound when several rivals need the same races.
+    """
+
+    def __init__(self, points_by_driver, positions_by_driver, pending_points, rounds=None):
+        """
+        points_by_driver: dict of list of points of each result by driver_id
+        positions_by_driver: dict of positions count list by driver_id
+        pending_points: list of (round, maximum points) of pending races, ordered by round
+        rounds: only the best results are counted if season has rounds
+        """
+        self.points_by_driver = points_by_driver
+        self.positions_by_driver = positions_by_driver
+        self.pending_points = pending_points
+        self.rounds = rounds
+
+    @classmethod
+    def from_entries(cls, entries, season_id, pending_points, rounds=None):
+        """ Solver of the StandingsEntry of each driver of a season (see accumulate_rows) """
+        points_by_driver = dict((driver_id, entry.points_by_season.get(season_id, []))
+                                for driver_id, entry in entries.items())
+        positions_by_driver = dict((driver_id, entry.positions) for driver_id, entry in entries.items())
+        return cls(points_by_driver, positions_by_driver, pending_points, rounds=rounds)
+
+    def get_final_points(self, driver_id, pending_points):
+        return get_best_points(list(self.points_by_driver[driver_id]) + list(pending_points), self.rounds)
+
+    def get_current_key(self, driver_id):
+        return get_rank_key(self.get_final_points(driver_id, []), self.positions_by_driver[driver_id])
+
+    def get_max_key(self, driver_id, first_race=0):
+        """ Key of driver winning every pending race from first_race (index of pending_points) """
+        pending_points = [points for race_round, points in self.pending_points[first_race:]]
+        return get_rank_key(self.get_final_points(driver_id, pending_points), self.positions_by_driver[driver_id],
+                            wins=len(pending_points))
+
+    def get_elimination_round(self, driver_id, leader_keys_by_race):
+        """
+        First pending round after which driver can be out of the title fight: a rival winning every race
+        until then can not be reached by the driver winning the rest. None if it can not be eliminated
+        (or it is already out, see run).
+        """
+        for index, (race_round, points) in enumerate(self.pending_points):
+            leader_key = leader_keys_by_race[index].get(driver_id)
+            if leader_key is not None and leader_key > self.get_max_key(driver_id, first_race=index + 1):
+                return race_round
+        return None
+
+    def get_leader_keys_by_race(self, current_keys):
+        """
+        For each pending race, the best key of any other driver winning every race until it (included),
+        by driver_id. Only the two best keys are needed to know the best key of the others.
+        """
+        leader_keys_by_race = []
+        for index in range(len(self.pending_points)):
+            pending_points = [points for race_round, points in self.pending_points[:index + 1]]
+            keys = sorted(((get_rank_key(self.get_final_points(driver_id, pending_points),
+                                         self.positions_by_driver[driver_id], wins=index + 1), driver_id)
+                           for driver_id in current_keys), reverse=True)[:2]
+            leader_keys = {}
+            for driver_id in current_keys:
+                rivals = [key for key, rival_id in keys if rival_id != driver_id]
+                leader_keys[driver_id] = rivals[0] if rivals else None
+            leader_keys_by_race.append(leader_keys)
+        return leader_keys_by_race
+
+    def run(self):
+        """
+        Dict by driver_id with points, max_points, best_position, worst_position, eliminated and
+        elimination_round. eliminated is True if driver is already out of the title fight (it can not be
+        first). elimination_round is None both for drivers already out and for drivers that can not be
+        eliminated in any pending round, so eliminated tells them apart.
+        """
+        driver_ids = list(self.points_by_driver)
+        current_keys = dict((driver_id, self.get_current_key(driver_id)) for driver_id in driver_ids)
+        max_keys = dict((driver_id, self.get_max_key(driver_id)) for driver_id in driver_ids)
+        sorted_current_keys = sorted(current_keys.values())
+        sorted_max_keys = sorted(max_keys.values())
+        leader_keys_by_race = self.get_leader_keys_by_race(current_keys)
+        title = {}
+        for driver_id in driver_ids:
+            # rivals ahead of the max of driver, without scoring more
+            ahead_of_best = len(sorted_current_keys) - bisect_right(sorted_current_keys, max_keys[driver_id])
+            # rivals that can pass the current points of driver, itself excluded
+            ahead_of_worst = len(sorted_max_keys) - bisect_right(sorted_max_keys, current_keys[driver_id])
+            if max_keys[driver_id] > current_keys[driver_id]:
+                ahead_of_worst -= 1
+            best_position = ahead_of_best + 1
+            title[driver_id] = {
+                'points': current_keys[driver_id][0],
+                'max_points': max_keys[driver_id][0],
+                'best_position': best_position,
+                'worst_position': ahead_of_worst + 1,
+                'eliminated': best_position > 1,
+                'elimination_round': self.get_elimination_round(driver_id, leader_keys_by_race)
+                if best_position == 1 else None
+            }
+        return title
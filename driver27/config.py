@@ -56,7 +56,11 @@ def get_init_config():
                              'label': 'Moto GP (1988-91)'},
             'MotoGP-77-87': {'type': 'full', 'finish': [15, 12, 10, 8, 6, 6, 5, 3, 2, 1], 'fastest_lap': 0,
                              'label': 'Moto GP (1977-87)'},
-        }
+        },
+        # in-process cache of ranks, in front of Django cache. MAX_ENTRIES 0 disables it
+        'L1_CACHE': {'MAX_ENTRIES': 256, 'MAX_BYTES': 32 * 1024 * 1024},
+        # ranks rebuilt by a background thread after a change of results, DELAY seconds later (opt-in)
+        'RECOMPUTE': {'ENABLED': False, 'DELAY': 1}
     }
 
     return init_config
@@ -0,0 +1,283 @@
+import csv
+import os
+from collections import defaultdict
+
+from django.db import transaction
+from django_countries import countries
+
+from .bulk import open_csv
+from .models import (Circuit, Competition, CompetitionTeam, Driver, GrandPrix, Race, Result, Seat, SeatPeriod,
+                     Season, Team, get_tuple_from_result)
+from .points_calculator import PointsCalculator
+from .standings import refresh_season_standings
+
+ERGAST_NULL = '\\N'
+# columns of each file of Ergast database (files with or without header)
+ERGAST_COLUMNS = {
+    'drivers': ('driverId', 'driverRef', 'number', 'code', 'forename', 'surname', 'dob', 'nationality', 'url'),
+    'constructors': ('constructorId', 'constructorRef', 'name', 'nationality', 'url'),
+    'circuits': ('circuitId', 'circuitRef', 'name', 'location', 'country', 'lat', 'lng', 'alt', 'url'),
+    'races': ('raceId', 'year', 'round', 'circuitId', 'name', 'date', 'time', 'url'),
+    'results': ('resultId', 'raceId', 'driverId', 'constructorId', 'number', 'grid', 'position', 'positionText',
+                'positionOrder', 'points', 'laps', 'time', 'milliseconds', 'fastestLap', 'rank', 'fastestLapTime',
+                'fastestLapSpeed', 'statusId'),
+    'qualifying': ('qualifyId', 'raceId', 'driverId', 'constructorId', 'number', 'position', 'q1', 'q2', 'q3'),
+}
+# names of countries in Ergast circuits which are not a country name
+ERGAST_COUNTRIES = {'UK': 'GB', 'USA': 'US', 'UAE': 'AE', 'Korea': 'KR'}
+# punctuation of F1 seasons from year (earlier seasons with the oldest punctuation of config)
+ERGAST_PUNCTUATION = ((2010, 'F1-25'), (2003, 'F1-10+8'), (1991, 'F1-10+6'), (0, 'F1-62-90'))
+
+# fields of the natural key of each model, to find saved objects
+NATURAL_KEYS = {
+    Driver: ('last_name', 'first_name'),
+    Team: ('name',),
+    Circuit: ('name',),
+    GrandPrix: ('name',),
+    Season: ('competition_id', 'year'),
+    Seat: ('team_id', 'driver_id'),
+    SeatPeriod: ('seat_id', 'from_year', 'until_year'),
+    CompetitionTeam: ('team_id', 'competition_id'),
+    Race: ('season_id', 'round'),
+    Result: ('race_id', 'seat_id'),
+}
+
+
+def parse_ergast_value(value):
+    return value if value not in (None, '', ERGAST_NULL) else None
+
+
+def parse_ergast_int(value):
+    value = parse_ergast_value(value)
+    return int(value) if value is not None else None
+
+
+def get_ergast_country(name):
+    return ERGAST_COUNTRIES.get(name) or countries.by_name(name or '') or ''
+
+
+def get_ergast_punctuation(year):
+    for from_year, punctuation in ERGAST_PUNCTUATION:
+        if year >= from_year:
+            return punctuation
+
+
+def get_year_periods(years):
+    """ (from_year, until_year) of each run of consecutive years """
+    periods = []
+    for year in sorted(set(years)):
+        if periods and periods[-1][1] == year - 1:
+            periods[-1] = (periods[-1][0], year)
+        else:
+            periods.append((year, year))
+    return periods
+
+
+class ErgastImporter(object):
+    """
+    Import of Ergast database CSV files (drivers, constructors, circuits, races, results and qualifying) in a
+    competition. Files are read once into dicts by Ergast id, and each model is created with bulk_create in
+    foreign key order (without save and signals), skipping the objects whose natural key is already saved,
+    so an import can be run again. Points of new results are computed in memory with the punctuation of
+    each season, and standings and cache of each season are refreshed once at the end.
+    """
+
+    def __init__(self, path, competition_name='F1', competition_full_name='Formula 1', progress=None,
+                 batch_size=None):
+        self.path = path
+        self.competition_name = competition_name
+        self.competition_full_name = competition_full_name
+        self.progress = progress
+        self.batch_size = batch_size
+        self.created = {}
+        self.skipped_results = 0
+
+    def read_csv(self, name, required=True):
+        """ Rows (dicts) of an Ergast file """
+        path = os.path.join(self.path, '{name}.csv'.format(name=name))
+        if not required and not os.path.exists(path):
+            return []
+        columns = ERGAST_COLUMNS[name]
+        with open_csv(path) as csvfile:
+            rows = list(csv.DictReader(csvfile, fieldnames=columns))
+        if rows and rows[0][columns[0]] == columns[0]:
+            rows = rows[1:]
+        return rows
+
+    @staticmethod
+    def get_saved_keys(model, **filters):
+        """ {natural key: pk} of saved objects of model """
+        fields = NATURAL_KEYS[model]
+        return dict((values[:-1], values[-1])
+                    for values in model.objects.filter(**filters).values_list(*(fields + ('pk',))).iterator())
+
+    def bulk_create_missing(self, model, objects, **filters):
+        """ Create the objects whose natural key is not saved. Return {natural key: pk} of every object """
+        saved_keys = self.get_saved_keys(model, **filters)
+        fields = NATURAL_KEYS[model]
+        new_objects = {}
+        for obj in objects:
+            key = tuple(getattr(obj, field) for field in fields)
+            if key not in saved_keys:
+                new_objects.setdefault(key, obj)
+        model.objects.bulk_create(list(new_objects.values()), batch_size=self.batch_size)
+        self.created[model.__name__] = len(new_objects)
+        if self.progress is not None:
+            self.progress(model.__name__, len(new_objects))
+        if not new_objects:
+            return saved_keys
+        # pks of created objects are not returned by every database
+        return self.get_saved_keys(model, **filters)
+
+    def load_files(self):
+        self.drivers = dict((row['driverId'], row) for row in self.read_csv('drivers'))
+        self.constructors = dict((row['constructorId'], row) for row in self.read_csv('constructors'))
+        self.circuits = dict((row['circuitId'], row) for row in self.read_csv('circuits'))
+        self.races = dict((row['raceId'], row) for row in self.read_csv('races'))
+        self.qualifying = dict(((row['raceId'], row['driverId']), parse_ergast_int(row['position']))
+                               for row in self.read_csv('qualifying', required=False))
+        self.results = [row for row in self.read_csv('results') if row['raceId'] in self.races]
+        self.results.sort(key=lambda row: (int(row['raceId']), parse_ergast_int(row['positionOrder']) or 0))
+
+    def get_driver_key(self, driver_id):
+        row = self.drivers[driver_id]
+        return row['surname'][:50], row['forename'][:25]
+
+    def get_team_key(self, constructor_id):
+        return self.constructors[constructor_id]['name'][:75],
+
+    def get_circuit_key(self, circuit_id):
+        return self.circuits[circuit_id]['name'][:30],
+
+    def get_grand_prix_key(self, race_id):
+        return self.races[race_id]['name'][:30],
+
+    def import_drivers_and_teams(self):
+        drivers = []
+        for driver_id, row in self.drivers.items():
+            dob = parse_ergast_value(row['dob'])
+            last_name, first_name = self.get_driver_key(driver_id)
+            drivers.append(Driver(last_name=last_name, first_name=first_name,
+                                  year_of_birth=int(dob[:4]) if dob else None))
+        self.driver_keys = self.bulk_create_missing(Driver, drivers)
+        teams = [Team(name=self.get_team_key(constructor_id)[0], full_name=self.get_team_key(constructor_id)[0])
+                 for constructor_id in self.constructors]
+        self.team_keys = self.bulk_create_missing(Team, teams)
+
+    def import_circuits_and_grands_prix(self):
+        """ Circuits with races (opened in its first year), and a grand prix by name of race """
+        races = sorted(self.races.values(), key=lambda row: (int(row['year']), int(row['round'])))
+        circuits = {}
+        for race in races:
+            circuit = self.circuits[race['circuitId']]
+            circuits.setdefault(race['circuitId'], Circuit(
+                name=self.get_circuit_key(race['circuitId'])[0], city=parse_ergast_value(circuit['location']),
+                country=get_ergast_country(circuit['country']), opened_in=int(race['year'])))
+        self.circuit_keys = self.bulk_create_missing(Circuit, circuits.values())
+
+        grands_prix = {}
+        for race in races:
+            grands_prix.setdefault(self.get_grand_prix_key(race['raceId']), GrandPrix(
+                name=self.get_grand_prix_key(race['raceId'])[0],
+                country=get_ergast_country(self.circuits[race['circuitId']]['country']) or None,
+                first_held=int(race['year']),
+                default_circuit_id=self.circuit_keys[self.get_circuit_key(race['circuitId'])]))
+        self.grand_prix_keys = self.bulk_create_missing(GrandPrix, grands_prix.values())
+        competition_grands_prix = set(self.competition.grands_prix.values_list('pk', flat=True))
+        GrandPrix.competitions.through.objects.bulk_create([
+            GrandPrix.competitions.through(grandprix_id=grand_prix_id, competition_id=self.competition.pk)
+            for grand_prix_id in set(self.grand_prix_keys.values()) - competition_grands_prix])
+
+    def import_seasons(self):
+        seasons = [Season(competition_id=self.competition.pk, year=year, punctuation=get_ergast_punctuation(year))
+                   for year in set(int(race['year']) for race in self.races.values())]
+        self.season_keys = self.bulk_create_missing(Season, seasons, competition=self.competition)
+
+    def import_seats(self):
+        """ Seats of results, a period by each run of consecutive years, and teams in competition """
+        seat_years = defaultdict(set)
+        team_years = defaultdict(set)
+        for row in self.results:
+            year = int(self.races[row['raceId']]['year'])
+            team_id = self.team_keys[self.get_team_key(row['constructorId'])]
+            driver_id = self.driver_keys[self.get_driver_key(row['driverId'])]
+            seat_years[(team_id, driver_id)].add(year)
+            team_years[team_id].add(year)
+        seats = [Seat(team_id=team_id, driver_id=driver_id) for team_id, driver_id in seat_years]
+        self.seat_keys = self.bulk_create_missing(Seat, seats)
+        periods = [SeatPeriod(seat_id=self.seat_keys[seat_key], from_year=from_year, until_year=until_year)
+                   for seat_key, years in seat_years.items() for from_year, until_year in get_year_periods(years)]
+        self.bulk_create_missing(SeatPeriod, periods)
+        competition_teams = [CompetitionTeam(team_id=team_id, competition_id=self.competition.pk,
+                                             from_year=min(years), until_year=max(years))
+                             for team_id, years in team_years.items()]
+        self.bulk_create_missing(CompetitionTeam, competition_teams, competition=self.competition)
+
+    def get_seat_id(self, row):
+        team_id = self.team_keys[self.get_team_key(row['constructorId'])]
+        driver_id = self.driver_keys[self.get_driver_key(row['driverId'])]
+        return self.seat_keys[(team_id, driver_id)]
+
+    def import_races(self):
+        """ Races of competition, with the seat of fastest lap (rank 1 of results) """
+        fastest_cars = dict((row['raceId'], self.get_seat_id(row)) for row in self.results
+                            if parse_ergast_int(row['rank']) == 1)
+        races = []
+        for race_id, row in self.races.items():
+            races.append(Race(season_id=self.season_keys[(self.competition.pk, int(row['year']))],
+                              round=int(row['round']), date=parse_ergast_value(row['date']),
+                              grand_prix_id=self.grand_prix_keys[self.get_grand_prix_key(race_id)],
+                              circuit_id=self.circuit_keys[self.get_circuit_key(row['circuitId'])],
+                              fastest_car_id=fastest_cars.get(race_id)))
+        self.race_keys = self.bulk_create_missing(Race, races, season__competition=self.competition)
+
+    def import_results(self):
+        """
+        Results not saved yet, with points. A driver with two cars in a race (shared drives) only keeps the
+        result of the best position. Return the seasons of new results
+        """
+        races = Race.objects.filter(season__competition=self.competition) \
+            .select_related('season__competition', 'grand_prix', 'circuit').in_bulk()
+        saved_keys = self.get_saved_keys(Result, race__season__competition=self.competition)
+        calculators = {}
+        race_drivers = set()
+        results = []
+        for row in self.results:
+            race_row = self.races[row['raceId']]
+            season_id = self.season_keys[(self.competition.pk, int(race_row['year']))]
+            race = races[self.race_keys[(season_id, int(race_row['round']))]]
+            if (race.pk, row['driverId']) in race_drivers:
+                self.skipped_results += 1
+                continue
+            race_drivers.add((race.pk, row['driverId']))
+            qualifying = self.qualifying.get((row['raceId'], row['driverId'])) or parse_ergast_int(row['grid'])
+            seat_id = self.get_seat_id(row)
+            if (race.pk, seat_id) in saved_keys:
+                continue
+            result = Result(race=race, seat_id=seat_id, qualifying=qualifying or None,
+                            finish=parse_ergast_int(row['position']), retired=row['positionText'] == 'R')
+            if season_id not in calculators:
+                calculators[season_id] = PointsCalculator(race.season.get_punctuation_config())
+            result.points = calculators[season_id].calculator(get_tuple_from_result(result))
+            results.append(result)
+        self.bulk_create_missing(Result, results, race__season__competition=self.competition)
+        return dict((result.race.season_id, result.race.season) for result in results)
+
+    def run(self):
+        """ Import every file. Return the number of created objects by model """
+        self.load_files()
+        with transaction.atomic():
+            self.competition = Competition.objects.filter(name=self.competition_name).first()
+            if self.competition is None:
+                self.competition = Competition.objects.create(name=self.competition_name,
+                                                              full_name=self.competition_full_name)
+            self.import_drivers_and_teams()
+            self.import_circuits_and_grands_prix()
+            self.import_seasons()
+            self.import_seats()
+            self.import_races()
+            seasons = self.import_results()
+            for season in seasons.values():
+                refresh_season_standings(season)
+                season.invalidate_cache()
+        return self.created
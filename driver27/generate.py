@@ -0,0 +1,236 @@
+import datetime
+from random import Random
+
+from django.db import transaction
+
+from .ergast import get_year_periods
+from .models import (Circuit, Competition, CompetitionTeam, Driver, GrandPrix, Race, Result, Seat, SeatPeriod,
+                     Season, Team, get_tuple_from_result)
+from .points_calculator import PointsCalculator
+from .punctuation import get_punctuation_config
+from .standings import refresh_season_standings
+
+GENERATE_COUNTRIES = ('AU', 'BR', 'DE', 'ES', 'FR', 'GB', 'IT', 'JP', 'MC', 'US')
+# probabilities of the generated events
+RETIREMENT_RATE = 0.12
+WILDCARD_RATE = 0.1
+ALTER_PUNCTUATION_RATE = 0.05
+NEW_DRIVER_RATE = 0.2
+DRIVER_REPLACED_RATE = 0.3
+DRIVERS_SWAPPED_RATE = 0.15
+
+
+class DatasetGenerator(object):
+    """
+    Synthetic dataset of competitions x seasons x races x seats, always the same with the same seed.
+    Each team has two seats, and each competition has a pool of reserve drivers (shared with the next
+    competition) who take a free seat between seasons, replace a driver in the middle of a season or race
+    as wildcards. Drivers of two teams can swap seats in the middle of a season too, so seats have periods of
+    years. Results are ordered by the strength of driver and team with noise, with retirements, fastest
+    laps and races of double or half punctuation. Every model is created with bulk_create, and points of
+    results are computed in memory, as ErgastImporter.
+    """
+
+    def __init__(self, competitions=5, seasons=40, races=22, seats=24, seed=0, first_year=2000, prefix='Gen',
+                 punctuation='F1-25', progress=None, batch_size=None):
+        if seats < 2:
+            raise ValueError('A competition needs two seats at least')
+        self.competitions = competitions
+        self.seasons = seasons
+        self.races = races
+        self.seats = seats
+        self.first_year = first_year
+        self.prefix = prefix
+        self.punctuation = punctuation
+        self.progress = progress
+        self.batch_size = batch_size
+        self.random = Random(seed)
+        self.teams_by_competition = (seats + 1) // 2
+        self.reserves = max(2, seats // 4)
+
+    def write_progress(self, message):
+        if self.progress is not None:
+            self.progress(message)
+
+    def get_competition_name(self, index):
+        return u'{prefix} {index}'.format(prefix=self.prefix, index=index + 1)
+
+    def get_driver_pool(self, competition_index):
+        return list(range(competition_index * self.seats, (competition_index + 1) * self.seats + self.reserves))
+
+    def plan_competition(self, competition_index, driver_strength, seat_years):
+        """
+        Entrants (team, driver, wildcard) of each race of each season of a competition, as indexes. Years
+        of each (team, driver) seat are added to seat_years
+        """
+        rng = self.random
+        pool = self.get_driver_pool(competition_index)
+        teams = [competition_index * self.teams_by_competition + index for index in range(self.teams_by_competition)]
+        slot_teams = [teams[slot // 2] for slot in range(self.seats)]
+        lineup = pool[:self.seats]
+        team_strength = dict((team, rng.random()) for team in teams)
+        seasons = []
+        for season_index in range(self.seasons):
+            year = self.first_year + season_index
+            team_strength = dict((team, 0.7 * strength + 0.3 * rng.random()) for team, strength in
+                                 sorted(team_strength.items()))
+            for slot in range(self.seats):
+                if rng.random() < NEW_DRIVER_RATE:
+                    free_drivers = [driver for driver in pool if driver not in lineup]
+                    lineup[slot] = rng.choice(free_drivers)
+            # changes in the middle of season: (round, slot, new driver) and swaps of seats between teams
+            changes = []
+            if rng.random() < DRIVER_REPLACED_RATE and self.races > 1:
+                free_drivers = [driver for driver in pool if driver not in lineup]
+                changes.append((rng.randint(2, self.races), rng.randrange(self.seats), rng.choice(free_drivers)))
+            if rng.random() < DRIVERS_SWAPPED_RATE and self.races > 1 and self.teams_by_competition > 1:
+                # first seats of two teams
+                slot_a, slot_b = rng.sample(range(0, self.seats, 2), 2)
+                changes.append((rng.randint(2, self.races), slot_a, 'swap', slot_b))
+            races = []
+            race_lineup = list(lineup)
+            for round_index in range(1, self.races + 1):
+                for change in changes:
+                    if change[0] != round_index:
+                        continue
+                    if change[2] == 'swap':
+                        slot_a, slot_b = change[1], change[3]
+                        race_lineup[slot_a], race_lineup[slot_b] = race_lineup[slot_b], race_lineup[slot_a]
+                    else:
+                        race_lineup[change[1]] = change[2]
+                entrants = [(slot_teams[slot], driver, False) for slot, driver in enumerate(race_lineup)]
+                if rng.random() < WILDCARD_RATE:
+                    free_drivers = [driver for driver in pool if driver not in race_lineup]
+                    if free_drivers:
+                        entrants.append((rng.choice(teams), rng.choice(free_drivers), True))
+                races.append(self.plan_race(entrants, driver_strength, team_strength))
+                for team, driver, wildcard in entrants:
+                    seat_years.setdefault((team, driver), set()).add(year)
+            lineup = race_lineup
+            seasons.append((year, races))
+        return seasons
+
+    def plan_race(self, entrants, driver_strength, team_strength):
+        """ (alter_punctuation, fastest entrant, [(entrant, qualifying, finish, retired)]) of a race """
+        rng = self.random
+
+        def get_score(entrant):
+            team, driver, wildcard = entrant
+            return driver_strength[driver] + team_strength[team] + rng.gauss(0, 0.3)
+
+        qualifying = dict((entrant, position) for position, entrant in
+                          enumerate(sorted(entrants, key=get_score, reverse=True), start=1))
+        retired = set(entrant for entrant in entrants if rng.random() < RETIREMENT_RATE)
+        finishers = sorted([entrant for entrant in entrants if entrant not in retired], key=get_score, reverse=True)
+        finish = dict((entrant, position) for position, entrant in enumerate(finishers, start=1))
+        fastest = rng.choice(finishers[:5]) if finishers else None
+        alter_punctuation = rng.choice(('double', 'half')) if rng.random() < ALTER_PUNCTUATION_RATE else None
+        results = [(entrant, qualifying[entrant], finish.get(entrant), entrant in retired) for entrant in entrants]
+        return alter_punctuation, fastest, results
+
+    def create_base(self, seat_years):
+        """ Drivers and teams of every competition, and seats with their periods """
+        driver_count = self.competitions * self.seats + self.reserves
+        team_count = self.competitions * self.teams_by_competition
+        Driver.objects.bulk_create([Driver(last_name=u'Driver {index:05d}'.format(index=index),
+                                           first_name=self.prefix, year_of_birth=self.first_year - 20 - index % 15)
+                                    for index in range(driver_count)], batch_size=self.batch_size)
+        Team.objects.bulk_create([Team(name=u'{prefix} Team {index:03d}'.format(prefix=self.prefix, index=index),
+                                       full_name=u'{prefix} Racing Team {index:03d}'.format(prefix=self.prefix,
+                                                                                           index=index),
+                                       country=GENERATE_COUNTRIES[index % len(GENERATE_COUNTRIES)])
+                                  for index in range(team_count)], batch_size=self.batch_size)
+        drivers = dict((int(last_name.split()[-1]), pk) for last_name, pk in
+                       Driver.objects.filter(first_name=self.prefix, last_name__startswith='Driver ')
+                       .values_list('last_name', 'pk'))
+        teams = dict((int(name.split()[-1]), pk) for name, pk in
+                     Team.objects.filter(name__startswith=u'{prefix} Team '.format(prefix=self.prefix))
+                     .values_list('name', 'pk'))
+
+        Seat.objects.bulk_create([Seat(team_id=teams[team], driver_id=drivers[driver])
+                                  for team, driver in sorted(seat_years)], batch_size=self.batch_size)
+        seats = dict(((team_id, driver_id), pk) for team_id, driver_id, pk in
+                     Seat.objects.filter(driver__first_name=self.prefix).values_list('team_id', 'driver_id', 'pk'))
+        self.seat_ids = dict(((team, driver), seats[(teams[team], drivers[driver])]) for team, driver in seat_years)
+        SeatPeriod.objects.bulk_create([SeatPeriod(seat_id=self.seat_ids[seat], from_year=from_year,
+                                                   until_year=until_year)
+                                        for seat, years in sorted(seat_years.items())
+                                        for from_year, until_year in get_year_periods(years)],
+                                       batch_size=self.batch_size)
+        self.teams = teams
+
+    def create_competition(self, competition_index):
+        """ Competition (with save, for its slug), its teams, circuits and grands prix """
+        competition = Competition.objects.create(name=self.get_competition_name(competition_index),
+                                                 full_name=u'{prefix} Competition {index}'.format(
+                                                     prefix=self.prefix, index=competition_index + 1))
+        first_team = competition_index * self.teams_by_competition
+        CompetitionTeam.objects.bulk_create([
+            CompetitionTeam(team_id=self.teams[team], competition=competition, from_year=self.first_year,
+                            until_year=self.first_year + self.seasons - 1)
+            for team in range(first_team, first_team + self.teams_by_competition)])
+        circuits = []
+        for round_index in range(1, self.races + 1):
+            name = u'{prefix} {competition}-{round}'.format(prefix=self.prefix, competition=competition_index + 1,
+                                                           round=round_index)
+            circuits.append(Circuit(name=name, country=GENERATE_COUNTRIES[round_index % len(GENERATE_COUNTRIES)],
+                                    opened_in=self.first_year))
+        Circuit.objects.bulk_create(circuits)
+        circuits = list(Circuit.objects.filter(name__in=[circuit.name for circuit in circuits]).order_by('pk'))
+        GrandPrix.objects.bulk_create([GrandPrix(name=circuit.name, country=circuit.country,
+                                                 first_held=self.first_year, default_circuit=circuit)
+                                       for circuit in circuits])
+        grands_prix = list(GrandPrix.objects.filter(default_circuit__in=circuits).select_related('default_circuit')
+                           .order_by('default_circuit_id'))
+        GrandPrix.competitions.through.objects.bulk_create([
+            GrandPrix.competitions.through(grandprix_id=grand_prix.pk, competition_id=competition.pk)
+            for grand_prix in grands_prix])
+        return competition, grands_prix
+
+    def create_season(self, competition, grands_prix, year, planned_races):
+        """ Season, its races and results, with points computed in memory """
+        season = Season.objects.create(competition=competition, year=year, punctuation=self.punctuation)
+        Race.objects.bulk_create([
+            Race(season=season, round=round_index, grand_prix=grand_prix, circuit=grand_prix.default_circuit,
+                 date=datetime.date(year, 3, 1) + datetime.timedelta(days=14 * (round_index - 1)),
+                 alter_punctuation=alter_punctuation,
+                 fastest_car_id=self.seat_ids[fastest[:2]] if fastest else None)
+            for round_index, (grand_prix, (alter_punctuation, fastest, results))
+            in enumerate(zip(grands_prix, planned_races), start=1)])
+        races = list(Race.objects.filter(season=season).select_related('season__competition', 'grand_prix',
+                                                                        'circuit').order_by('round'))
+        calculator = PointsCalculator(get_punctuation_config(self.punctuation))
+        results = []
+        for race, (alter_punctuation, fastest, planned_results) in zip(races, planned_races):
+            for entrant, qualifying, finish, retired in planned_results:
+                result = Result(race=race, seat_id=self.seat_ids[entrant[:2]], qualifying=qualifying, finish=finish,
+                                retired=retired, wildcard=entrant[2])
+                result.points = calculator.calculator(get_tuple_from_result(result))
+                results.append(result)
+        Result.objects.bulk_create(results, batch_size=self.batch_size)
+        return season, len(results)
+
+    def run(self):
+        """ Generate the dataset. Return the number of results """
+        names = [self.get_competition_name(index) for index in range(self.competitions)]
+        if Competition.objects.filter(name__in=names).exists():
+            raise ValueError(u'A competition named {names} already exists'.format(names=', '.join(names)))
+        driver_strength = [self.random.random() for index in range(self.competitions * self.seats + self.reserves)]
+        seat_years = {}
+        plans = [self.plan_competition(index, driver_strength, seat_years) for index in range(self.competitions)]
+        result_count = 0
+        seasons = []
+        with transaction.atomic():
+            self.create_base(seat_years)
+            for competition_index, planned_seasons in enumerate(plans):
+                competition, grands_prix = self.create_competition(competition_index)
+                for year, planned_races in planned_seasons:
+                    season, season_results = self.create_season(competition, grands_prix, year, planned_races)
+                    seasons.append(season)
+                    result_count += season_results
+                self.write_progress(u'{competition}: {results} results'.format(competition=competition,
+                                                                               results=result_count))
+            for season in seasons:
+                refresh_season_standings(season)
+                season.invalidate_cache()
+        return result_count
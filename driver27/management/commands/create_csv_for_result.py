@@ -1,4 +1,5 @@
 from django.core.management.base import BaseCommand, CommandError
+from driver27.bulk import open_csv
 from driver27.models import Season
 import csv
 
@@ -14,7 +15,7 @@ class Command(BaseCommand):
         season_seats = season.seats.all()
         season_pending_races = season.pending_races.order_by('round')
 
-        with open(options['csv'], 'wb') as csvfile:
+        with open_csv(options['csv'], 'w') as csvfile:
             fieldnames = ['driver', 'team', 'seat_id', 'race_id', 'race_round', 'qualifying', 'finish', 'retired',
                           'fastest_lap', 'wildcard']
             writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from driver27.benchmark import (BENCHMARK_REPEAT, BENCHMARK_SCOPES, BENCHMARK_THRESHOLD, compare_benchmarks,
+                                read_benchmark, run_benchmark, write_benchmark)
+from driver27.models import Season
+
+
+class Command(BaseCommand):
+    help = 'Time and count the queries of ranks, ajax and profile views, without and with cached ranks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scopes', nargs='+', choices=BENCHMARK_SCOPES, default=list(BENCHMARK_SCOPES))
+        parser.add_argument('--season', type=int, default=None,
+                            help='Season (and its competition) to measure, by default the one with more results')
+        parser.add_argument('--cases', nargs='+', default=None, help='Names of cases, e.g. points_rank stats_view')
+        parser.add_argument('--repeat', type=int, default=BENCHMARK_REPEAT)
+        parser.add_argument('--output', default=None, help='JSON file to write the results')
+        parser.add_argument('--compare', default=None, help='JSON file of a baseline to find regressions')
+        parser.add_argument('--threshold', type=float, default=BENCHMARK_THRESHOLD,
+                            help='Times slower than baseline to be a regression')
+
+    def write_measure(self, case_name, measure):
+        self.stdout.write(u'{case_name:<50} {seconds:>9.4f}s {queries:>6} queries | cached {cached_seconds:>9.4f}s '
+                          u'{cached_queries:>4} queries'.format(case_name=case_name, **measure))
+
+    def handle(self, *args, **options):
+        season = None
+        if options['season']:
+            try:
+                season = Season.objects.select_related('competition').get(pk=options['season'])
+            except Season.DoesNotExist:
+                raise CommandError('Season "%s" does not exist' % options['season'])
+        benchmark = run_benchmark(scopes=options['scopes'], repeat=options['repeat'], season=season,
+                                  names=options['cases'], progress=self.write_measure)
+        if options['output']:
+            write_benchmark(benchmark, options['output'])
+        if options['compare']:
+            regressions = compare_benchmarks(read_benchmark(options['compare']), benchmark,
+                                             threshold=options['threshold'])
+            for case_name, field, baseline_value, value in regressions:
+                self.stderr.write(u'{case_name}: {field} {baseline_value} => {value}'.format(
+                    case_name=case_name, field=field, baseline_value=baseline_value, value=value))
+            if regressions:
+                raise CommandError('{count} regressions against {path}'.format(count=len(regressions),
+                                                                                path=options['compare']))
+            self.stdout.write('No regressions against {path}'.format(path=options['compare']))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from driver27.generate import DatasetGenerator
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic dataset (competitions x seasons x races x seats) to benchmark the ranks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--competitions', type=int, default=5)
+        parser.add_argument('--seasons', type=int, default=40)
+        parser.add_argument('--races', type=int, default=22)
+        parser.add_argument('--seats', type=int, default=24)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--first-year', type=int, default=2000, dest='first_year')
+        parser.add_argument('--prefix', default='Gen', help='Prefix of names of competitions, drivers, teams...')
+        parser.add_argument('--punctuation', default='F1-25')
+        parser.add_argument('--batch-size', type=int, default=None, dest='batch_size',
+                            help='Rows by insert (by default, the maximum of the database)')
+
+    def handle(self, *args, **options):
+        try:
+            generator = DatasetGenerator(competitions=options['competitions'], seasons=options['seasons'],
+                                         races=options['races'], seats=options['seats'], seed=options['seed'],
+                                         first_year=options['first_year'], prefix=options['prefix'],
+                                         punctuation=options['punctuation'], progress=self.stdout.write,
+                                         batch_size=options['batch_size'])
+            results = generator.run()
+        except ValueError as e:
+            raise CommandError(e)
+        self.stdout.write('{results} results generated'.format(results=results))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from driver27.ergast import ErgastImporter
+
+
+class Command(BaseCommand):
+    help = 'Import the CSV files of Ergast database (drivers, constructors, circuits, races, results, qualifying)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Directory of the CSV files')
+        parser.add_argument('--competition', default='F1', help='Name of the competition (created if needed)')
+        parser.add_argument('--competition-full-name', default='Formula 1', dest='competition_full_name')
+        parser.add_argument('--batch-size', type=int, default=None, dest='batch_size',
+                            help='Rows by insert (by default, the maximum of the database)')
+
+    def write_progress(self, model_name, created):
+        self.stdout.write('{model_name}: {created} created'.format(model_name=model_name, created=created))
+
+    def handle(self, *args, **options):
+        importer = ErgastImporter(options['path'], competition_name=options['competition'],
+                                  competition_full_name=options['competition_full_name'],
+                                  progress=self.write_progress, batch_size=options['batch_size'])
+        try:
+            importer.run()
+        except (IOError, KeyError) as e:
+            raise CommandError(u'Ergast files can not be imported: {error}'.format(error=e))
+        if importer.skipped_results:
+            self.stdout.write('{skipped} results of drivers with two cars in a race were skipped'.format(
+                skipped=importer.skipped_results))
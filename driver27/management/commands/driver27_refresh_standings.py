@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from driver27.models import Season
+from driver27.standings import get_seasons_without_standings, refresh_season_standings
+
+
+class Command(BaseCommand):
+    help = 'Save the standings of drivers and teams of the seasons without saved standings (or of every season)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', dest='all',
+                            help='Save again the standings of every season')
+
+    def handle(self, *args, **options):
+        seasons = Season.objects.all() if options['all'] else get_seasons_without_standings()
+        for season in seasons.select_related('competition'):
+            refresh_season_standings(season)
+            season.invalidate_cache()
+            self.stdout.write(u'Standings of {season} saved'.format(season=season))
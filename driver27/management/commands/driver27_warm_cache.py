@@ -0,0 +1,42 @@
+import time
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:  # Python 2 without futures backport: scopes are warmed in process
+    ProcessPoolExecutor = None
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from driver27.recompute import get_rank_scopes, warm_scope
+
+
+class Command(BaseCommand):
+    help = 'Compute the ranks of every season, competition and global scope and save them in cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1)
+        parser.add_argument('--only-changed', action='store_true', dest='only_changed',
+                            help='Skip scopes whose version has not changed since they were warmed')
+
+    def warm_scopes(self, scopes, workers):
+        """ Seconds of each scope. Other processes only help with a shared cache (not with local memory cache) """
+        if workers > 1 and ProcessPoolExecutor is not None and len(scopes) > 1:
+            # each process opens its own connection
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                return list(executor.map(warm_scope, scopes))
+        return [warm_scope(scope) for scope in scopes]
+
+    def handle(self, *args, **options):
+        start = time.time()
+        scopes = [(model_name, pk, options['only_changed']) for model_name, pk in get_rank_scopes()]
+        warmed = 0
+        for (model_name, pk, only_changed), seconds in zip(scopes, self.warm_scopes(scopes, options['workers'])):
+            scope_name = model_name if pk is None else u'{model_name} {pk}'.format(model_name=model_name, pk=pk)
+            if seconds is None:
+                self.stdout.write(u'{scope:<20} skipped'.format(scope=scope_name))
+            else:
+                warmed += 1
+                self.stdout.write(u'{scope:<20} {seconds:>8.3f}s'.format(scope=scope_name, seconds=seconds))
+        self.stdout.write(u'{warmed} of {total} scopes warmed in {seconds:.3f}s'.format(
+            warmed=warmed, total=len(scopes), seconds=time.time() - start))
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from django.core.management.base import BaseCommand, CommandError
+from driver27.bulk import open_csv
 from driver27.models import Driver, Team, Seat
 
 import sys
@@ -38,7 +39,7 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
 
-        with open(options['csv'], 'wb') as csvfile:
+        with open_csv(options['csv'], 'w') as csvfile:
             export_config = self.get_config(options['export'])
             writer = csv.DictWriter(csvfile, fieldnames=export_config['fieldnames'])
             writer.writeheader()
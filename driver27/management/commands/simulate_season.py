@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from six import text_type
+from driver27.caching import cache_memo
+from driver27.models import Driver, Season, Team
+
+
+class Command(BaseCommand):
+    help = 'Simulate the pending races of a season (title, podium and position probabilities)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('season', type=int)
+        parser.add_argument('--simulations', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--workers', type=int, default=1)
+        parser.add_argument('--punctuation', default=None)
+
+    def write_probabilities(self, title, model, probabilities):
+        self.stdout.write(title)
+        items = model.objects.in_bulk(list(probabilities))
+        rank = sorted(probabilities.items(), key=lambda x: (x[1]['title'], x[1]['podium']), reverse=True)
+        for item_id, item_probabilities in rank:
+            self.stdout.write(u'{item:<40} {title:>8.2%} {podium:>8.2%}'.format(item=text_type(items[item_id]),
+                                                                                **item_probabilities))
+
+    def handle(self, *args, **options):
+        with cache_memo():
+            self.simulate(options)
+
+    def simulate(self, options):
+        try:
+            season = Season.objects.get(pk=options['season'])
+        except Season.DoesNotExist:
+            raise CommandError('Season "%s" does not exist' % options['season'])
+        simulation = season.simulate(simulations=options['simulations'], seed=options['seed'],
+                                     workers=options['workers'], punctuation_code=options['punctuation'])
+        self.write_probabilities('Drivers (title, podium)', Driver, simulation['drivers'])
+        self.write_probabilities('Teams (title, podium)', Team, simulation['teams'])
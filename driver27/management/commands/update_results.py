@@ -1,35 +1,23 @@
 from django.core.management.base import BaseCommand, CommandError
-from driver27.models import Result
-import csv
+from driver27.bulk import CSV_CHUNK_SIZE, ResultCSVLoader, open_csv
 
 
 class Command(BaseCommand):
     help = 'Update results via csv'
 
-    @staticmethod
-    def _create_result(row):
-        invalid_keywords = []
-        result_fields = [f.column for f in Result._meta.get_fields() if hasattr(f, 'column')]
-        for x in row:
-            if x in ['qualifying', 'finish', 'points', 'race_id', 'seat_id']:
-                if row[x] == '':
-                    row[x] = None
-                else:
-                    row[x] = int(row[x])
-            elif x in ['wildcard', 'fastest_lap', 'retired']:
-                row[x] = bool(row[x])
-            elif x not in result_fields:
-                invalid_keywords.append(x)
-
-        for invalid_keyword in invalid_keywords:
-            del row[invalid_keyword]
-        return Result.objects.create(**row)
-
     def add_arguments(self, parser):
         parser.add_argument('csv',)
+        parser.add_argument('--chunk-size', type=int, default=CSV_CHUNK_SIZE, dest='chunk_size')
+        parser.add_argument('--dry-run', action='store_true', dest='dry_run',
+                            help='Validate the rows without saving them')
+
+    def write_progress(self, loaded, errors):
+        self.stdout.write('{loaded} rows loaded, {errors} errors'.format(loaded=loaded, errors=errors))
 
     def handle(self, *args, **options):
-        with open(options['csv'], 'rb') as csvfile:
-            reader = csv.DictReader(csvfile, delimiter=',')
-            for row in reader:
-                self._create_result(row)
+        with open_csv(options['csv']) as csvfile:
+            loader = ResultCSVLoader(csvfile, chunk_size=options['chunk_size'], dry_run=options['dry_run'],
+                                     progress=self.write_progress)
+            loader.load()
+        for line, error in loader.errors:
+            self.stderr.write(u'Line {line}: {error}'.format(line=line, error=error))
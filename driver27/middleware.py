@@ -0,0 +1,16 @@
+from .caching import cache_memo
+
+
+class CacheMemoMiddleware(object):
+    """
+    Ranks and stats read in a request are read from cache (or computed) only once. The memo of the request,
+    with its hit/miss counters, is request.driver27_cache_memo
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with cache_memo() as memo:
+            request.driver27_cache_memo = memo
+            return self.get_response(request)
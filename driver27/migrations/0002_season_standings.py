@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 09:57
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('driver27', '0001_squashed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DriverSeason',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('points', models.IntegerField(default=0, editable=False, verbose_name='points')),
+                ('pos_str', models.CharField(blank=True, default='', editable=False, max_length=60, verbose_name='positions')),
+                ('races', models.IntegerField(default=0, editable=False, verbose_name='races')),
+                ('wins', models.IntegerField(default=0, editable=False, verbose_name='wins')),
+                ('poles', models.IntegerField(default=0, editable=False, verbose_name='poles')),
+                ('fastest_laps', models.IntegerField(default=0, editable=False, verbose_name='fastest laps')),
+                ('teams', models.CharField(blank=True, default='', editable=False, max_length=250, verbose_name='teams')),
+                ('driver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seasons_driver', to='driver27.Driver', verbose_name='driver')),
+                ('season', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='drivers_season', to='driver27.Season', verbose_name='season')),
+            ],
+            options={
+                'verbose_name': 'Driver Season',
+                'verbose_name_plural': 'Drivers Season',
+            },
+        ),
+        migrations.AddField(
+            model_name='teamseason',
+            name='fastest_laps',
+            field=models.IntegerField(default=0, editable=False, verbose_name='fastest laps'),
+        ),
+        migrations.AddField(
+            model_name='teamseason',
+            name='points',
+            field=models.IntegerField(default=0, editable=False, verbose_name='points'),
+        ),
+        migrations.AddField(
+            model_name='teamseason',
+            name='poles',
+            field=models.IntegerField(default=0, editable=False, verbose_name='poles'),
+        ),
+        migrations.AddField(
+            model_name='teamseason',
+            name='pos_str',
+            field=models.CharField(blank=True, default='', editable=False, max_length=60, verbose_name='positions'),
+        ),
+        migrations.AddField(
+            model_name='teamseason',
+            name='races',
+            field=models.IntegerField(default=0, editable=False, verbose_name='races'),
+        ),
+        migrations.AddField(
+            model_name='teamseason',
+            name='wins',
+            field=models.IntegerField(default=0, editable=False, verbose_name='wins'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='driverseason',
+            unique_together=set([('season', 'driver')]),
+        ),
+    ]
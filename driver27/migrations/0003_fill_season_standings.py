@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def fill_season_standings(apps, schema_editor):
+    """ Save the standings of every season from its saved results (ranks are read from them) """
+    # standings are computed by the engine of models, not by historical models
+    from driver27.models import Season
+    from driver27.standings import refresh_season_standings
+    for season in Season.objects.select_related('competition'):
+        refresh_season_standings(season)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('driver27', '0002_season_standings'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_season_standings, migrations.RunPython.noop),
+    ]
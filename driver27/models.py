@@ -2,11 +2,13 @@
 from __future__ import unicode_literals
 
 from collections import namedtuple
+from itertools import islice
 
-from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.db import models
 from django.db.models import Q
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.translation import ugettext as _
 from django_countries.fields import CountryField
@@ -14,9 +16,16 @@ from slugify import slugify
 from swapfield.fields import SwapIntegerField
 
 from . import lr_intr, lr_diff
+from .batch import get_write_batch
+from .caching import GLOBAL_CACHE_SCOPE, bump_cache_versions, get_cache_scope, rank_cache
 from .points_calculator import PointsCalculator
 from .punctuation import get_punctuation_config
 from .rank import AbstractRankModel
+from .recompute import schedule_recompute
+from .clinch import ClinchSolver
+from .simulation import SeasonSimulator, SimulationSnapshot
+from .standings import AbstractStandingsModel, Standings, StandingsProgression, StandingsRow
+from .standings import get_pending_standings, refresh_season_standings
 from .stats import AbstractStreakModel, AbstractStatsModel, TeamStatsModel, StatsByCompetitionModel, SeasonStatsModel
 
 try:
@@ -31,8 +40,62 @@ ResultTuple = namedtuple('ResultTuple',
                          'round alter_punctuation points')
 
 
+RESULT_TUPLE_FIELDS = ('pk', 'qualifying', 'finish', 'seat_id', 'race__fastest_car_id', 'wildcard', 'retired', 'race_id',
+                       'race__circuit_id', 'race__grand_prix_id', 'race__season__competition_id', 'race__season__year',
+                       'race__round', 'race__alter_punctuation', 'points')
+
+RESULT_TUPLES_CHUNK_SIZE = 2000
+
+
+def _update_related_objects(model, related_objects, ids):
+    """ Load in one query the objects of model that are not loaded yet """
+    missing_ids = set(ids) - set(related_objects) - {None}
+    if missing_ids:
+        related_objects.update(model.objects.in_bulk(missing_ids))
+
+
+def _iter_tuples_by_pk(results, chunk_size=RESULT_TUPLES_CHUNK_SIZE):
+    """ Pairs of pk and ResultTuple of a Result queryset, reading its rows by chunks """
+    circuits, grands_prix, competitions = {}, {}, {}
+    rows = results.values_list(*RESULT_TUPLE_FIELDS).iterator()
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        _update_related_objects(Circuit, circuits, [row[8] for row in chunk])
+        _update_related_objects(GrandPrix, grands_prix, [row[9] for row in chunk])
+        _update_related_objects(Competition, competitions, [row[10] for row in chunk])
+        for (pk, qualifying, finish, seat_id, fastest_car_id, wildcard, retired, race_id, circuit_id, grand_prix_id,
+             competition_id, year, race_round, alter_punctuation, points) in chunk:
+            grand_prix = grands_prix.get(grand_prix_id)
+            yield pk, ResultTuple(qualifying=qualifying, finish=finish, fastest_lap=seat_id == fastest_car_id,
+                                  wildcard=wildcard, retired=retired, race_id=race_id,
+                                  circuit=circuits.get(circuit_id), grand_prix=grand_prix,
+                                  country=getattr(grand_prix, 'country', None),
+                                  competition=competitions.get(competition_id), year=year, round=race_round,
+                                  alter_punctuation=alter_punctuation, points=points)
+
+
+def iter_tuples_from_results(results, chunk_size=RESULT_TUPLES_CHUNK_SIZE):
+    """
+    ResultTuple of each result of a queryset (e.g. Result.wizard), in the same order.
+    Results are read in one flat projection; circuits, grands prix and competitions are loaded once by chunk.
+    """
+    for pk, result_tuple in _iter_tuples_by_pk(results, chunk_size=chunk_size):
+        yield result_tuple
+
+
 def get_tuples_from_results(results):
-    return [get_tuple_from_result(result) for result in results]
+    """ List of ResultTuple of results. A list of saved results is read again in one query """
+    if isinstance(results, models.QuerySet):
+        return list(iter_tuples_from_results(results))
+    results = list(results)
+    if not results:
+        return []
+    if any(result.pk is None for result in results):
+        return [get_tuple_from_result(result) for result in results]
+    tuples_by_pk = dict(_iter_tuples_by_pk(Result.objects.filter(pk__in=[result.pk for result in results])))
+    return [tuples_by_pk[result.pk] for result in results]
 
 
 def get_tuple_from_result(result, **kwargs):
@@ -100,6 +163,14 @@ class Driver(StatsByCompetitionModel):
         else:
             return True
 
+    @classmethod
+    def get_active_drivers(cls):
+        """ Queryset of active drivers (see is_active) """
+        last_year = Season.objects.aggregate(last_year=models.Max('year')).get('last_year')
+        if last_year is None:
+            return cls.objects.all()
+        return cls.objects.filter(seats__results__race__season__year=last_year).distinct()
+
     def get_summary_points(self, append_to_summary=None, **kwargs):
         kwargs.pop('exclude_position', False)
         punctuation_config = kwargs.pop('punctuation_config', None)
@@ -194,6 +265,10 @@ class Competition(AbstractRankModel):
     def stats_filter_kwargs(self):
         return {'competition': self}
 
+    @property
+    def cache_scope(self):
+        return get_cache_scope('competition', self.pk)
+
     def save(self, *args, **kwargs):
         self.slug = slugify(self.name)
         super(Competition, self).save(*args, **kwargs)
@@ -410,22 +485,45 @@ class Season(AbstractRankModel):
     def stats_filter_kwargs(self):
         return {'season': self}
 
+    @property
+    def cache_scope(self):
+        return get_cache_scope('season', self.pk)
+
+    @property
+    def cache_scopes(self):
+        """ Cache scopes whose ranks depend on the results of season """
+        return [self.cache_scope, get_cache_scope('competition', self.competition_id), GLOBAL_CACHE_SCOPE]
+
+    def invalidate_cache(self):
+        """ Bump the cache versions of season, its competition and global scope, and queue their ranks """
+        bump_cache_versions(self.cache_scopes)
+        schedule_recompute(self)
+
+    def save(self, *args, **kwargs):
+        saved_season = Season.objects.filter(pk=self.pk).values_list('rounds').first() if self.pk else None
+        super(Season, self).save(*args, **kwargs)
+        if saved_season and saved_season[0] != self.rounds:
+            # points of drivers only count the best results of rounds
+            refresh_season_standings(self, driver_ids=list(self.drivers.values_list('pk', flat=True)), team_ids=[])
+            self.invalidate_cache()
+
     def get_results(self, kwargs=None):
-        cache_str = 'season_results_{pk}'.format(pk=self.pk)
-        cache_results = cache.get(cache_str)
+        cache_str = 'season_results_{pk}_v{version}'.format(pk=self.pk, version=self.get_cache_version())
+        cache_results = rank_cache.get(cache_str)
 
-        if cache_results:
+        if cache_results is not None:
             results = cache_results
         else:
             results = Result.wizard(season=self)
-            cache.set(cache_str, results)
+            rank_cache.set(cache_str, results)
         return results
 
     def get_results_list(self, element='driver', kwargs=None):
-        cache_str = 'season_results_{pk}_{element}'.format(pk=self.pk, element=element)
-        cache_results_list = cache.get(cache_str)
+        cache_str = 'season_results_{pk}_v{version}_{element}'.format(pk=self.pk, version=self.get_cache_version(),
+                                                                      element=element)
+        cache_results_list = rank_cache.get(cache_str)
 
-        if cache_results_list:
+        if cache_results_list is not None:
             entries = cache_results_list
         else:
             results = self.get_results()
@@ -435,12 +533,32 @@ class Season(AbstractRankModel):
                 if key not in entries:
                     entries[key] = []
                 entries[key].append(result)
-            cache.set(cache_str, entries)
+            rank_cache.set(cache_str, entries)
         return entries
 
     def get_results_by_drivers(self):
         return self.get_results_list('driver')
 
+    def points_progression(self, team=False, punctuation_code=None):
+        """
+        Points and position of each driver (or team) after every round with results.
+        Entries are ordered by the last position. Punctuation config will be overwrite temporarily by code
+        """
+        cache_str = self.get_name_cache_rank('points_progression', locals())
+        progression = rank_cache.get(cache_str)
+        if progression is None:
+            element_name, model = ('team', Team) if team else ('driver', Driver)
+            punctuation_config = get_punctuation_config(punctuation_code=punctuation_code) \
+                if punctuation_code is not None else None
+            rounds, points_by_item = StandingsProgression(self, key=element_name + '_id',
+                                                          punctuation_config=punctuation_config).run()
+            items = model.objects.in_bulk(list(points_by_item))
+            rank = [{element_name: items[item_id], 'points': points_list, 'positions': positions}
+                    for item_id, (points_list, positions) in points_by_item.items()]
+            progression = {'rounds': rounds, 'rank': sorted(rank, key=lambda x: x['positions'][-1])}
+            rank_cache.set(cache_str, progression)
+        return progression
+
 
     def get_results_by_teams(self):
         return self.get_results_list('team')
@@ -490,9 +608,14 @@ class Season(AbstractRankModel):
     def get_stats_cls(self, driver):
         return driver.get_season(self)
 
+    def get_active_drivers(self):
+        """ Every driver of season is active (as ContenderSeason.is_active) """
+        return self.drivers.all()
+
     def get_team_stats_cls(self, team):
-        team_season, created = TeamSeason.objects.get_or_create(season=self, team=team)
-        return team_season
+        """ TeamSeason of team. It is not saved if it does not exist yet (stats are read from results) """
+        team_season = TeamSeason.objects.filter(season=self, team=team).first()
+        return team_season or TeamSeason(season=self, team=team)
 
     def get_punctuation_config(self, punctuation_code=None):
         """ Getting the punctuation config. Chosen punctuation will be override temporarily by code kwarg """
@@ -527,23 +650,28 @@ class Season(AbstractRankModel):
             races_no_results = expected_pending_races
         return races_no_results
 
+    def get_pending_max_points(self, punctuation_config, pending_races=None):
+        """
+        List of (round, maximum points) of each pending race: win, pole and fastest lap.
+        pending_races is a list of (round, alter_punctuation), read from season if it is not passed
+        """
+        calculator = PointsCalculator(punctuation_config=punctuation_config or {})
+        if pending_races is None:
+            pending_races = self.pending_races.order_by('round').values_list('round', 'alter_punctuation')
+        pending_max_points = []
+        for race_round, alter_punctuation in pending_races:
+            max_row = StandingsRow(driver_id=None, team_id=None, season_id=self.pk, season_rounds=self.rounds,
+                                   qualifying=1, finish=1, fastest_lap=True, wildcard=False,
+                                   alter_punctuation=alter_punctuation, points=None)
+            pending_max_points.append((race_round, calculator.calculator(max_row)))
+        return pending_max_points
+
     def pending_points(self, punctuation_code=None):
         """ Return the maximum of available points taking into account the number of pending races"""
-        # @todo fastest_lap and pole points are not counted
         if not punctuation_code:
             punctuation_code = self.punctuation
         punctuation_config = get_punctuation_config(punctuation_code=punctuation_code)
-        max_points = 0
-
-        for race in self.pending_races.all():
-            # max_result = Result(finish=1, qualifying=1, race=race)
-            # @todo fastest_car modify tuple behavior
-            max_result = Result(finish=1, qualifying=1, race=race)
-            max_tuple = get_tuple_from_result(max_result, fastest_lap=True)
-            max_points += PointsCalculator(punctuation_config=punctuation_config).calculator(
-                max_tuple
-            )
-        return max_points
+        return sum(points for race_round, points in self.get_pending_max_points(punctuation_config))
 
     def leader_window(self, rank=None, punctuation_code=None):
         """ Minimum of current points a contestant must have to have any chance to be a champion.
@@ -554,30 +682,61 @@ class Season(AbstractRankModel):
         leader = self.get_leader(rank=rank, **punctuation_code_dict)
         return leader['points'] - pending_points if leader else None
 
-    def only_title_contenders(self, punctuation_code=None):
-        """ They are only candidates for the title if they can reach the leader by adding all the pending points."""
-        punctuation_code_dict = {'punctuation_code': punctuation_code}
-        rank = self.points_rank(**punctuation_code_dict)
-        leader_window = self.leader_window(rank=rank, **punctuation_code_dict)
+    def get_title(self, punctuation_code=None):
+        """
+        Title fight of season (see ClinchSolver.run): dict by driver_id with points, max_points, best_position,
+        worst_position, eliminated and elimination_round. Punctuation config will be overwrite temporarily by
+        code kwarg
+        """
+        cache_str = self.get_name_cache_rank('title', locals())
+        title = rank_cache.get(cache_str)
+        if title is None:
+            punctuation_config = get_punctuation_config(punctuation_code=punctuation_code) \
+                if punctuation_code else None
+            entries = Standings(self, punctuation_config=punctuation_config)._accumulate('driver_id')
+            pending_max_points = self.get_pending_max_points(punctuation_config or self.get_punctuation_config())
+            title = ClinchSolver.from_entries(entries, self.pk, pending_max_points, rounds=self.rounds).run()
+            rank_cache.set(cache_str, title)
+        return title
 
-        title_rank = []
-        if leader_window is not None:  # Can be zero
-            title_rank = [entry for entry in rank if entry['points'] >= leader_window]
-        return title_rank
+    def only_title_contenders(self, punctuation_code=None):
+        """ They are only candidates for the title if they can be first at the end of season """
+        title = self.get_title(punctuation_code=punctuation_code)
+        rank = self.points_rank(punctuation_code=punctuation_code)
+        contenders = [driver_id for driver_id, driver_title in title.items() if driver_title['best_position'] == 1]
+        return [entry for entry in rank if entry['driver'].pk in contenders]
 
     def the_champion(self, punctuation_code=None):
-        title_contenders = self.only_title_contenders(punctuation_code=punctuation_code)
-        if len(title_contenders) == 1:
-            return title_contenders[0]
+        """ Driver that will be the first at the end of season whatever the pending results are """
+        title = self.get_title(punctuation_code=punctuation_code)
+        champion = [driver_id for driver_id, driver_title in title.items() if driver_title['worst_position'] == 1]
+        if champion:
+            rank = self.points_rank(punctuation_code=punctuation_code)
+            return next((entry for entry in rank if entry['driver'].pk == champion[0]), None)
         return None
 
     def has_champion(self, punctuation_code=None):
-        """ If only exists one title contender, it has champion """
-        return self.the_champion(punctuation_code=punctuation_code) is not None
+        """ If a driver can not lose the first position, it has champion """
+        title = self.get_title(punctuation_code=punctuation_code)
+        return any(driver_title['worst_position'] == 1 for driver_title in title.values())
+
+    def simulate(self, simulations=10000, seed=0, workers=1, punctuation_code=None):
+        """
+        Probabilities of title, podium and each final position of drivers and teams, simulating the pending
+        races (see SeasonSimulator). Punctuation config will be overwrite temporarily by code kwarg
+        """
+        cache_str = self.get_name_cache_rank('simulation', {'simulations': simulations, 'seed': seed,
+                                                            'punctuation_code': punctuation_code})
+        simulation = rank_cache.get(cache_str)
+        if simulation is None:
+            snapshot = SimulationSnapshot.from_season(self, self.get_punctuation_config(punctuation_code))
+            simulation = SeasonSimulator(snapshot, simulations=simulations, seed=seed, workers=workers).run()
+            rank_cache.set(cache_str, simulation)
+        return simulation
 
     def get_leader(self, rank=None, team=False, punctuation_code=None):
         """ Get driver leader or team leader """
-        if not rank:
+        if rank is None:
             # if not punctuation_code:
             #     punctuation_code = self.punctuation
             punctuation_code_dict = {'punctuation_code': punctuation_code}
@@ -667,6 +826,41 @@ class Race(models.Model):
             raise ValidationError(errors)
         super(Race, self).clean()
 
+    def save(self, *args, **kwargs):
+        saved_race = Race.objects.filter(pk=self.pk).values_list('season_id', 'fastest_car_id', 'alter_punctuation') \
+            .first() if self.pk else None
+        super(Race, self).save(*args, **kwargs)
+        if saved_race:
+            saved_season_id, saved_fastest_car_id, saved_alter_punctuation = saved_race
+            if saved_season_id != self.season_id:
+                self.update_results_points()
+                saved_season = Season.objects.get(pk=saved_season_id)
+                refresh_season_standings(saved_season)
+                refresh_season_standings(self.season)
+                saved_season.invalidate_cache()
+            elif saved_fastest_car_id != self.fastest_car_id or saved_alter_punctuation != self.alter_punctuation:
+                self.update_results_points()
+                contenders = list(self.results.values_list('seat__driver_id', 'seat__team_id'))
+                refresh_season_standings(self.season, driver_ids=[driver_id for driver_id, team_id in contenders],
+                                         team_ids=[team_id for driver_id, team_id in contenders])
+        self.season.invalidate_cache()
+
+    def delete(self, *args, **kwargs):
+        season = self.season
+        deleted = super(Race, self).delete(*args, **kwargs)
+        refresh_season_standings(season)
+        season.invalidate_cache()
+        return deleted
+
+    def update_results_points(self):
+        """ Save again the points of results, after a change of fastest_car or alter_punctuation """
+        results = self.results.select_related('seat', 'race__season__competition', 'race__grand_prix',
+                                              'race__circuit', 'race__fastest_car')
+        for result in results:
+            points = result.get_points()
+            if points != result.points:
+                Result.objects.filter(pk=result.pk).update(points=points)
+
     def get_result_seat(self, **kwargs):
         """ Return the first result that match with filter """
         results = self.results.filter(**kwargs)
@@ -777,13 +971,24 @@ class Race(models.Model):
 
 
 @python_2_unicode_compatible
-class TeamSeason(TeamStatsModel, SeasonStatsModel):
-    """ TeamSeason model, only for validation although it is saved in DB"""
+class TeamSeason(TeamStatsModel, SeasonStatsModel, AbstractStandingsModel):
+    """ TeamSeason model, for validation and the saved standings of team in season """
     season = models.ForeignKey('Season', related_name='teams_season', verbose_name=_('season'))
     team = models.ForeignKey('Team', related_name='seasons_team', verbose_name=_('team'))
     sponsor_name = models.CharField(max_length=75, null=True, blank=True, default=None,
                                     verbose_name=_('sponsor name'))
 
+    def save(self, *args, **kwargs):
+        saved_sponsor_name = TeamSeason.objects.filter(pk=self.pk).values_list('sponsor_name', flat=True).first() \
+            if self.pk else None
+        super(TeamSeason, self).save(*args, **kwargs)
+        if saved_sponsor_name != self.sponsor_name:
+            # teams of drivers in saved standings use the sponsor name
+            drivers = Result.objects.filter(race__season=self.season_id, seat__team=self.team_id) \
+                .values_list('seat__driver_id', flat=True).distinct()
+            refresh_season_standings(self.season, driver_ids=list(drivers), team_ids=[])
+            self.season.invalidate_cache()
+
     @property
     def stats_filter_kwargs(self):
         return {'season': self.season, 'team': self.team}
@@ -869,6 +1074,22 @@ class TeamSeason(TeamStatsModel, SeasonStatsModel):
         verbose_name_plural = _('Teams Season')
 
 
+@python_2_unicode_compatible
+class DriverSeason(AbstractStandingsModel):
+    """ Saved standings of driver in season. It is refreshed with the results of season, not edited """
+    season = models.ForeignKey('Season', related_name='drivers_season', verbose_name=_('season'))
+    driver = models.ForeignKey('Driver', related_name='seasons_driver', verbose_name=_('driver'))
+    teams = models.CharField(max_length=250, blank=True, default='', editable=False, verbose_name=_('teams'))
+
+    def __str__(self):
+        return '{driver} in {season}'.format(driver=self.driver, season=self.season)
+
+    class Meta:
+        unique_together = ('season', 'driver')
+        verbose_name = _('Driver Season')
+        verbose_name_plural = _('Drivers Season')
+
+
 @python_2_unicode_compatible
 class Result(models.Model):
     """ Result model """
@@ -920,13 +1141,21 @@ class Result(models.Model):
         results = results.order_by(*order_by_args)
         return results
 
-    def _validate_seat(self):
+    def _validate_seat(self, write_batch=None):
         errors = {'seat': []}
-        if not self.race.season.competition.teams.filter(pk=self.seat.team.pk).exists():
+        if write_batch is None:
+            team_in_competition = self.race.season.competition.teams.filter(pk=self.seat.team.pk).exists()
+            seat_in_season = self.race.season.seats.filter(pk=self.seat.pk).exists()
+            driver_in_race = Result.wizard(driver=self.seat.driver, race=self.race).exclude(pk=self.pk).exists()
+        else:
+            # a driver twice in the race is validated at the end of the batch
+            team_in_competition, seat_in_season = write_batch.get_seat_checks(self)
+            driver_in_race = False
+        if not team_in_competition:
             errors['seat'].append('Team not in Competition')
-        if Result.wizard(driver=self.seat.driver, race=self.race).exclude(pk=self.pk).exists():
+        if driver_in_race:
             errors['seat'].append('Exists a result with the same driver in this race (different Seat)')
-        if not self.race.season.seats.filter(pk=self.seat.pk).exists():
+        if not seat_in_season:
             errors['seat'].append('{seat} is not valid in {season_year}'.format(seat=self.seat,
                                                                                 season_year=self.race.season.year))
         if errors['seat']:
@@ -937,10 +1166,46 @@ class Result(models.Model):
         super(Result, self).clean()
 
     def save(self, *args, **kwargs):
+        write_batch = get_write_batch()
+        if write_batch is not None:
+            # points, standings and cache are refreshed at the end of the batch
+            self._validate_seat(write_batch=write_batch)
+            super(Result, self).save(*args, **kwargs)
+            write_batch.add_race(self.race)
+            return
         self._validate_seat()
         self.points = self.get_points()
+        saved_contender = Result.objects.filter(pk=self.pk) \
+            .values_list('race__season_id', 'seat__driver_id', 'seat__team_id').first() if self.pk else None
         super(Result, self).save(*args, **kwargs)
-        cache.clear()
+        self.refresh_standings(saved_contender)
+        self.race.season.invalidate_cache()
+
+    def delete(self, *args, **kwargs):
+        season = self.race.season
+        # standings are refreshed here, not by refresh_deleted_result_standings
+        self._refresh_standings_on_delete = False
+        deleted = super(Result, self).delete(*args, **kwargs)
+        write_batch = get_write_batch()
+        if write_batch is not None:
+            write_batch.add_season(season)
+            return deleted
+        self.refresh_standings()
+        season.invalidate_cache()
+        return deleted
+
+    def refresh_standings(self, saved_contender=None):
+        """ Refresh the saved standings of driver and team of result (and of the previous ones, if changed) """
+        contenders = set([(self.race.season_id, self.seat.driver_id, self.seat.team_id)])
+        if saved_contender:
+            contenders.add(tuple(saved_contender))
+        for season_id in set(contender[0] for contender in contenders):
+            season_contenders = [contender for contender in contenders if contender[0] == season_id]
+            season = self.race.season if season_id == self.race.season_id else Season.objects.get(pk=season_id)
+            refresh_season_standings(season, driver_ids=[contender[1] for contender in season_contenders],
+                                     team_ids=[contender[2] for contender in season_contenders])
+            if season_id != self.race.season_id:
+                season.invalidate_cache()
 
     @property
     def driver(self):
@@ -953,7 +1218,7 @@ class Result(models.Model):
     @property
     def is_fastest(self):
         try:
-            return self.race.fastest_car.pk == self.seat.pk
+            return self.race.fastest_car_id is not None and self.race.fastest_car_id == self.seat_id
         except AttributeError:
             return False
 
@@ -982,6 +1247,13 @@ class Result(models.Model):
         verbose_name_plural = _('Results')
 
 
+@receiver(post_delete, sender=Result)
+def refresh_deleted_result_standings(sender, instance, **kwargs):
+    """ Standings of results deleted by querysets or cascades (e.g. of a seat or a driver) """
+    if getattr(instance, '_refresh_standings_on_delete', True):
+        get_pending_standings().add_result(instance)
+
+
 class ContenderSeason(AbstractStreakModel, SeasonStatsModel):
     """ ContenderSeason is not a model. Only for validation and ranks"""
 
@@ -1107,6 +1379,10 @@ class RankModel(AbstractRankModel):
     def stats_filter_kwargs(self):
         return {}
 
+    @property
+    def cache_scope(self):
+        return GLOBAL_CACHE_SCOPE
+
     def get_stats_cls(self, driver):
         return driver
 
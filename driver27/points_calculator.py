@@ -34,3 +34,42 @@ class PointsCalculator(object):
         points += self.get_points_finish(result.finish, result.alter_punctuation)
         points += self.get_points_fastest_lap(result.fastest_lap)
         return points
+
+
+class MultiPointsCalculator(object):
+    """
+    Points of a result with several punctuation configs at once. The scoring of each config is precompiled
+    as lookup lists by position, so a result is scored with all of them without reading the configs again.
+    """
+    points_factor = {'double': 2, 'half': 0.5}
+
+    def __init__(self, punctuation_configs):
+        self.codes = list(punctuation_configs)
+        self.qualifying = [self.get_lookup(punctuation_configs[code].get('qualifying')) for code in self.codes]
+        self.finish = [self.get_lookup(punctuation_configs[code].get('finish')) for code in self.codes]
+        self.fastest_lap = [punctuation_configs[code].get('fastest_lap') or 0 for code in self.codes]
+
+    @staticmethod
+    def get_lookup(scoring):
+        """ Points by position, with position 0 (no position) scoring 0 """
+        return [0] + list(scoring or [])
+
+    @staticmethod
+    def get_position_index(position, lookup):
+        if position and 0 < position < len(lookup):
+            return position
+        return 0
+
+    def calculator(self, result, skip_wildcard=False):
+        """ Tuple of points of result with each punctuation config, in the order of codes """
+        if result.wildcard and skip_wildcard:
+            return (0,) * len(self.codes)
+        factor = self.points_factor.get(result.alter_punctuation, 1)
+        points = []
+        for qualifying, finish, fastest_lap in zip(self.qualifying, self.finish, self.fastest_lap):
+            result_points = qualifying[self.get_position_index(result.qualifying, qualifying)]
+            result_points += finish[self.get_position_index(result.finish, finish)] * factor
+            if result.fastest_lap:
+                result_points += fastest_lap
+            points.append(result_points)
+        return tuple(points)
@@ -1,7 +1,6 @@
 # encoding: utf-8
 from .punctuation import get_punctuation_config
 from django.db import models
-from django.core.cache import cache
 from six import text_type
 
 try:
@@ -14,8 +13,11 @@ try:
 except ImportError:
     pass
 
-from django.db.models import F, Sum
-from .records import get_record_config
+from django.db.models import Count, F, Sum
+from .caching import get_cache_version, rank_cache
+from .records import RecordsCounter, get_record_config
+from .standings import ComparedStandings, SavedStandings, Standings
+from .streak import StreakMatrix
 
 
 def order_points(rank):
@@ -37,10 +39,20 @@ class AbstractRankModel(models.Model):
     def stats_filter_kwargs(self):
         raise NotImplementedError('Not implemented property')
 
+    @property
+    def cache_scope(self):
+        raise NotImplementedError('Not implemented property')
+
+    def get_cache_version(self):
+        return get_cache_version(self.cache_scope)
+
     def get_name_cache_rank(self, prefix, kwargs):
+        """ Cache key of rank. It includes the version of cache scope, bumped when a result changes """
         repr_kw = [u'{key}:{value}'.format(key=kw, value=kwargs.get(kw)) for kw in kwargs]
         repr_local = re.sub(r'[^\w:]', '', text_type(','.join(repr_kw)))
-        cache_str = u'{prefix}_{repr_local}'.format(prefix=prefix, repr_local=repr_local)
+        cache_str = u'{prefix}_{scope}_v{version}_{repr_local}'.format(prefix=prefix, scope=self.cache_scope,
+                                                                     version=self.get_cache_version(),
+                                                                     repr_local=repr_local)
         return cache_str
 
     def _abstract_points_rank_by_season(self, element_name, element_group, punctuation_config=None):
@@ -54,65 +66,72 @@ class AbstractRankModel(models.Model):
                 rank.append(points_by_season)
         return rank
 
-    def _abstract_points_rank(self, element_name, element_group, stats_cls, punctuation_config=None):
-        rank = []
-        items= getattr(self, element_group).all()
-        for item in items:
-            stat_cls = stats_cls(item)
-            rank.append(stat_cls.get_summary_points_rank(punctuation_config=punctuation_config,
-                                                    exclude_position=True,
-                                                    append_to_summary={element_name: item},
-                                                    **self.stats_filter_kwargs))
-        return rank
-
     def points_rank_by_season(self, punctuation_config=None):
         return self._abstract_points_rank_by_season('driver', 'drivers', punctuation_config)
 
     def team_points_rank_by_season(self, punctuation_config=None):
         return self._abstract_points_rank_by_season('team', 'teams', punctuation_config)
 
+    def get_standings(self, punctuation_config=None):
+        """
+        Standings engine of rank model. Saved standings of seasons are read,
+        unless punctuation config is overwritten temporarily (then, points are computed from results)
+        """
+        if punctuation_config is None:
+            return SavedStandings(self)
+        return Standings(self, punctuation_config=punctuation_config)
+
     def _points_rank(self, punctuation_config=None):
-        return self._abstract_points_rank('driver', 'drivers', self.get_stats_cls, punctuation_config)
+        return self.get_standings(punctuation_config=punctuation_config).driver_rank()
 
     def _team_points_rank(self, punctuation_config=None):
-        return self._abstract_points_rank('team', 'teams', self.get_team_stats_cls, punctuation_config)
+        return self.get_standings(punctuation_config=punctuation_config).team_rank()
 
     def points_rank(self, punctuation_code=None, by_season=False):
         """ Points driver rank. Scoring can be override by scoring_code param """
         cache_str = self.get_name_cache_rank('points', locals())
-        cache_rank = cache.get(cache_str)
 
-        if cache_rank:
-            rank = cache_rank
-        else:
+        def compute_rank():
             punctuation_config = get_punctuation_config(punctuation_code=punctuation_code) \
                 if punctuation_code is not None else None
             if by_season:
-                rank = self.points_rank_by_season(punctuation_config=punctuation_config)
-            else:
-                rank = self._points_rank(punctuation_config=punctuation_config)
-            cache.set(cache_str, rank)
+                return self.points_rank_by_season(punctuation_config=punctuation_config)
+            return self._points_rank(punctuation_config=punctuation_config)
+
+        rank = rank_cache.get_or_set(cache_str, compute_rank)
         rank = order_points(rank)
         return rank
 
     def team_points_rank(self, punctuation_code=None, by_season=False):
         """ Same that points_rank by count both team drivers """
         cache_str = self.get_name_cache_rank('team_points', locals())
-        cache_rank = cache.get(cache_str)
 
-        if cache_rank:
-            rank = cache_rank
-        else:
+        def compute_rank():
             punctuation_config = get_punctuation_config(punctuation_code=punctuation_code) \
                 if punctuation_code is not None else None
-            teams = getattr(self, 'teams').all()
             if by_season:
                 rank = self.team_points_rank_by_season(punctuation_config=punctuation_config)
             else:
                 rank = self._team_points_rank(punctuation_config=punctuation_config)
-            rank = order_points(rank)
-            cache.set(cache_str, rank)
-        return rank
+            return order_points(rank)
+
+        return rank_cache.get_or_set(cache_str, compute_rank)
+
+    def get_compared_standings(self):
+        """ Standings engine with all punctuation configs side by side """
+        return ComparedStandings(self, punctuation_configs=get_punctuation_config())
+
+    def _abstract_compared_rank(self, prefix, standings_method):
+        cache_str = self.get_name_cache_rank(prefix, {})
+        return rank_cache.get_or_set(cache_str, lambda: getattr(self.get_compared_standings(), standings_method)())
+
+    def compared_points_rank(self):
+        """ Driver rank with the points and position of each punctuation config """
+        return self._abstract_compared_rank('compared_points', 'driver_rank')
+
+    def compared_team_points_rank(self):
+        """ Team rank with the points and position of each punctuation config """
+        return self._abstract_compared_rank('compared_team_points', 'team_rank')
 
     def olympic_rank(self):
         """ The driver
@@ -121,37 +140,40 @@ class AbstractRankModel(models.Model):
 
         """ Points driver rank. Scoring can be override by scoring_code param """
         cache_str = self.get_name_cache_rank('olympic', locals())
-        cache_rank = cache.get(cache_str)
+        cache_rank = rank_cache.get(cache_str)
 
-        if cache_rank:
+        if cache_rank is not None:
             rank = cache_rank
         else:
-            drivers = getattr(self, 'drivers').all()
-            rank = [self.get_stats_cls(driver).get_summary_points_rank(
-                append_to_summary={'driver': driver},
-                **self.stats_filter_kwargs) for driver in drivers]
-        rank = sorted(rank, key=lambda x: x['pos_str'], reverse=True)
-        cache.get(cache_str, rank)
+            rank = self._points_rank()
+            if 'season' in self.stats_filter_kwargs:
+                # entries of a season include the position in points rank
+                for index, entry in enumerate(order_points(rank)):
+                    entry['pos'] = index + 1
+            rank = sorted(rank, key=lambda x: x['pos_str'], reverse=True)
+            rank_cache.set(cache_str, rank)
         return rank
 
     def stats_rank(self, **filters):
         """ Get driver rank based on record filter """
         cache_str = self.get_name_cache_rank('stats', locals())
-        cache_rank = cache.get(cache_str)
+        cache_rank = rank_cache.get(cache_str)
 
-        if cache_rank:
+        if cache_rank is not None:
             rank = cache_rank
         else:
-            filters.update(**self.stats_filter_kwargs)
+            from .models import Result
+            stats = RecordsCounter({'stat': filters}).count_by(Result.wizard(**self.stats_filter_kwargs),
+                                                               'seat__driver_id')
             drivers = getattr(self, 'drivers').all()
+            teams_verbose = self.get_teams_verbose()
             rank = []
             for driver in drivers:
-                stat_cls = self.get_stats_cls(driver)
-                rank.append({'stat': stat_cls.get_stats(**filters),
+                rank.append({'stat': stats.get(driver.pk, {}).get('stat', 0),
                              'driver': driver,
-                             'teams': stat_cls.teams_verbose})
+                             'teams': teams_verbose.get(driver.pk, '')})
             rank = sorted(rank, key=lambda x: x['stat'], reverse=True)
-            cache.set(cache_str, rank)
+            rank_cache.set(cache_str, rank)
         return rank
 
     def comeback_rank(self):
@@ -159,103 +181,128 @@ class AbstractRankModel(models.Model):
         comeback_filter = get_record_config('COMEBACK').get('filter')
         comeback_filter.update(self.stats_filter_kwargs)
         cache_str = self.get_name_cache_rank('comeback', locals())
-        cache_rank = cache.get(cache_str)
+        cache_rank = rank_cache.get(cache_str)
 
-        if cache_rank:
+        if cache_rank is not None:
             rank = cache_rank
         else:
             rank = Result.wizard(**comeback_filter) \
                 .annotate(comeback=Sum(F('qualifying') - F('finish'))).order_by('-comeback')
-            cache.set(cache_str, rank)
+            rank_cache.set(cache_str, rank)
+        return rank
+
+    def _abstract_seasons_rank(self, element_name, element_group, **filters):
+        """ Stat of each driver or team in each season with results, counted in one query """
+        from .models import Result, Season
+        stats = RecordsCounter({'stat': filters}).count_by(Result.wizard(**self.stats_filter_kwargs),
+                                                           'seat__{element}_id'.format(element=element_name),
+                                                           'race__season_id')
+        seasons = Season.objects.filter(pk__in=set(season_id for item_id, season_id in stats))
+        items = getattr(self, element_group).all()
+        rank = []
+        for item in items:
+            for season in seasons:
+                if (item.pk, season.pk) in stats:
+                    rank.append({'stat': stats[(item.pk, season.pk)]['stat'],
+                                 element_name: item,
+                                 'season': season})
         return rank
 
     def seasons_rank(self, **filters):
         """ Get driver rank based on record filter """
-        filters.update(**self.stats_filter_kwargs)
         cache_str = self.get_name_cache_rank('seasons', locals())
-        cache_rank = cache.get(cache_str)
+        cache_rank = rank_cache.get(cache_str)
 
-        if cache_rank:
+        if cache_rank is not None:
             rank = cache_rank
         else:
-            drivers = getattr(self, 'drivers').all()
-            rank = []
-            for driver in drivers:
-                stat_cls = self.get_stats_cls(driver)
-                driver_seasons = driver.seasons.filter(**self.stats_filter_kwargs)
-                for season in driver_seasons:
-                    rank.append({'stat': stat_cls.get_stats(season=season, **filters),
-                                 'driver': driver,
-                                 'teams': stat_cls.teams_verbose,
-                                 'season': season})
+            teams_verbose = self.get_teams_verbose()
+            rank = self._abstract_seasons_rank('driver', 'drivers', **filters)
+            for entry in rank:
+                entry['teams'] = teams_verbose.get(entry['driver'].pk, '')
             rank = sorted(rank, key=lambda x: x['stat'], reverse=True)
-            cache.set(cache_str, rank)
+            rank_cache.set(cache_str, rank)
         return rank
 
     def seasons_team_rank(self, **filters):
         """ Get driver rank based on record filter """
-        filters.update(**self.stats_filter_kwargs)
         cache_str = self.get_name_cache_rank('seasons_team', locals())
-        cache_rank = cache.get(cache_str)
+        cache_rank = rank_cache.get(cache_str)
 
-        if cache_rank:
+        if cache_rank is not None:
             rank = cache_rank
         else:
-            teams = getattr(self, 'teams').all()
-            rank = []
-            for team in teams:
-                stat_cls = self.get_stats_cls(team)
-                team_seasons = team.seasons.filter(**self.stats_filter_kwargs)
-                for season in team_seasons:
-                    rank.append({'stat': stat_cls.get_stats(season=season, **filters),
-                                 'team': team,
-                                 'season': season})
+            rank = self._abstract_seasons_rank('team', 'teams', **filters)
             rank = sorted(rank, key=lambda x: x['stat'], reverse=True)
-            cache.set(cache_str, rank)
+            rank_cache.set(cache_str, rank)
         return rank
 
+    def get_streaks(self, element='driver', **filters):
+        """
+        Dict of (current streak, max streak) by driver or team pk, from one chronological scan of results.
+        Streak ranks of the same record (current, max, only actives) share it.
+        """
+        from .models import Result
+        cache_str = self.get_name_cache_rank('streaks', {'element': element, 'filters': filters})
+        cache_streaks = rank_cache.get(cache_str)
+
+        if cache_streaks is not None:
+            streaks = cache_streaks
+        else:
+            results = Result.wizard(**self.stats_filter_kwargs)
+            streak_matrix = StreakMatrix(results, key='{element}_id'.format(element=element))
+            streaks = streak_matrix.run({'streak': filters}).get('streak')
+            rank_cache.set(cache_str, streaks)
+        return streaks
+
+    def get_active_drivers(self):
+        """ Queryset of active drivers of rank model (as is_active of their stats class) """
+        from .models import Driver
+        return Driver.get_active_drivers().filter(pk__in=self.drivers.values('pk'))
+
+    def get_teams_verbose(self):
+        """ Dict of teams_verbose by driver pk, read from standings (points are not computed) """
+        return self.get_standings().teams_verbose()
+
     def streak_rank(self, only_actives=False, max_streak=False, **filters):
         """ Get driver rank based on record filter """
         cache_str = self.get_name_cache_rank('streak', locals())
-        cache_rank = cache.get(cache_str)
+        cache_rank = rank_cache.get(cache_str)
 
-        if cache_rank:
+        if cache_rank is not None:
             rank = cache_rank
         else:
-            drivers = getattr(self, 'drivers').all()
+            streaks = self.get_streaks('driver', **filters)
+            drivers = self.get_active_drivers() if only_actives else getattr(self, 'drivers').all()
+            teams_verbose = self.get_teams_verbose()
             rank = []
             for driver in drivers:
-                stat_cls = self.get_stats_cls(driver)
-                if only_actives and not stat_cls.is_active:
-                    continue
-                rank.append({'stat': stat_cls.get_streak(result_filter=self.stats_filter_kwargs,
-                                                         max_streak=max_streak, **filters),
+                current_streak, max_streak_count = streaks.get(driver.pk, (0, 0))
+                rank.append({'stat': max_streak_count if max_streak else current_streak,
                              'driver': driver,
-                             'teams': stat_cls.teams_verbose})
+                             'teams': teams_verbose.get(driver.pk, '')})
             rank = sorted(rank, key=lambda x: x['stat'], reverse=True)
-            cache.set(cache_str, rank)
+            rank_cache.set(cache_str, rank)
         return rank
 
     def streak_team_rank(self, only_actives=False, max_streak=False, **filters):
         """ Get team rank based on record filter """
         cache_str = self.get_name_cache_rank('streak_team', locals())
-        cache_rank = cache.get(cache_str)
+        cache_rank = rank_cache.get(cache_str)
 
-        if cache_rank:
+        if cache_rank is not None:
             rank = cache_rank
         else:
+            streaks = self.get_streaks('team', **filters)
             teams = getattr(self, 'teams').all()
             rank = []
             for team in teams:
-                stat_cls = self.get_stats_cls(team)
-                # if only_actives and not stat_cls.is_active:
-                #     continue
-
-                rank.append({'stat': stat_cls.get_streak(unique_by_race=True, result_filter=self.stats_filter_kwargs,
-                                                         max_streak=max_streak, **filters),
+                # only_actives is not applied to teams
+                current_streak, max_streak_count = streaks.get(team.pk, (0, 0))
+                rank.append({'stat': max_streak_count if max_streak else current_streak,
                              'team': team})
             rank = sorted(rank, key=lambda x: x['stat'], reverse=True)
-            cache.set(cache_str, rank)
+            rank_cache.set(cache_str, rank)
         return rank
 
     @staticmethod
@@ -282,53 +329,58 @@ class AbstractRankModel(models.Model):
         # elif isinstance(self, Competition):
         #     return team
 
-    def team_rank(self, total_method, **filters):
-        """ Collect the records of each team calling the method of Team passed by total_method param """
+    def get_team_totals(self, rank_type, **filters):
+        """ Dict of total by team pk, in one query grouped by team (or by team and race for DOUBLES) """
+        from .models import Result
+        results = Result.wizard(**dict(filters, **self.stats_filter_kwargs)).order_by()
+        if rank_type == 'DOUBLES':
+            races = results.values_list('seat__team_id', 'race_id').annotate(count_race=Count('race')) \
+                .filter(count_race__gte=2)
+            totals = {}
+            for team_id, race_id, count_race in races:
+                totals[team_id] = totals.get(team_id, 0) + 1
+            return totals
+        total = Count('race', distinct=True) if rank_type == 'RACES' else Count('pk')
+        return dict(results.values_list('seat__team_id').annotate(total=total))
+
+    def team_rank(self, rank_type, **filters):
+        """ Collect the total (see get_team_rank_method) of each team """
         cache_str = self.get_name_cache_rank('team', locals())
-        cache_rank = cache.get(cache_str)
+        cache_rank = rank_cache.get(cache_str)
 
-        if cache_rank:
+        if cache_rank is not None:
             rank = cache_rank
         else:
+            totals = self.get_team_totals(rank_type, **filters)
             rank = []
             teams = getattr(self, 'teams').all()
             for team in teams:
-                team_stats_cls = self.get_team_stats_cls(team)
-                total = getattr(team_stats_cls, total_method)(**filters)
-                rank.append({'stat': total, 'team': team})
+                rank.append({'stat': totals.get(team.pk, 0), 'team': team})
             rank = sorted(rank, key=lambda x: x['stat'], reverse=True)
-            cache.set(cache_str, rank)
+            rank_cache.set(cache_str, rank)
         return rank
 
     def team_stats_rank(self, **filters):
-        return self.team_rank('get_total_stats', **filters)
+        return self.team_rank('STATS', **filters)
 
     def team_races_rank(self, **filters):
-        return self.team_rank('get_total_races', **filters)
+        return self.team_rank('RACES', **filters)
 
     def team_doubles_rank(self, **filters):
-        return self.team_rank('get_doubles_races', **filters)
+        return self.team_rank('DOUBLES', **filters)
 
     def team_olympic_rank(self):
         """ Points team rank. Scoring can be override by scoring_code param """
         cache_str = self.get_name_cache_rank('olympic_team', locals())
-        cache_rank = cache.get(cache_str)
+        cache_rank = rank_cache.get(cache_str)
 
-        if cache_rank:
+        if cache_rank is not None:
             rank = cache_rank
         else:
-            teams = getattr(self, 'teams').all()
-            rank = []
-            for team in teams:
-                stat_cls = self.get_stats_cls(team)
-                position_count_list = stat_cls.get_positions_count_list(**self.stats_filter_kwargs)
-                position_count_str = stat_cls.get_positions_count_str(position_list=position_count_list)
-                rank.append({'pos_str': position_count_str,
-                             'team': team,
-                             'pos_list': position_count_list
-                             })
+            rank = [{'pos_str': entry['pos_str'], 'team': entry['team'], 'pos_list': entry['pos_list']}
+                    for entry in self._team_points_rank()]
             rank = sorted(rank, key=lambda x: x['pos_str'], reverse=True)
-            cache.set(cache_str, rank)
+            rank_cache.set(cache_str, rank)
         return rank
 
     class Meta:
@@ -0,0 +1,149 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .caching import cache_memo, get_cache_version
+from .config import get_config
+from .records import get_record_config
+
+logger = logging.getLogger(__name__)
+
+# ranks rebuilt ahead of time when a result of their scope changes
+RECOMPUTE_RANK_METHODS = ('points_rank', 'team_points_rank', 'olympic_rank', 'team_olympic_rank')
+# kwargs of streak ranks of each record (as stats view)
+STREAK_RANK_KWARGS = ({}, {'max_streak': True}, {'only_actives': True}, {'only_actives': True, 'max_streak': True})
+
+
+def get_rank_model(model_name, pk=None):
+    """ Season, Competition (by pk) or global RankModel. None if it does not exist anymore """
+    from .models import Competition, RankModel, Season
+    if model_name == 'global':
+        return RankModel()
+    model = Season if model_name == 'season' else Competition
+    return model.objects.filter(pk=pk).first()
+
+
+def get_rank_scopes():
+    """ (model_name, pk) of every season, competition and global scope """
+    from .models import Competition, Season
+    scopes = [('season', pk) for pk in Season.objects.order_by('pk').values_list('pk', flat=True)]
+    scopes.extend(('competition', pk) for pk in Competition.objects.order_by('pk').values_list('pk', flat=True))
+    scopes.append(('global', None))
+    return scopes
+
+
+def recompute_rank_model(rank_model, rank_methods=RECOMPUTE_RANK_METHODS):
+    """ Compute and save in cache the ranks of a Season, Competition or RankModel (if they are not yet) """
+    for rank_method in rank_methods:
+        getattr(rank_model, rank_method)()
+
+
+def warm_rank_model(rank_model):
+    """ Points and olympic ranks (as recompute_rank_model), and stats and streak ranks of every record """
+    recompute_rank_model(rank_model)
+    for record_code, record_config in sorted((get_record_config() or {}).items()):
+        record_filter = record_config.get('filter')
+        rank_model.stats_rank(**record_filter)
+        for streak_kwargs in STREAK_RANK_KWARGS:
+            rank_model.streak_rank(**dict(record_filter, **streak_kwargs))
+            rank_model.streak_team_rank(**dict(record_filter, **streak_kwargs))
+
+
+def get_warmed_version_key(cache_scope):
+    return u'driver27_warmed_{cache_scope}'.format(cache_scope=cache_scope)
+
+
+def is_warmed(rank_model):
+    """ Ranks of rank model were warmed with the current version of its scope """
+    cache_scope = rank_model.cache_scope
+    return cache.get(get_warmed_version_key(cache_scope)) == get_cache_version(cache_scope)
+
+
+def warm_scope(scope):
+    """ Warm the ranks of a scope (model_name, pk). Return the seconds or None if it was skipped """
+    model_name, pk, only_changed = scope
+    rank_model = get_rank_model(model_name, pk)
+    if rank_model is None or (only_changed and is_warmed(rank_model)):
+        return None
+    start = time.time()
+    with cache_memo():
+        version = get_cache_version(rank_model.cache_scope)
+        warm_rank_model(rank_model)
+    # the version read before, so a change while warming is warmed again
+    cache.set(get_warmed_version_key(rank_model.cache_scope), version, timeout=None)
+    return time.time() - start
+
+
+class RecomputeQueue(object):
+    """
+    Scopes whose ranks are rebuilt by a background thread, without any broker. A scope queued again before
+    its turn is computed once. The thread waits delay seconds before each run, so a burst of changes
+    (e.g. every result of a race) is coalesced too. By default, delay is read from RECOMPUTE config.
+    """
+
+    def __init__(self, delay=None):
+        self.delay = delay
+        self.pending = OrderedDict()
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def put(self, model_name, pk=None, start_worker=True):
+        with self.condition:
+            self.pending[(model_name, pk)] = True
+            if start_worker:
+                self._start_worker()
+            self.condition.notify()
+
+    def put_season(self, season, start_worker=True):
+        """ Season, its competition and global scope """
+        self.put('season', season.pk, start_worker=start_worker)
+        self.put('competition', season.competition_id, start_worker=start_worker)
+        self.put('global', start_worker=start_worker)
+
+    def _start_worker(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self.run_worker, name='driver27-recompute')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def pop_pending(self):
+        with self.condition:
+            scopes = list(self.pending)
+            self.pending.clear()
+        return scopes
+
+    def run_pending(self):
+        """ Recompute the pending scopes in the calling thread. Return the number of scopes """
+        scopes = self.pop_pending()
+        for model_name, pk in scopes:
+            try:
+                rank_model = get_rank_model(model_name, pk)
+                if rank_model is not None:
+                    recompute_rank_model(rank_model)
+            except Exception:
+                logger.exception('Ranks of %s %s can not be recomputed', model_name, pk)
+        return len(scopes)
+
+    def run_worker(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+            time.sleep(self.delay if self.delay is not None else get_config('RECOMPUTE', 'DELAY'))
+            try:
+                self.run_pending()
+            finally:
+                connection.close()
+
+
+recompute_queue = RecomputeQueue()
+
+
+def schedule_recompute(season):
+    """ Queue the ranks of season (and its competition and global ranks) when the current transaction commits """
+    if get_config('RECOMPUTE', 'ENABLED'):
+        transaction.on_commit(lambda: recompute_queue.put_season(season))
@@ -1,5 +1,9 @@
+from django.db.models import Case, Count, F, IntegerField, Q, Sum, Value, When
+
 from .config import get_config
 
+DEFAULT_RECORDS_LIST = ['RACE', 'POLE', 'WIN', 'PODIUM', 'FASTEST']
+
 
 def get_record_config(record_code=None):
     config = get_config('RECORDS', key=record_code)
@@ -18,3 +22,58 @@ def get_record_label_dict(doubles=False):
     if config:
         return _get_double_records() if doubles else _get_records()
     return None
+
+
+def get_record_aggregation(record_filter, count_races=False):
+    """
+    Count of results that match a record filter (as a CASE expression), to aggregate several records at once.
+    With count_races, only one by race is counted (as get_total_races of teams)
+    """
+    if count_races:
+        race_expression = Case(When(Q(**record_filter), then=F('race_id')), output_field=IntegerField()) \
+            if record_filter else F('race_id')
+        return Count(race_expression, distinct=True)
+    if not record_filter:
+        return Count('pk')
+    return Sum(Case(When(Q(**record_filter), then=Value(1)), default=Value(0), output_field=IntegerField()))
+
+
+class RecordsCounter(object):
+    """ Counts of several records in one query of results, by record code (as get_stats_list) """
+
+    def __init__(self, records, races_records=None):
+        self.records = records
+        self.races_records = races_records or []
+
+    @classmethod
+    def from_records_list(cls, records_list=None, count_races=False):
+        """ Records of RECORDS config. RACE is counted by races if count_races """
+        if records_list is None:
+            records_list = DEFAULT_RECORDS_LIST
+        records = dict((record, get_record_config(record).get('filter')) for record in records_list)
+        return cls(records, races_records=['RACE'] if count_races else None)
+
+    def get_aggregations(self):
+        """ Dict of aggregation alias and (record code, aggregation). Aliases are safe names for SQL """
+        return dict(('record_{index}'.format(index=index),
+                     (record, get_record_aggregation(record_filter, count_races=record in self.races_records)))
+                    for index, (record, record_filter) in enumerate(self.records.items()))
+
+    def count(self, results):
+        """ Dict of count by record code """
+        aggregations = self.get_aggregations()
+        counts = results.order_by().aggregate(**dict((alias, aggregation) for alias, (record, aggregation)
+                                                      in aggregations.items()))
+        return dict((record, counts.get(alias) or 0) for alias, (record, aggregation) in aggregations.items())
+
+    def count_by(self, results, *keys):
+        """ Dict of counts by record code, by the values of keys (or a tuple of values with several keys) """
+        aggregations = self.get_aggregations()
+        rows = results.order_by().values(*keys).annotate(**dict((alias, aggregation) for alias, (record, aggregation)
+                                                                in aggregations.items()))
+        counts_by = {}
+        for row in rows:
+            key = row[keys[0]] if len(keys) == 1 else tuple(row[key] for key in keys)
+            counts_by[key] = dict((record, row.get(alias) or 0) for alias, (record, aggregation)
+                                  in aggregations.items())
+        return counts_by
@@ -0,0 +1,187 @@
+from random import Random
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:  # Python 2 without futures backport: batches are run in process
+    ProcessPoolExecutor = None
+
+from . import LIMIT_POSITION_LIST
+from .clinch import get_best_points
+from .points_calculator import MultiPointsCalculator
+from .standings import Standings
+
+SIMULATION_BATCH_SIZE = 1000
+
+
+class SimulationSnapshot(object):
+    """
+    Plain data of a season to simulate its pending races, without models (it is sent to other processes).
+    Drivers and teams are indexes of lists; the team of a driver is the team of most of its results.
+    """
+
+    def __init__(self, driver_ids, team_ids, driver_teams, points_lists, positions, team_points, team_positions,
+                 weights, pending_races, qualifying_points, fastest_lap_points, rounds=None):
+        self.driver_ids = driver_ids
+        self.team_ids = team_ids
+        self.driver_teams = driver_teams
+        self.points_lists = points_lists
+        self.positions = positions
+        self.team_points = team_points
+        self.team_positions = team_positions
+        self.weights = weights
+        self.pending_races = pending_races
+        self.qualifying_points = qualifying_points
+        self.fastest_lap_points = fastest_lap_points
+        self.rounds = rounds
+
+    @classmethod
+    def from_season(cls, season, punctuation_config=None):
+        """ Snapshot of season standings (one scan of results) and its pending races, with punctuation of season """
+        if punctuation_config is None:
+            punctuation_config = season.get_punctuation_config() or {}
+        standings = Standings(season, punctuation_config=punctuation_config)
+        driver_entries = standings._accumulate('driver_id')
+        team_entries = standings._accumulate('team_id', skip_wildcard=True)
+        results_by_team = {}
+        for row in standings.rows:
+            results_by_team.setdefault(row.driver_id, {}).setdefault(row.team_id, 0)
+            results_by_team[row.driver_id][row.team_id] += 1
+
+        driver_ids = sorted(driver_entries)
+        team_ids = sorted(team_entries)
+        team_index = dict((team_id, index) for index, team_id in enumerate(team_ids))
+        driver_teams = [team_index[max(sorted(results_by_team[driver_id].items()), key=lambda x: x[1])[0]]
+                        for driver_id in driver_ids]
+
+        points_lists = [driver_entries[driver_id].points_by_season.get(season.pk, []) for driver_id in driver_ids]
+        # average of points by race, plus one so drivers without points can score
+        weights = [1.0 + sum(points_list) / float(driver_entries[driver_id].races)
+                   for driver_id, points_list in zip(driver_ids, points_lists)]
+
+        calculator = MultiPointsCalculator({'simulation': punctuation_config})
+        finish_lookup = calculator.finish[0]
+        pending_races = [[points * calculator.points_factor.get(alter_punctuation, 1) for points in finish_lookup]
+                         for alter_punctuation in season.pending_races.order_by('round')
+                         .values_list('alter_punctuation', flat=True)]
+        return cls(driver_ids=driver_ids, team_ids=team_ids, driver_teams=driver_teams, points_lists=points_lists,
+                   positions=[driver_entries[driver_id].positions for driver_id in driver_ids],
+                   team_points=[team_entries[team_id].get_points() for team_id in team_ids],
+                   team_positions=[team_entries[team_id].positions for team_id in team_ids],
+                   weights=weights, pending_races=pending_races, qualifying_points=calculator.qualifying[0],
+                   fastest_lap_points=calculator.fastest_lap[0], rounds=season.rounds)
+
+
+def get_final_positions(points, positions):
+    """ Final position (index) of each item, ordered by points and countback as order_points """
+    order = sorted(range(len(points)), key=lambda index: (points[index], positions[index]), reverse=True)
+    final_positions = [0] * len(points)
+    for position, index in enumerate(order):
+        final_positions[index] = position
+    return final_positions
+
+
+def simulate_batch(args):
+    """
+    Count of final positions of drivers and teams in a batch of simulations. Each pending race is a random
+    order of drivers (Plackett-Luce, weighted by average points); the pole and fastest lap are random too.
+    """
+    snapshot, simulations, seed = args
+    random = Random(seed)
+    num_drivers = len(snapshot.driver_ids)
+    num_teams = len(snapshot.team_ids)
+    inverse_weights = [1.0 / weight for weight in snapshot.weights]
+    driver_counts = [[0] * num_drivers for index in range(num_drivers)]
+    team_counts = [[0] * num_teams for index in range(num_teams)]
+    limit_finish = min(num_drivers, LIMIT_POSITION_LIST)
+
+    for simulation in range(simulations):
+        new_points = [[] for index in range(num_drivers)]
+        positions = [list(driver_positions) for driver_positions in snapshot.positions]
+        team_points = list(snapshot.team_points)
+        team_positions = [list(positions_count) for positions_count in snapshot.team_positions]
+        for finish_points in snapshot.pending_races:
+            keys = [random.random() ** inverse_weight for inverse_weight in inverse_weights]
+            order = sorted(range(num_drivers), key=keys.__getitem__, reverse=True)
+            race_points = [0] * num_drivers
+            for finish, driver in enumerate(order[:len(finish_points) - 1], start=1):
+                race_points[driver] += finish_points[finish]
+            for finish, driver in enumerate(order[:limit_finish]):
+                positions[driver][finish] += 1
+                team_positions[snapshot.driver_teams[driver]][finish] += 1
+            if len(snapshot.qualifying_points) > 1:
+                qualifying_keys = [random.random() ** inverse_weight for inverse_weight in inverse_weights]
+                qualifying_order = sorted(range(num_drivers), key=qualifying_keys.__getitem__, reverse=True)
+                for qualifying, driver in enumerate(qualifying_order[:len(snapshot.qualifying_points) - 1],
+                                                    start=1):
+                    race_points[driver] += snapshot.qualifying_points[qualifying]
+            if snapshot.fastest_lap_points and limit_finish:
+                race_points[order[random.randrange(limit_finish)]] += snapshot.fastest_lap_points
+            for driver, points in enumerate(race_points):
+                if points:
+                    new_points[driver].append(points)
+                    team_points[snapshot.driver_teams[driver]] += points
+
+        points = [get_best_points(points_list + driver_new_points, snapshot.rounds)
+                  for points_list, driver_new_points in zip(snapshot.points_lists, new_points)]
+        for driver, position in enumerate(get_final_positions(points, positions)):
+            driver_counts[driver][position] += 1
+        for team, position in enumerate(get_final_positions(team_points, team_positions)):
+            team_counts[team][position] += 1
+    return driver_counts, team_counts
+
+
+def sum_counts(total_counts, counts):
+    for total_item_counts, item_counts in zip(total_counts, counts):
+        for position, count in enumerate(item_counts):
+            total_item_counts[position] += count
+
+
+class SeasonSimulator(object):
+    """
+    Monte Carlo simulation of the pending races of a season. Simulations are run in batches with consecutive
+    seeds from seed, so results are the same with any number of workers (processes).
+    """
+
+    def __init__(self, snapshot, simulations=10000, seed=0, workers=1):
+        self.snapshot = snapshot
+        self.simulations = simulations
+        self.seed = seed
+        self.workers = workers
+
+    def get_batches(self):
+        batches = []
+        for index, first_simulation in enumerate(range(0, self.simulations, SIMULATION_BATCH_SIZE)):
+            batch_size = min(SIMULATION_BATCH_SIZE, self.simulations - first_simulation)
+            batches.append((self.snapshot, batch_size, self.seed + index))
+        return batches
+
+    def run_batches(self):
+        batches = self.get_batches()
+        if self.workers > 1 and ProcessPoolExecutor is not None and len(batches) > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                return list(executor.map(simulate_batch, batches))
+        return [simulate_batch(batch) for batch in batches]
+
+    def get_probabilities(self, item_ids, counts):
+        probabilities = {}
+        for item_id, item_counts in zip(item_ids, counts):
+            positions = [float(count) / self.simulations if self.simulations else 0.0 for count in item_counts]
+            probabilities[item_id] = {'title': positions[0], 'podium': sum(positions[:3]), 'positions': positions}
+        return probabilities
+
+    def run(self):
+        """ Dict of drivers and teams, with probabilities of title, podium and each position by driver/team id """
+        num_drivers = len(self.snapshot.driver_ids)
+        num_teams = len(self.snapshot.team_ids)
+        driver_counts = [[0] * num_drivers for index in range(num_drivers)]
+        team_counts = [[0] * num_teams for index in range(num_teams)]
+        if self.simulations > 0:
+            for batch_driver_counts, batch_team_counts in self.run_batches():
+                sum_counts(driver_counts, batch_driver_counts)
+                sum_counts(team_counts, batch_team_counts)
+        return {
+            'simulations': self.simulations,
+            'seed': self.seed,
+            'drivers': self.get_probabilities(self.snapshot.driver_ids, driver_counts),
+            'teams': self.get_probabilities(self.snapshot.team_ids, team_counts)
+        }
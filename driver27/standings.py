@@ -0,0 +1,562 @@
+import threading
+from collections import namedtuple
+
+from django.db import models, transaction
+from django.db.models import Q
+from django.utils.translation import ugettext as _
+
+from . import LIMIT_POSITION_LIST
+from .points_calculator import MultiPointsCalculator, PointsCalculator
+
+StandingsRow = namedtuple('StandingsRow',
+                          'driver_id team_id season_id season_rounds qualifying finish fastest_lap wildcard '
+                          'alter_punctuation points')
+
+STANDINGS_FIELDS = ('seat__driver_id', 'seat__team_id', 'race__season_id', 'race__season__rounds',
+                    'qualifying', 'finish', 'seat_id', 'race__fastest_car_id', 'wildcard',
+                    'race__alter_punctuation', 'points')
+
+
+def get_positions_count_str(position_list):
+    """ Same format of AbstractStreakModel.get_positions_count_str, e.g. 1 => 001, 12 => 012 """
+    return ''.join([str(x).zfill(3) for x in position_list])
+
+
+def get_positions_count_list(positions_count_str):
+    """ Inverse of get_positions_count_str """
+    if not positions_count_str:
+        return [0] * LIMIT_POSITION_LIST
+    return [int(positions_count_str[index:index + 3]) for index in range(0, len(positions_count_str), 3)]
+
+
+class StandingsEntry(object):
+    """ Accumulator of points, finish positions and counters of a driver or a team """
+    __slots__ = ('points_by_season', 'positions', 'teams', 'races', 'poles', 'fastest_laps')
+
+    def __init__(self):
+        self.points_by_season = {}
+        self.positions = [0] * LIMIT_POSITION_LIST
+        self.teams = set()
+        self.races = 0
+        self.poles = 0
+        self.fastest_laps = 0
+
+    def add(self, row, points):
+        if points:
+            self.points_by_season.setdefault(row.season_id, []).append(points)
+        if row.finish and 0 < row.finish <= LIMIT_POSITION_LIST:
+            self.positions[row.finish - 1] += 1
+        self.teams.add(row.team_id)
+        self.races += 1
+        if row.qualifying == 1:
+            self.poles += 1
+        if row.fastest_lap:
+            self.fastest_laps += 1
+
+    def get_points(self, season_rounds=None):
+        return sum_points_by_season(self.points_by_season, season_rounds)
+
+
+def sum_points_by_season(points_by_season, season_rounds=None):
+    """ Only the best results of each season are counted, if season has rounds (as ContenderSeason) """
+    points = 0
+    for season_id, points_list in points_by_season.items():
+        rounds = season_rounds.get(season_id) if season_rounds else None
+        if rounds:
+            points_list = sorted(points_list, reverse=True)[:rounds]
+        points += sum(points_list)
+    return points
+
+
+def accumulate_rows(rows, key, punctuation_config=None, skip_wildcard=False):
+    """ Dict with an StandingsEntry by driver_id or team_id """
+    entries = {}
+    calculator = PointsCalculator(punctuation_config) if punctuation_config is not None else None
+    for row in rows:
+        entry = entries.get(getattr(row, key))
+        if entry is None:
+            entry = entries[getattr(row, key)] = StandingsEntry()
+        if calculator is not None:
+            points = calculator.calculator(row, skip_wildcard=skip_wildcard)
+        elif skip_wildcard and row.wildcard:
+            points = None
+        else:
+            points = row.points
+        entry.add(row, points)
+    return entries
+
+
+class AbstractStandingsModel(models.Model):
+    """
+    Standings of a driver or a team in a season, saved in DB.
+    They are refreshed when a result of season changes (see refresh_season_standings)
+    """
+    points = models.IntegerField(default=0, editable=False, verbose_name=_('points'))
+    pos_str = models.CharField(max_length=3 * LIMIT_POSITION_LIST, blank=True, default='', editable=False,
+                               verbose_name=_('positions'))
+    races = models.IntegerField(default=0, editable=False, verbose_name=_('races'))
+    wins = models.IntegerField(default=0, editable=False, verbose_name=_('wins'))
+    poles = models.IntegerField(default=0, editable=False, verbose_name=_('poles'))
+    fastest_laps = models.IntegerField(default=0, editable=False, verbose_name=_('fastest laps'))
+
+    @property
+    def pos_list(self):
+        return get_positions_count_list(self.pos_str)
+
+    @staticmethod
+    def get_standings_fields(entry, season_rounds=None):
+        if entry is None:
+            entry = StandingsEntry()
+        return {
+            'points': entry.get_points(season_rounds),
+            'pos_str': get_positions_count_str(entry.positions),
+            'races': entry.races,
+            'wins': entry.positions[0],
+            'poles': entry.poles,
+            'fastest_laps': entry.fastest_laps
+        }
+
+    class Meta:
+        abstract = True
+
+
+def get_season_teams_verbose(season, entries):
+    """ Teams of each driver in season, with sponsor_name if exists (as ContenderSeason.teams_verbose) """
+    from .models import TeamSeason
+    team_names = dict((team.pk, team.name) for team in season.teams)
+    sponsor_names = TeamSeason.objects.filter(season=season, sponsor_name__isnull=False) \
+        .exclude(sponsor_name='').values_list('team_id', 'sponsor_name')
+    verbose_names = dict(team_names)
+    verbose_names.update(sponsor_names)
+    teams_verbose = {}
+    for driver_id, entry in entries.items():
+        teams = sorted(entry.teams, key=lambda team_id: team_names[team_id])
+        teams_verbose[driver_id] = ', '.join([verbose_names[team_id] for team_id in teams])
+    return teams_verbose
+
+
+class Standings(object):
+    """
+    Driver and team standings of a rank model (season, competition or global) computed in one pass.
+    Results of the scope are loaded once as a flat projection, instead of one stats class by contender.
+    """
+
+    def __init__(self, rank_model, punctuation_config=None):
+        self.rank_model = rank_model
+        self.punctuation_config = punctuation_config
+        self.filter_kwargs = rank_model.stats_filter_kwargs
+        self.season = self.filter_kwargs.get('season')
+        self._rows = None
+
+    def get_results(self):
+        from .models import Result
+        return Result.wizard(**self.filter_kwargs).order_by()
+
+    @staticmethod
+    def get_row(values):
+        (driver_id, team_id, season_id, season_rounds, qualifying, finish,
+         seat_id, fastest_car_id, wildcard, alter_punctuation, points) = values
+        return StandingsRow(driver_id=driver_id, team_id=team_id, season_id=season_id, season_rounds=season_rounds,
+                            qualifying=qualifying, finish=finish, fastest_lap=seat_id == fastest_car_id,
+                            wildcard=wildcard, alter_punctuation=alter_punctuation, points=points)
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            results = self.get_results().values_list(*STANDINGS_FIELDS)
+            self._rows = [self.get_row(values) for values in results]
+        return self._rows
+
+    def _accumulate(self, key, skip_wildcard=False):
+        return accumulate_rows(self.rows, key, punctuation_config=self.punctuation_config,
+                               skip_wildcard=skip_wildcard)
+
+    def _summary_season(self):
+        if self.season is None:
+            return {}
+        return {'season': self.season, 'competition': self.season.competition, 'year': self.season.year}
+
+    def _season_teams_verbose(self, entries):
+        return get_season_teams_verbose(self.season, entries)
+
+    def _teams_verbose(self, drivers):
+        """ All teams of driver (as Driver.teams_verbose) """
+        from .models import Seat
+        seats = Seat.objects.filter(driver__in=drivers).order_by('team__name').values_list('driver_id', 'team__name')
+        teams_by_driver = {}
+        for driver_id, team_name in seats:
+            teams_by_driver.setdefault(driver_id, []).append(team_name)
+        return dict((driver_id, ', '.join(team_names)) for driver_id, team_names in teams_by_driver.items())
+
+    def teams_verbose(self):
+        """ Dict of teams_verbose by driver pk, without scoring the results """
+        if self.season is None:
+            return self._teams_verbose(self.rank_model.drivers.all())
+        entries = {}
+        for row in self.rows:
+            entries.setdefault(row.driver_id, StandingsEntry()).teams.add(row.team_id)
+        return self._season_teams_verbose(entries)
+
+    def driver_rank(self):
+        """ Unordered entries of points rank, one by driver of rank model """
+        entries = self._accumulate('driver_id')
+        season_rounds = dict((row.season_id, row.season_rounds) for row in self.rows)
+        drivers = self.rank_model.drivers.all()
+        if self.season is not None:
+            teams_verbose = self._season_teams_verbose(entries)
+        else:
+            teams_verbose = self._teams_verbose(drivers)
+        summary_season = self._summary_season()
+        rank = []
+        for driver in drivers:
+            entry = entries.get(driver.pk) or StandingsEntry()
+            summary_points = dict(summary_season)
+            summary_points.update(
+                teams=teams_verbose.get(driver.pk, ''),
+                points=entry.get_points(season_rounds),
+                pos_list=entry.positions,
+                pos_str=get_positions_count_str(entry.positions),
+                driver=driver
+            )
+            rank.append(summary_points)
+        return rank
+
+    def team_rank(self):
+        """ Unordered entries of team points rank, one by team of rank model. Wildcard results are not counted """
+        entries = self._accumulate('team_id', skip_wildcard=True)
+        summary_season = self._summary_season()
+        rank = []
+        for team in self.rank_model.teams.all():
+            entry = entries.get(team.pk) or StandingsEntry()
+            summary_points = dict(summary_season)
+            summary_points.update(
+                points=entry.get_points(),
+                pos_list=entry.positions,
+                pos_str=get_positions_count_str(entry.positions),
+                team=team
+            )
+            rank.append(summary_points)
+        return rank
+
+
+class ComparedStandings(Standings):
+    """
+    Driver and team standings of a rank model with several punctuation configs side by side.
+    Results are loaded once and each one is scored with all configs (see MultiPointsCalculator).
+    """
+
+    def __init__(self, rank_model, punctuation_configs):
+        super(ComparedStandings, self).__init__(rank_model, punctuation_config=None)
+        self.calculator = MultiPointsCalculator(punctuation_configs)
+
+    @property
+    def codes(self):
+        return self.calculator.codes
+
+    def _accumulate_compared(self, key, skip_wildcard=False):
+        """ Dict with an StandingsEntry and the points by season of each code, by driver_id or team_id """
+        entries = {}
+        for row in self.rows:
+            item_id = getattr(row, key)
+            if item_id not in entries:
+                entries[item_id] = (StandingsEntry(), [{} for code in self.codes])
+            entry, points_by_code = entries[item_id]
+            entry.add(row, None)
+            for points_by_season, points in zip(points_by_code, self.calculator.calculator(row, skip_wildcard)):
+                if points:
+                    points_by_season.setdefault(row.season_id, []).append(points)
+        return entries
+
+    def _set_positions(self, rank):
+        """ Position of each entry with each code, ordered as order_points """
+        for code in self.codes:
+            ordered_rank = sorted(rank, key=lambda x: (x['points'][code], x['pos_str']), reverse=True)
+            for position, entry in enumerate(ordered_rank, start=1):
+                entry['positions'][code] = position
+        return rank
+
+    def _compared_rank(self, element_name, items, entries, season_rounds=None, extra_info=None):
+        summary_season = self._summary_season()
+        rank = []
+        for item in items:
+            entry, points_by_code = entries.get(item.pk) or (StandingsEntry(), [{} for code in self.codes])
+            summary_points = dict(summary_season)
+            summary_points.update(
+                points=dict((code, sum_points_by_season(points_by_season, season_rounds))
+                            for code, points_by_season in zip(self.codes, points_by_code)),
+                positions={},
+                pos_list=entry.positions,
+                pos_str=get_positions_count_str(entry.positions)
+            )
+            summary_points[element_name] = item
+            if extra_info is not None:
+                summary_points.update(extra_info(item))
+            rank.append(summary_points)
+        return self._set_positions(rank)
+
+    def driver_rank(self):
+        """ Entries of drivers, with points and position by punctuation code """
+        entries = self._accumulate_compared('driver_id')
+        season_rounds = dict((row.season_id, row.season_rounds) for row in self.rows)
+        drivers = self.rank_model.drivers.all()
+        if self.season is not None:
+            teams_verbose = self._season_teams_verbose(dict((driver_id, entry) for driver_id, (entry, points)
+                                                            in entries.items()))
+        else:
+            teams_verbose = self._teams_verbose(drivers)
+        return self._compared_rank('driver', drivers, entries, season_rounds=season_rounds,
+                                   extra_info=lambda driver: {'teams': teams_verbose.get(driver.pk, '')})
+
+    def team_rank(self):
+        """ Entries of teams, with points and position by punctuation code. Wildcard results are not counted """
+        entries = self._accumulate_compared('team_id', skip_wildcard=True)
+        return self._compared_rank('team', self.rank_model.teams.all(), entries)
+
+
+class StandingsProgression(object):
+    """
+    Cumulative points and position of every driver (or team) of a season after each round, from one scan
+    of the results ordered by round. Points follow the rules of standings: best results only if season
+    has rounds (for drivers) and wildcard results are not counted for teams.
+    """
+
+    def __init__(self, season, key='driver_id', punctuation_config=None):
+        self.season = season
+        self.key = key
+        self.skip_wildcard = key == 'team_id'
+        self.season_rounds = None if self.skip_wildcard else {season.pk: season.rounds}
+        self.calculator = PointsCalculator(punctuation_config) if punctuation_config is not None else None
+
+    def get_rows_by_round(self):
+        """ List of (round, rows of round), ordered by round """
+        from .models import Result
+        results = Result.objects.filter(race__season=self.season).order_by('race__round') \
+            .values_list('race__round', *STANDINGS_FIELDS)
+        rows_by_round = []
+        for values in results:
+            if not rows_by_round or rows_by_round[-1][0] != values[0]:
+                rows_by_round.append((values[0], []))
+            rows_by_round[-1][1].append(Standings.get_row(values[1:]))
+        return rows_by_round
+
+    def get_row_points(self, row):
+        if self.calculator is not None:
+            return self.calculator.calculator(row, skip_wildcard=self.skip_wildcard)
+        if self.skip_wildcard and row.wildcard:
+            return None
+        return row.points
+
+    def run(self):
+        """ Rounds and a dict of (list of points, list of positions) by driver_id or team_id, one item by round """
+        rows_by_round = self.get_rows_by_round()
+        entries = {}
+        for race_round, rows in rows_by_round:
+            for row in rows:
+                entries.setdefault(getattr(row, self.key), StandingsEntry())
+        progression = dict((item_id, ([], [])) for item_id in entries)
+        for race_round, rows in rows_by_round:
+            for row in rows:
+                entries[getattr(row, self.key)].add(row, self.get_row_points(row))
+            round_points = dict((item_id, entry.get_points(self.season_rounds)) for item_id, entry in entries.items())
+            ordered_items = sorted(entries, key=lambda item_id: (round_points[item_id],
+                                                                 get_positions_count_str(entries[item_id].positions)),
+                                   reverse=True)
+            for position, item_id in enumerate(ordered_items, start=1):
+                points_list, positions = progression[item_id]
+                points_list.append(round_points[item_id])
+                positions.append(position)
+        return [race_round for race_round, rows in rows_by_round], progression
+
+
+def get_season_rows(season, driver_ids=None, team_ids=None):
+    """ Rows of results of season. They can be restricted to results of some drivers or teams """
+    from .models import Result
+    results = Result.objects.filter(race__season=season)
+    if driver_ids is not None or team_ids is not None:
+        results = results.filter(Q(seat__driver_id__in=driver_ids or []) | Q(seat__team_id__in=team_ids or []))
+    return [Standings.get_row(values) for values in results.order_by().values_list(*STANDINGS_FIELDS)]
+
+
+def refresh_season_standings(season, driver_ids=None, team_ids=None):
+    """
+    Save the standings of drivers (DriverSeason) and teams (TeamSeason) of season from its results.
+    With driver_ids or team_ids, only their rows are refreshed, reading only their results. In that case,
+    a season without saved standings yet is saved whole.
+    """
+    from .models import DriverSeason, TeamSeason
+    partial = driver_ids is not None or team_ids is not None
+    if partial and not DriverSeason.objects.filter(season=season).exists():
+        driver_ids = team_ids = None
+        partial = False
+    rows = get_season_rows(season, driver_ids=driver_ids, team_ids=team_ids)
+    driver_entries = accumulate_rows(rows, 'driver_id')
+    team_entries = accumulate_rows(rows, 'team_id', skip_wildcard=True)
+    season_rounds = {season.pk: season.rounds}
+    if partial:
+        driver_ids = set(driver_ids or [])
+        team_ids = set(team_ids or [])
+    else:
+        driver_ids = set(driver_entries)
+        team_ids = set(team_entries)
+        team_ids.update(TeamSeason.objects.filter(season=season).values_list('team_id', flat=True))
+    teams_verbose = get_season_teams_verbose(season, dict((driver_id, entry) for driver_id, entry
+                                                          in driver_entries.items() if driver_id in driver_ids))
+
+    with transaction.atomic():
+        if partial:
+            DriverSeason.objects.filter(season=season, driver_id__in=driver_ids) \
+                .exclude(driver_id__in=driver_entries.keys()).delete()
+        else:
+            DriverSeason.objects.filter(season=season).delete()
+        driver_seasons = []
+        for driver_id in driver_ids:
+            entry = driver_entries.get(driver_id)
+            if entry is None:
+                continue
+            standings_fields = DriverSeason.get_standings_fields(entry, season_rounds)
+            standings_fields['teams'] = teams_verbose.get(driver_id, '')
+            if partial:
+                DriverSeason.objects.update_or_create(season=season, driver_id=driver_id, defaults=standings_fields)
+            else:
+                driver_seasons.append(DriverSeason(season=season, driver_id=driver_id, **standings_fields))
+        DriverSeason.objects.bulk_create(driver_seasons)
+
+        for team_id in team_ids:
+            standings_fields = TeamSeason.get_standings_fields(team_entries.get(team_id))
+            updated = TeamSeason.objects.filter(season=season, team_id=team_id).update(**standings_fields)
+            if not updated and team_id in team_entries:
+                TeamSeason.objects.create(season=season, team_id=team_id, **standings_fields)
+
+
+def get_seasons_without_standings():
+    """ Seasons with results but without saved standings (e.g. results saved before standings were saved) """
+    from .models import DriverSeason, Season
+    return Season.objects.filter(races__results__isnull=False) \
+        .exclude(pk__in=DriverSeason.objects.values('season_id')).distinct()
+
+
+class PendingStandings(object):
+    """
+    Seasons of results deleted without Result.delete (querysets and cascades of races, seats or drivers).
+    Their standings are refreshed once when the transaction commits, after every object is deleted
+    (a cascade can delete the season too). Inside a write batch, they are refreshed by the batch.
+    """
+
+    def __init__(self):
+        self.season_ids = set()
+        self.race_seasons = {}
+
+    def add_result(self, result):
+        from .batch import get_write_batch
+        from .models import Race, Season
+        write_batch = get_write_batch()
+        if write_batch is not None:
+            season = Season.objects.filter(races=result.race_id).first()
+            if season is not None:
+                write_batch.add_season(season)
+            return
+        if result.race_id not in self.race_seasons:
+            self.race_seasons[result.race_id] = Race.objects.filter(pk=result.race_id) \
+                .values_list('season_id', flat=True).first()
+        self.season_ids.add(self.race_seasons[result.race_id])
+        # callbacks of a rolled back transaction are discarded, so the refresh is registered with each result
+        transaction.on_commit(self.refresh)
+
+    def refresh(self):
+        from .models import Season
+        season_ids = self.season_ids
+        self.season_ids = set()
+        self.race_seasons = {}
+        for season in Season.objects.filter(pk__in=season_ids).select_related('competition'):
+            refresh_season_standings(season)
+            season.invalidate_cache()
+
+
+_pending_local = threading.local()
+
+
+def get_pending_standings():
+    """ Pending standings of the current thread """
+    if getattr(_pending_local, 'standings', None) is None:
+        _pending_local.standings = PendingStandings()
+    return _pending_local.standings
+
+
+class SavedStandings(Standings):
+    """
+    Standings read from the saved standings of seasons (DriverSeason and TeamSeason), with the saved points
+    of results. A season is read in a query of its drivers (or teams); competition and global ranks sum them.
+    """
+
+    def __init__(self, rank_model):
+        super(SavedStandings, self).__init__(rank_model, punctuation_config=None)
+
+    def get_seasons(self):
+        from .models import Season
+        if self.season is not None:
+            return Season.objects.filter(pk=self.season.pk)
+        return Season.objects.filter(**self.filter_kwargs)
+
+    def get_saved_rows(self, standings_model):
+        if self.season is not None:
+            return standings_model.objects.filter(season=self.season)
+        return standings_model.objects.filter(season__in=self.get_seasons())
+
+    @staticmethod
+    def _sum_saved_rows(saved_rows, key):
+        """ Dict with points and pos_list of each driver or team, summing its seasons """
+        totals = {}
+        for item_id, points, pos_str in saved_rows.values_list(key, 'points', 'pos_str'):
+            total_points, pos_list = totals.get(item_id, (0, [0] * LIMIT_POSITION_LIST))
+            pos_list = [total + count for total, count in zip(pos_list, get_positions_count_list(pos_str))]
+            totals[item_id] = (total_points + points, pos_list)
+        return totals
+
+    def _get_rank(self, element_name, items, totals, extra_info=None):
+        summary_season = self._summary_season()
+        rank = []
+        for item in items:
+            points, pos_list = totals.get(item.pk, (0, [0] * LIMIT_POSITION_LIST))
+            summary_points = dict(summary_season)
+            summary_points.update(points=points, pos_list=pos_list, pos_str=get_positions_count_str(pos_list))
+            summary_points[element_name] = item
+            if extra_info is not None:
+                summary_points.update(extra_info(item))
+            rank.append(summary_points)
+        return rank
+
+    def teams_verbose(self):
+        from .models import DriverSeason
+        if self.season is None:
+            return self._teams_verbose(self.rank_model.drivers.all())
+        return dict(self.get_saved_rows(DriverSeason).values_list('driver_id', 'teams'))
+
+    def driver_rank(self):
+        from .models import DriverSeason
+        driver_seasons = self.get_saved_rows(DriverSeason)
+        if self.season is not None:
+            driver_seasons = driver_seasons.select_related('driver').order_by('driver__last_name',
+                                                                               'driver__first_name')
+            totals = dict((driver_season.driver_id, (driver_season.points, driver_season.pos_list))
+                          for driver_season in driver_seasons)
+            teams_verbose = dict((driver_season.driver_id, driver_season.teams) for driver_season in driver_seasons)
+            drivers = [driver_season.driver for driver_season in driver_seasons]
+        else:
+            totals = self._sum_saved_rows(driver_seasons, 'driver_id')
+            drivers = self.rank_model.drivers.all()
+            teams_verbose = self._teams_verbose(drivers)
+        return self._get_rank('driver', drivers, totals,
+                              extra_info=lambda driver: {'teams': teams_verbose.get(driver.pk, '')})
+
+    def team_rank(self):
+        from .models import TeamSeason
+        team_seasons = self.get_saved_rows(TeamSeason)
+        if self.season is not None:
+            team_seasons = team_seasons.filter(races__gt=0).select_related('team').order_by('team__name')
+            totals = dict((team_season.team_id, (team_season.points, team_season.pos_list))
+                          for team_season in team_seasons)
+            teams = [team_season.team for team_season in team_seasons]
+        else:
+            totals = self._sum_saved_rows(team_seasons, 'team_id')
+            teams = self.rank_model.teams.all()
+        return self._get_rank('team', teams, totals)
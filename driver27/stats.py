@@ -1,7 +1,7 @@
 from .streak import Streak
 from django.core.exceptions import ValidationError
 from django.db import models
-from .records import get_record_config
+from .records import RecordsCounter
 from . import LIMIT_POSITION_LIST
 
 
@@ -17,11 +17,11 @@ class AbstractStreakModel(object):
         raise NotImplementedError('Not implemented property')
 
     def get_streak(self, max_streak=False, result_filter=None, unique_by_race=False, **filters):
-        from .models import get_tuples_from_results
+        from .models import iter_tuples_from_results
         if not result_filter:
             result_filter = {}
         results = self.get_reverse_results(**result_filter)
-        results_tuples = get_tuples_from_results(results=results)
+        results_tuples = iter_tuples_from_results(results=results)
         return Streak(results=results_tuples, max_streak=max_streak, unique_by_race=unique_by_race).run(filters)
 
     def get_positions(self, qualifying=False, limit_races=None, competition=None, **kwargs):
@@ -76,17 +76,16 @@ class AbstractStatsModel(models.Model):
         except ValidationError:
             return None
 
+    def get_records_counter(self, records_list=None):
+        """ Counter of records. Teams count RACE by races (as get_total_races) """
+        return RecordsCounter.from_records_list(records_list, count_races=hasattr(self, 'get_total_races'))
+
     def get_stats_list(self, records_list=None, append_points=False, **kwargs):
-        multiple_records = {}
-        if records_list is None:
-            records_list = ['RACE', 'POLE', 'WIN', 'PODIUM', 'FASTEST']
-        for record in records_list:
-            record_config = get_record_config(record).get('filter')
-            if hasattr(self, 'get_total_races') and record == 'RACE':
-                record_stat = self.get_total_races(**dict(kwargs, **record_config))
-            else:
-                record_stat = self.get_stats(**dict(kwargs, **record_config))
-            multiple_records[record] = record_stat
+        """ Dict of records (all of them counted in one query). records_stats can be counted before (e.g. by season) """
+        records_stats = kwargs.pop('records_stats', None)
+        if records_stats is None:
+            records_stats = self.get_records_counter(records_list).count(self.get_results(**kwargs))
+        multiple_records = dict(records_stats)
         if append_points:
             multiple_records['POINTS'] = self.get_points(**kwargs)
         return multiple_records
@@ -159,19 +158,25 @@ class StatsByCompetitionModel(AbstractStatsModel, AbstractStreakModel):
 
         kwargs.pop('season', None)
         seasons = getattr(self, 'seasons').all()
+        records_by_season = self.get_records_counter(records_list) \
+            .count_by(self.get_results(**kwargs), 'race__season_id')
         return [self.season_stats_cls(season=season) \
-                    .get_summary_stats(records_list=records_list, append_points=append_points, **kwargs)
+                    .get_summary_stats(records_list=records_list, append_points=append_points,
+                                       records_stats=records_by_season.get(season.pk), **kwargs)
                 for season in seasons]
 
 
     def get_stats_by_competition(self, records_list=None, append_points=False, **kwargs):
         competitions = getattr(self, 'competitions').all()
+        records_by_competition = self.get_records_counter(records_list) \
+            .count_by(self.get_results(**kwargs), 'race__season__competition_id')
         return [
             {
                 'competition': competition,
                 'stats': self.get_stats_list(records_list=records_list,
                                              append_points=append_points,
-                                             competition=competition, **kwargs)
+                                             competition=competition,
+                                             records_stats=records_by_competition.get(competition.pk), **kwargs)
             }
             for competition in competitions
         ]
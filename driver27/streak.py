@@ -1,10 +1,14 @@
-from operator import le, ge, eq, lt, gt
+from collections import OrderedDict, namedtuple
+from operator import attrgetter, le, ge, eq, lt, gt
 import re
 from django.db.models import F
 
+StreakRow = namedtuple('StreakRow', 'driver_id team_id race_id qualifying finish fastest_lap wildcard retired points '
+                                    'year round alter_punctuation')
 
-def build_dict(seq, key):
-    return dict((d[key], dict(d, index=index)) for (index, d) in enumerate(seq))
+STREAK_FIELDS = ('seat__driver_id', 'seat__team_id', 'race_id', 'qualifying', 'finish', 'seat_id',
+                 'race__fastest_car_id', 'wildcard', 'retired', 'points', 'race__season__year', 'race__round',
+                 'race__alter_punctuation')
 
 
 class Streak(object):
@@ -65,61 +69,59 @@ class Streak(object):
 
 
     @classmethod
-    def exec_comparison(cls, result, filter_list, filter_value):
+    def compile_filter(cls, curr_filter, filter_value):
+        """ Tuple of getter of result attribute, comparison function and getter of compared value """
+        filter_list = cls.split_filter(curr_filter)
         comparison_key = 'eq'
         if cls.exists_comparison(filter_list):
             comparison_key = cls.get_comparison_item(filter_list)
             filter_list.pop(cls.get_comparison_position(filter_list))
         filter_key = '.'.join(filter_list)
         filter_key, filter_value = cls.convert_filter(filter_key, filter_value)
-        result_attr = getattr(result, filter_key)
         if isinstance(filter_value, F):
-            filter_value = filter_value.name
-            filter_value = getattr(result, filter_value)
-        builtin_function = cls.get_builtin_function(comparison_key)
-        return builtin_function(result_attr, filter_value) if builtin_function else False
+            value_getter = attrgetter(filter_value.name)
+        else:
+            value_getter = lambda result, value=filter_value: value
+        return attrgetter(filter_key), cls.get_builtin_function(comparison_key), value_getter
+
+    @classmethod
+    def compile_filters(cls, filters):
+        """
+        Predicate of a dict of filters (as RECORDS filters), e.g. {'finish__lt': F('qualifying')}.
+        Filter keys are parsed only once. As in a queryset, None is not lower or greater than any value.
+        """
+        compiled_filters = [cls.compile_filter(curr_filter, filter_value)
+                            for curr_filter, filter_value in filters.items()]
+
+        def predicate(result):
+            for getter, builtin_function, value_getter in compiled_filters:
+                result_attr = getter(result)
+                filter_value = value_getter(result)
+                if builtin_function is not eq and (result_attr is None or filter_value is None):
+                    return False
+                if not builtin_function(result_attr, filter_value):
+                    return False
+            return True
+        return predicate
 
     @classmethod
     def checked_filters(cls, result, filters):
-        passed_filter = True  # until is a false condition, filter is passed
-        for curr_filter in filters:
-            filter_value = filters[curr_filter]
-            filter_list = cls.split_filter(curr_filter)
-            comparison_result = cls.exec_comparison(result, filter_list, filter_value)
-            if not comparison_result:
-                passed_filter = False
-                break
-        return passed_filter
+        return cls.compile_filters(filters)(result)
 
     def get_results_by_race(self):
-        results_by_race = []
-        race_order = 0
+        """ Results grouped by race, in order of the first result of each race """
+        results_by_race = OrderedDict()
         for result in self.results:
-            race_str = 'race_{id}'.format(id=result.race_id)
-
-            race_indexes = build_dict(results_by_race, key="race_id")
-            if race_str not in race_indexes:
-                results_by_race.append(
-                    {
-                        'race_id': race_str,
-                        'order': race_order,
-                        'results': []
-                    }
-                )
-
-                race_order += 1
-                results_by_race[-1]['results'].append(result)
-            else:
-                race_index = race_indexes[race_str]['index']
-                results_by_race[race_index]['results'].append(result)
-        return sorted(results_by_race, key=lambda x: x['order'])
+            results_by_race.setdefault(result.race_id, []).append(result)
+        return list(results_by_race.values())
 
     def run_unique_by_race(self, filters):
+        predicate = self.compile_filters(filters)
         results_by_race = self.get_results_by_race()
         count = 0
         max_count = 0
         for race_results in results_by_race:
-            is_ok = any([self.checked_filters(result, filters) for result in race_results['results']])
+            is_ok = any(predicate(result) for result in race_results)
             if not is_ok:
                 if self.max_streak:
                     count = 0
@@ -134,10 +136,11 @@ class Streak(object):
     def run(self, filters):
         if self.unique_by_race:
             return self.run_unique_by_race(filters)
+        predicate = self.compile_filters(filters)
         count = 0
         max_count = 0
         for result in self.results:
-            is_ok = self.checked_filters(result, filters)
+            is_ok = predicate(result)
 
             if not is_ok:
                 if self.max_streak:
@@ -150,3 +153,54 @@ class Streak(object):
             if self.max_streak and count > max_count:
                 max_count = count
         return max_count if self.max_streak else count
+
+
+class StreakMatrix(object):
+    """
+    Current and max streaks of every driver (or team) for several records, reading the results once
+    in chronological order. The current streak is the last run of races with the record, as Streak.run
+    with reverse results; a team gets the record in a race if any of its drivers gets it (unique_by_race).
+    """
+
+    def __init__(self, results, key='driver_id'):
+        self.results = results
+        self.key = key
+
+    @staticmethod
+    def get_row(values):
+        (driver_id, team_id, race_id, qualifying, finish, seat_id, fastest_car_id, wildcard, retired, points,
+         year, race_round, alter_punctuation) = values
+        return StreakRow(driver_id=driver_id, team_id=team_id, race_id=race_id, qualifying=qualifying,
+                         finish=finish, fastest_lap=seat_id == fastest_car_id, wildcard=wildcard, retired=retired,
+                         points=points, year=year, round=race_round, alter_punctuation=alter_punctuation)
+
+    def get_rows_by_race(self):
+        """ Rows of each race grouped by driver or team, as a dict """
+        rows_by_race = None
+        race_id = None
+        for values in self.results.values_list(*STREAK_FIELDS).iterator():
+            row = self.get_row(values)
+            if row.race_id != race_id:
+                if rows_by_race:
+                    yield rows_by_race
+                rows_by_race = OrderedDict()
+                race_id = row.race_id
+            rows_by_race.setdefault(getattr(row, self.key), []).append(row)
+        if rows_by_race:
+            yield rows_by_race
+
+    def run(self, records):
+        """ Dict of records (code => filters) with a dict of (current streak, max streak) by driver or team """
+        predicates = dict((code, Streak.compile_filters(filters)) for code, filters in records.items())
+        streaks = dict((code, {}) for code in records)
+        for rows_by_race in self.get_rows_by_race():
+            for item_id, rows in rows_by_race.items():
+                for code, predicate in predicates.items():
+                    count, max_count = streaks[code].get(item_id, (0, 0))
+                    if any(predicate(row) for row in rows):
+                        count += 1
+                        max_count = max(count, max_count)
+                    else:
+                        count = 0
+                    streaks[code][item_id] = (count, max_count)
+        return streaks
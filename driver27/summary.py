@@ -0,0 +1,96 @@
+from .caching import rank_cache
+from .clinch import ClinchSolver
+from .standings import STANDINGS_FIELDS, Standings, accumulate_rows
+
+
+def get_leader(season, rows, element_name):
+    """ Rank entry of the first row by points and positions count (as order_points, first of rows wins a tie) """
+    leader = None
+    for row in rows:
+        if leader is None or (row.points, row.pos_str) > (leader.points, leader.pos_str):
+            leader = row
+    return get_rank_entry(season, leader, element_name) if leader is not None else None
+
+
+def get_rank_entry(season, standings_row, element_name):
+    """ Entry of points rank of season from a DriverSeason or TeamSeason (as SavedStandings) """
+    entry = {'season': season, 'competition': season.competition, 'year': season.year,
+             'points': standings_row.points, 'pos_list': standings_row.pos_list, 'pos_str': standings_row.pos_str}
+    entry[element_name] = getattr(standings_row, element_name)
+    if element_name == 'driver':
+        entry['teams'] = standings_row.teams
+    return entry
+
+
+def get_has_champion_cache_key(season):
+    """ Cache key of the champion status of season, in the cache scope of season """
+    return season.get_name_cache_rank('has_champion', {'punctuation': season.punctuation, 'rounds': season.rounds})
+
+
+def get_seasons_has_champion(seasons):
+    """
+    Dict of champion status by season pk. It is cached in the scope of each season, so results and pending races
+    are only read for the seasons changed since the status was computed.
+    """
+    from .models import Race, Result
+    cache_keys = dict((season.pk, get_has_champion_cache_key(season)) for season in seasons)
+    has_champion = {}
+    for season_pk, cache_key in cache_keys.items():
+        cache_has_champion = rank_cache.get(cache_key)
+        if cache_has_champion is not None:
+            has_champion[season_pk] = cache_has_champion
+    season_ids = [season.pk for season in seasons if season.pk not in has_champion]
+    if not season_ids:
+        return has_champion
+
+    rows_by_season = {}
+    for values in Result.objects.filter(race__season__in=season_ids).order_by().values_list(*STANDINGS_FIELDS):
+        row = Standings.get_row(values)
+        rows_by_season.setdefault(row.season_id, []).append(row)
+    pending_races = {}
+    for season_id, race_round, alter_punctuation in Race.objects.filter(season__in=season_ids,
+                                                                        results__isnull=True) \
+            .order_by('round').values_list('season_id', 'round', 'alter_punctuation').distinct():
+        pending_races.setdefault(season_id, []).append((race_round, alter_punctuation))
+    for season in seasons:
+        if season.pk in has_champion:
+            continue
+        entries = accumulate_rows(rows_by_season.get(season.pk, []), 'driver_id')
+        pending_max_points = season.get_pending_max_points(season.get_punctuation_config(),
+                                                           pending_races=pending_races.get(season.pk, []))
+        title = ClinchSolver.from_entries(entries, season.pk, pending_max_points, rounds=season.rounds).run()
+        has_champion[season.pk] = any(driver_title['worst_position'] == 1 for driver_title in title.values())
+        rank_cache.set(cache_keys[season.pk], has_champion[season.pk])
+    return has_champion
+
+
+def get_seasons_summary(seasons):
+    """
+    Leader, team leader and champion status (as season.leader, season.team_leader and season.has_champion)
+    of each season of a queryset. They are read in a fixed number of queries, whatever the number of seasons:
+    seasons, saved standings of drivers and teams, and results and pending races of the seasons without
+    a cached champion status.
+    """
+    from .models import DriverSeason, TeamSeason
+    seasons = list(seasons.select_related('competition'))
+    season_ids = [season.pk for season in seasons]
+
+    driver_seasons = {}
+    for driver_season in DriverSeason.objects.filter(season__in=season_ids).select_related('driver') \
+            .order_by('driver__last_name', 'driver__first_name'):
+        driver_seasons.setdefault(driver_season.season_id, []).append(driver_season)
+    team_seasons = {}
+    for team_season in TeamSeason.objects.filter(season__in=season_ids, races__gt=0).select_related('team') \
+            .order_by('team__name'):
+        team_seasons.setdefault(team_season.season_id, []).append(team_season)
+    has_champion = get_seasons_has_champion(seasons)
+
+    summary = []
+    for season in seasons:
+        summary.append({
+            'season': season,
+            'leader': get_leader(season, driver_seasons.get(season.pk, []), 'driver'),
+            'team_leader': get_leader(season, team_seasons.get(season.pk, []), 'team'),
+            'has_champion': has_champion[season.pk]
+        })
+    return summary
@@ -151,4 +151,15 @@ class CommonResultTestCase(CommonSeatTestCase, CommonRaceTestCase):
             defaults['seat'] = self.get_test_seat()
         if 'race' not in defaults:
             defaults['race'] = self.get_test_race()
-        return self.set_test_create(model=Result, **defaults)
\ No newline at end of file
+        return self.set_test_create(model=Result, **defaults)
+
+    def get_test_season_result(self, **kwargs):
+        """ Result of a new seat in the first race of a new season, with the team of seat in its competition """
+        seat = self.get_test_seat()
+        competition = self.get_test_competition()
+        self.get_test_competition_team(competition=competition, team=seat.team)
+        season = self.get_test_season(competition=competition)
+        race = self.get_test_race(season=season, round=1)
+        defaults = {'qualifying': 1, 'finish': 1}
+        defaults.update(**kwargs)
+        return self.get_test_result(seat=seat, race=race, **defaults)
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+from .common import CommonResultTestCase
+from ..batch import get_write_batch, result_write_batch
+from ..bulk import RaceResultsGrid
+from ..caching import get_cache_version
+from ..models import DriverSeason, Result, Season
+
+
+class WriteBatchTestCase(TestCase, CommonResultTestCase):
+    def _get_test_race(self):
+        seat_a = self.get_test_seat()
+        seat_b = self.get_test_seat_teammate(seat_a)
+        competition = self.get_test_competition()
+        self.get_test_competition_team(competition=competition, team=seat_a.team)
+        season = self.get_test_season(competition=competition)
+        race = self.get_test_race(season=season, round=1)
+        return race, seat_a, seat_b
+
+    def test_result_write_batch(self):
+        race, seat_a, seat_b = self._get_test_race()
+        season = race.season
+        version = get_cache_version(season.cache_scope)
+        with result_write_batch() as write_batch:
+            with result_write_batch() as nested_batch:
+                self.assertIs(nested_batch, write_batch)
+            result_a = Result.objects.create(race=race, seat=seat_a, qualifying=1, finish=2)
+            result_b = Result.objects.create(race=race, seat=seat_b, qualifying=2, finish=1)
+            self.assertIs(get_write_batch(), write_batch)
+            # standings and cache are not refreshed until the end of the batch
+            self.assertFalse(DriverSeason.objects.filter(season=season).exists())
+            self.assertEqual(get_cache_version(season.cache_scope), version)
+        self.assertIsNone(get_write_batch())
+        self.assertGreater(get_cache_version(season.cache_scope), version)
+        self.assertEqual(Result.objects.get(pk=result_a.pk).points, 18)
+        self.assertEqual(Result.objects.get(pk=result_b.pk).points, 25)
+        self.assertEqual(Season.objects.get(pk=season.pk).points_rank()[0]['driver'], seat_b.driver)
+
+        with result_write_batch():
+            result_b.delete()
+        self.assertEqual(season.points_rank()[0]['driver'], seat_a.driver)
+
+    def test_result_write_batch_validation(self):
+        race, seat_a, seat_b = self._get_test_race()
+        seat_other_team = self.get_test_seat_same_driver_other_team(seat_a)
+        # team of seat is not in competition
+        with self.assertRaises(ValidationError):
+            with result_write_batch():
+                Result.objects.create(race=race, seat=seat_other_team, qualifying=1, finish=1)
+        self.assertFalse(Result.objects.exists())
+
+        self.get_test_competition_team(competition=race.season.competition, team=seat_other_team.team)
+        # the same driver twice in the race is checked at the end, and every result is rolled back
+        with self.assertRaises(ValidationError) as validation:
+            with result_write_batch():
+                Result.objects.create(race=race, seat=seat_a, qualifying=1, finish=1)
+                Result.objects.create(race=race, seat=seat_other_team, qualifying=2, finish=2)
+        self.assertFalse(Result.objects.exists())
+        self.assertEqual(validation.exception.message_dict['seat'],
+                         ['Exists a result with the same driver in this race (different Seat): '
+                          'race {race_id}, driver {driver_id}'.format(race_id=race.pk, driver_id=seat_a.driver_id)])
+
+    def test_race_results_grid(self):
+        race, seat_a, seat_b = self._get_test_race()
+        result_a = Result.objects.create(race=race, seat=seat_a, qualifying=1, finish=1)
+        result_b = Result.objects.create(race=race, seat=seat_b, qualifying=2, finish=2)
+        seat_c = self.get_test_seat(driver=self.get_test_driver(last_name='Three', first_name='Driver'),
+                                    team=seat_a.team)
+
+        # b wins (a takes the saved finish of b), c is created
+        grid = [{'seat': seat_b.pk, 'finish': 1}, {'seat': seat_c.pk, 'qualifying': 3, 'finish': 3}]
+        results = RaceResultsGrid(race, grid).save()
+        self.assertEqual([result.seat for result in results], [seat_b, seat_c])
+        self.assertEqual(results[1].points, 15)
+        result_a = Result.objects.get(pk=result_a.pk)
+        self.assertEqual((result_a.finish, result_a.points), (2, 18))
+        self.assertEqual(Result.objects.get(pk=result_b.pk).points, 25)
+        self.assertEqual(Season.objects.get(pk=race.season.pk).points_rank()[0]['driver'], seat_b.driver)
+
+        # points of the grid are saved by the grid, they are not updated again at the end of the batch
+        with result_write_batch() as write_batch:
+            RaceResultsGrid(race, [{'seat': seat_b.pk, 'finish': 2}, {'seat': seat_a.pk, 'finish': 1}]).save()
+            self.assertIn(race.pk, write_batch.race_ids)
+            self.assertNotIn(race.pk, write_batch.points_race_ids)
+        self.assertEqual(Result.objects.get(pk=result_a.pk).points, 25)
+
+        with self.assertRaises(ValidationError):
+            RaceResultsGrid(race, [{'seat': seat_b.pk, 'finish': 1}, {'seat': seat_c.pk, 'finish': 1}]).save()
+        seat_other_team = self.get_test_seat_same_driver_other_team(seat_a)
+        with self.assertRaises(ValidationError):
+            RaceResultsGrid(race, [{'seat': seat_other_team.pk, 'finish': 1}]).save()
+
+        RaceResultsGrid(race, [{'seat': seat_a.pk, 'finish': 1}], replace=True).save()
+        self.assertEqual(list(race.results.values_list('seat_id', 'finish')), [(seat_a.pk, 1)])
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import os
+import unittest
+
+from django.core.cache import cache
+from django.test import TestCase
+from .test_views import get_fixtures_test
+from ..benchmark import BENCHMARK_SCOPES, compare_benchmarks, run_benchmark, write_benchmark
+from ..generate import DatasetGenerator
+
+# directory to write the results of each dataset (e.g. to be compared with driver27_benchmark --compare)
+BENCHMARK_OUTPUT = os.environ.get('DRIVER27_BENCHMARK_OUTPUT')
+# the synthetic large dataset (100k results) is only measured on demand
+BENCHMARK_LARGE = os.environ.get('DRIVER27_BENCHMARK_LARGE')
+
+
+class BenchmarkMixin(object):
+    dataset = None
+
+    def run_dataset_benchmark(self, repeat=1):
+        # every rank of every scope is cached, so entries of other tests would be culled
+        self.addCleanup(cache.clear)
+        benchmark = run_benchmark(repeat=repeat)
+        for scope in BENCHMARK_SCOPES:
+            self.assertIn('{scope}.points_rank'.format(scope=scope), benchmark['benchmarks'])
+        self.assertIn('season.get_positions_draw', benchmark['benchmarks'])
+        self.assertIn('profile.driver_profile_view', benchmark['benchmarks'])
+        for case_name, measure in benchmark['benchmarks'].items():
+            self.assertLessEqual(measure['cached_queries'], measure['queries'], case_name)
+        if BENCHMARK_OUTPUT:
+            write_benchmark(benchmark, os.path.join(BENCHMARK_OUTPUT, 'benchmark-{dataset}.json'.format(
+                dataset=self.dataset)))
+        return benchmark
+
+
+class SmallBenchmarkTestCase(TestCase, BenchmarkMixin):
+    dataset = 'small'
+
+    def setUp(self):
+        DatasetGenerator(competitions=1, seasons=2, races=3, seats=4).run()
+
+    def test_benchmark(self):
+        benchmark = self.run_dataset_benchmark()
+        # ranks are read from cache
+        self.assertEqual(benchmark['benchmarks']['season.points_rank']['cached_queries'], 0)
+        self.assertFalse(compare_benchmarks(benchmark, benchmark))
+
+    def test_compare_benchmarks(self):
+        baseline = {'benchmarks': {'season.points_rank': {'seconds': 0.1, 'queries': 2, 'cached_queries': 0},
+                                   'global.points_rank': {'seconds': 0.1, 'queries': 4, 'cached_queries': 0}}}
+        current = {'benchmarks': {'season.points_rank': {'seconds': 0.2, 'queries': 2, 'cached_queries': 0},
+                                  'global.points_rank': {'seconds': 0.102, 'queries': 5, 'cached_queries': 0},
+                                  'season.stats_rank': {'seconds': 1, 'queries': 10, 'cached_queries': 0}}}
+        self.assertEqual(compare_benchmarks(baseline, current),
+                         [('global.points_rank', 'queries', 4, 5), ('season.points_rank', 'seconds', 0.1, 0.2)])
+        self.assertEqual(compare_benchmarks(baseline, current, threshold=3), [('global.points_rank', 'queries', 4, 5)])
+
+
+class FixtureBenchmarkTestCase(TestCase, BenchmarkMixin):
+    dataset = 'fixture'
+    fixtures = get_fixtures_test()
+
+    def test_benchmark(self):
+        self.run_dataset_benchmark()
+
+
+@unittest.skipUnless(BENCHMARK_LARGE, 'Set DRIVER27_BENCHMARK_LARGE to measure the synthetic large dataset')
+class LargeBenchmarkTestCase(TestCase, BenchmarkMixin):
+    dataset = 'large'
+
+    def setUp(self):
+        DatasetGenerator().run()
+
+    def test_benchmark(self):
+        self.run_dataset_benchmark()
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase
+from six import StringIO
+from .common import CommonResultTestCase
+from ..bulk import ResultCSVLoader, SeatCSVLoader, open_csv
+from ..ergast import ErgastImporter
+from ..generate import DatasetGenerator
+from ..models import Circuit, Competition, Driver, DriverSeason, Race, Result, Seat, Season
+
+
+class CSVLoaderTestCase(TestCase, CommonResultTestCase):
+    def test_result_csv_loader(self):
+        seat_a = self.get_test_seat()
+        seat_b = self.get_test_seat_teammate(seat_a)
+        competition = self.get_test_competition()
+        self.get_test_competition_team(competition=competition, team=seat_a.team)
+        season = self.get_test_season(competition=competition)
+        race = self.get_test_race(season=season, round=1)
+        rows = [
+            'driver,seat_id,race_id,qualifying,finish,retired,fastest_lap,wildcard',
+            'a,{seat_a},{race},1,2,,,'.format(seat_a=seat_a.pk, race=race.pk),
+            'b,{seat_b},{race},2,1,False,,'.format(seat_b=seat_b.pk, race=race.pk),
+            'a,{seat_a},{race},3,3,,,'.format(seat_a=seat_a.pk, race=race.pk),
+            'c,{seat_a},999,3,3,,,'.format(seat_a=seat_a.pk),
+        ]
+        csvfile = StringIO(u'\n'.join(rows))
+        progress = []
+        loader = ResultCSVLoader(csvfile, chunk_size=2, dry_run=True,
+                                 progress=lambda loaded, errors: progress.append((loaded, errors)))
+        self.assertEqual(loader.load(), 2)
+        self.assertEqual(progress, [(2, 0), (2, 2)])
+        self.assertEqual([line for line, error in loader.errors], [4, 5])
+        self.assertFalse(Result.objects.exists())
+
+        csvfile.seek(0)
+        self.assertEqual(ResultCSVLoader(csvfile, chunk_size=2).load(), 2)
+        self.assertEqual(dict(Result.objects.values_list('seat_id', 'points')), {seat_a.pk: 18, seat_b.pk: 25})
+        self.assertFalse(Result.objects.get(seat=seat_b).retired)
+        self.assertEqual(DriverSeason.objects.get(season=season, driver=seat_b.driver).points, 25)
+        self.assertEqual(season.points_rank()[0]['driver'], seat_b.driver)
+
+        # loaded again, every row is rejected
+        csvfile.seek(0)
+        self.assertEqual(ResultCSVLoader(csvfile).load(), 0)
+
+    def test_result_csv_loader_repeated_positions(self):
+        seat_a = self.get_test_seat()
+        seat_b = self.get_test_seat_teammate(seat_a)
+        seat_c = self.get_test_seat(driver=self.get_test_driver(last_name='Three', first_name='Driver'),
+                                    team=seat_a.team)
+        competition = self.get_test_competition()
+        self.get_test_competition_team(competition=competition, team=seat_a.team)
+        season = self.get_test_season(competition=competition)
+        race = self.get_test_race(season=season, round=1)
+        rows = [
+            'seat_id,race_id,qualifying,finish',
+            '{seat_a},{race},1,1'.format(seat_a=seat_a.pk, race=race.pk),
+            '{seat_b},{race},2,1'.format(seat_b=seat_b.pk, race=race.pk),
+            '{seat_c},{race},1,2'.format(seat_c=seat_c.pk, race=race.pk),
+        ]
+        # duplicated finish in the same chunk, duplicated qualifying in the next one
+        loader = ResultCSVLoader(StringIO(u'\n'.join(rows)), chunk_size=2)
+        self.assertEqual(loader.load(), 1)
+        self.assertEqual(loader.errors, [(3, u'Exists a result with finish 1 in race {race}'.format(race=race.pk)),
+                                         (4, u'Exists a result with qualifying 1 in race {race}'.format(
+                                             race=race.pk))])
+        self.assertEqual(list(race.results.values_list('seat_id', 'qualifying', 'finish')), [(seat_a.pk, 1, 1)])
+
+        # duplicated finish of a saved result
+        loader = ResultCSVLoader(StringIO(u'\n'.join([rows[0], rows[2]])))
+        self.assertEqual(loader.load(), 0)
+        self.assertEqual(loader.errors, [(2, u'Exists a result with finish 1 in race {race}'.format(race=race.pk))])
+
+    def test_seat_csv_loader(self):
+        driver = self.get_test_driver()
+        team = self.get_test_team()
+        csvfile = StringIO(u'\n'.join(['id,first_name,last_name,country,year_of_birth',
+                                       u',{first_name},{last_name},,'.format(first_name=driver.first_name,
+                                                                           last_name=driver.last_name),
+                                       ',Driver,Two,ES,1980']))
+        self.assertEqual(SeatCSVLoader(csvfile, 'drivers').load(), 1)
+        self.assertEqual(Driver.objects.get(last_name='Two').year_of_birth, 1980)
+
+        new_driver = Driver.objects.get(last_name='Two')
+        csvfile = StringIO(u'\n'.join(['id,driver_id,team_id',
+                                       ',{driver},{team}'.format(driver=new_driver.pk, team=team.pk),
+                                       ',{driver},{team}'.format(driver=new_driver.pk, team=team.pk),
+                                       ',999,{team}'.format(team=team.pk)]))
+        loader = SeatCSVLoader(csvfile, 'seats')
+        self.assertEqual(loader.load(), 1)
+        self.assertEqual(len(loader.errors), 2)
+        self.assertTrue(Seat.objects.filter(driver=new_driver, team=team).exists())
+
+
+ERGAST_FILES = {
+    'drivers': ['driverId,driverRef,number,code,forename,surname,dob,nationality,url',
+                '1,hamilton,44,HAM,Lewis,Hamilton,1985-01-07,British,',
+                '2,alonso,14,ALO,Fernando,Alonso,1981-07-29,Spanish,',
+                '3,massa,\\N,\\N,Felipe,Massa,\\N,Brazilian,'],
+    'constructors': ['1,mclaren,McLaren,British,', '2,ferrari,Ferrari,Italian,'],
+    'circuits': ['1,albert_park,Albert Park Grand Prix Circuit,Melbourne,Australia,-37.8,144.9,10,',
+                 '2,silverstone,Silverstone Circuit,Silverstone,UK,52.0,-1.0,153,'],
+    'races': ['1,2009,1,1,Australian Grand Prix,2009-03-29,06:00:00,', '2,2010,1,2,British Grand Prix,2010-07-11,,'],
+    'results': ['1,1,1,1,22,2,1,1,1,10,58,,,,1,,,1', '2,1,2,2,5,1,\\N,R,3,0,20,,,,\\N,,,5',
+                '3,1,3,2,6,3,2,2,2,8,58,,,,2,,,1', '4,2,1,2,1,1,1,1,1,25,52,,,,1,,,1',
+                # shared drive of a driver with a result in the race
+                '5,2,1,1,2,\\N,\\N,W,2,0,0,,,,\\N,,,4'],
+    'qualifying': ['qualifyId,raceId,driverId,constructorId,number,position,q1,q2,q3', '1,1,2,2,5,2,,,'],
+}
+
+
+class ErgastImporterTestCase(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        for name, rows in ERGAST_FILES.items():
+            with open_csv(os.path.join(self.path, '{name}.csv'.format(name=name)), 'w') as csvfile:
+                csvfile.write(u'\n'.join(rows))
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_ergast_importer(self):
+        importer = ErgastImporter(self.path)
+        created = importer.run()
+        self.assertEqual((created['Driver'], created['Team'], created['Race'], created['Result']), (3, 2, 2, 4))
+        self.assertEqual(importer.skipped_results, 1)
+        competition = Competition.objects.get(name='F1')
+        self.assertEqual(competition.slug, 'f1')
+        self.assertEqual(Circuit.objects.get(name='Silverstone Circuit').country, 'GB')
+        self.assertEqual(Driver.objects.get(last_name='Massa').year_of_birth, None)
+
+        season = Season.objects.get(competition=competition, year=2009)
+        self.assertEqual(season.punctuation, 'F1-10+8')
+        race = Race.objects.get(season=season, round=1)
+        self.assertEqual(race.fastest_car.driver.last_name, 'Hamilton')
+        alonso = Result.objects.get(race=race, seat__driver__last_name='Alonso')
+        self.assertEqual((alonso.qualifying, alonso.finish, alonso.retired), (2, None, True))
+        self.assertEqual(Result.objects.get(race=race, seat__driver__last_name='Massa').points, 8)
+        self.assertEqual(season.points_rank()[0]['driver'].last_name, 'Hamilton')
+        self.assertEqual(DriverSeason.objects.get(season=season, driver__last_name='Massa').points, 8)
+        # a seat of each driver and team, valid in the seasons of its results
+        ferrari_hamilton = Seat.objects.get(driver__last_name='Hamilton', team__name='Ferrari')
+        self.assertEqual(list(ferrari_hamilton.periods.values_list('from_year', 'until_year')), [(2010, 2010)])
+        self.assertNotIn(ferrari_hamilton, season.seats)
+
+        # imported again, nothing is created
+        created = ErgastImporter(self.path).run()
+        self.assertFalse(any(created.values()))
+        self.assertEqual(Result.objects.count(), 4)
+
+
+class DatasetGeneratorTestCase(TestCase):
+    @staticmethod
+    def get_dataset(prefix):
+        return list(Result.objects.filter(race__season__competition__name__startswith=prefix)
+                    .order_by('race__season__year', 'race__round', 'qualifying')
+                    .values_list('race__season__year', 'race__round', 'seat__driver__last_name', 'qualifying',
+                                 'finish', 'retired', 'wildcard', 'points'))
+
+    def test_dataset_generator(self):
+        results = DatasetGenerator(competitions=2, seasons=3, races=4, seats=4, seed=1).run()
+        self.assertEqual(Result.objects.count(), results)
+        self.assertGreaterEqual(results, 2 * 3 * 4 * 4)
+        for season in Season.objects.filter(competition__name__startswith='Gen'):
+            seats = set(season.seats.values_list('pk', flat=True))
+            self.assertFalse(Result.objects.filter(race__season=season).exclude(seat_id__in=seats).exists())
+            self.assertEqual(DriverSeason.objects.filter(season=season).count(), len(season.points_rank()))
+        with self.assertRaises(ValueError):
+            DatasetGenerator(competitions=1).run()
+
+        # same seed, same dataset
+        DatasetGenerator(competitions=2, seasons=3, races=4, seats=4, seed=1, prefix='Other').run()
+        self.assertEqual(self.get_dataset('Gen'), self.get_dataset('Other'))
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+from django.core.cache import cache
+from django.test import TestCase
+from six.moves import cPickle as pickle
+from .common import CommonResultTestCase
+from ..recompute import RecomputeQueue, get_rank_scopes, is_warmed, warm_scope
+from ..caching import GLOBAL_CACHE_SCOPE, LRUCache, ModelRef, bump_cache_version, cache_memo, compact_value, \
+    get_cache_scope, get_cache_version, hydrate_value, rank_cache
+
+
+class CachingTestCase(TestCase, CommonResultTestCase):
+    def test_cache_version(self):
+        cache_scope = get_cache_scope('season', 1)
+        self.assertEqual(cache_scope, 'season_1')
+        version = get_cache_version(cache_scope)
+        self.assertEqual(get_cache_version(cache_scope), version)
+        bump_cache_version(cache_scope)
+        self.assertGreater(get_cache_version(cache_scope), version)
+
+    def test_result_invalidates_only_its_scopes(self):
+        seat = self.get_test_seat()
+        competition = self.get_test_competition()
+        self.get_test_competition_team(competition=competition, team=seat.team)
+        season_a = self.get_test_season(competition=competition, year=2016)
+        season_b = self.get_test_season(competition=competition, year=2017)
+        race_a = self.get_test_race(season=season_a, round=1)
+        race_b = self.get_test_race(season=season_b, round=1)
+        self.get_test_result(seat=seat, race=race_a, qualifying=1, finish=1)
+
+        rank_a = season_a.points_rank()
+        cache_scopes = [season_a.cache_scope, season_b.cache_scope, competition.cache_scope, GLOBAL_CACHE_SCOPE]
+        versions = [get_cache_version(cache_scope) for cache_scope in cache_scopes]
+
+        result_b = self.get_test_result(seat=seat, race=race_b, qualifying=1, finish=1)
+        new_versions = [get_cache_version(cache_scope) for cache_scope in cache_scopes]
+        self.assertEqual(new_versions[0], versions[0])
+        for version, new_version in zip(versions[1:], new_versions[1:]):
+            self.assertGreater(new_version, version)
+        self.assertEqual(season_a.points_rank(), rank_a)
+        self.assertEqual(competition.points_rank()[0]['points'], 50)
+
+        result_b.delete()
+        self.assertGreater(get_cache_version(season_b.cache_scope), new_versions[1])
+        self.assertEqual(competition.points_rank()[0]['points'], 25)
+
+    def test_cache_memo(self):
+        result = self.get_test_season_result()
+        season = result.race.season
+
+        with cache_memo() as memo:
+            rank = season.points_rank()
+            with self.assertNumQueries(0):
+                self.assertEqual(season.points_rank(), rank)
+                self.assertEqual(season.leader, rank[0])
+            with cache_memo() as nested_memo:
+                self.assertIs(nested_memo, memo)
+            self.assertGreater(memo.hits, 0)
+            misses = memo.misses
+
+            # a result saved in the request bumps the version of season
+            result.finish = 2
+            result.save()
+            self.assertEqual(season.points_rank()[0]['points'], 18)
+            self.assertGreater(memo.misses, misses)
+
+    def test_l1_cache(self):
+        l1_cache = LRUCache(max_entries=2, max_bytes=1024)
+        l1_cache.set('a', [1])
+        l1_cache.set('b', [2])
+        self.assertEqual(l1_cache.get('a'), [1])
+        l1_cache.set('c', [3])  # b is the least recently used
+        self.assertIsNone(l1_cache.get('b'))
+        self.assertEqual(l1_cache.get('c'), [3])
+        l1_cache.set('big', 'x' * 2048)  # bigger than cache, not stored
+        self.assertIsNone(l1_cache.get('big'))
+        l1_cache.set('d', 'x' * 1000)  # a and c are evicted by size
+        self.assertEqual(l1_cache.stats()['entries'], 1)
+        self.assertLessEqual(l1_cache.stats()['bytes'], 1024)
+        stats = l1_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (2, 2, 3))
+
+        result = self.get_test_season_result()
+        season = result.race.season
+
+        rank = season.points_rank()
+        hits = rank_cache.stats()['hits']
+        # only the version of season is read from cache, rank is in process
+        with self.assertNumQueries(0):
+            self.assertEqual(season.points_rank(), rank)
+        self.assertGreater(rank_cache.stats()['hits'], hits)
+        # a new version (of any process) is not in L1
+        result.finish = 2
+        result.save()
+        self.assertEqual(season.points_rank()[0]['points'], 18)
+
+    def test_compact_value(self):
+        result = self.get_test_season_result()
+        seat, season = result.seat, result.race.season
+
+        rank = season.points_rank()
+        compact_rank = compact_value(rank)
+        self.assertEqual(compact_rank[0]['driver'], ModelRef(seat.driver.__class__, seat.driver.pk))
+        self.assertIsNone(compact_rank[0]['pos_list'])
+        self.assertLess(len(pickle.dumps(compact_rank)), len(pickle.dumps(rank)))
+        # one in_bulk by model: driver, season and competition
+        with self.assertNumQueries(3):
+            self.assertEqual(hydrate_value(compact_rank), rank)
+
+        results_list = season.get_results_list()
+        compact_results_list = compact_value(results_list)
+        self.assertEqual(list(compact_results_list), [ModelRef(seat.driver.__class__, seat.driver.pk)])
+        self.assertEqual(hydrate_value(compact_results_list), results_list)
+
+    def test_streaks_cache_key(self):
+        result = self.get_test_season_result()
+        season = result.race.season
+        for element, item_id in (('driver', result.seat.driver_id), ('team', result.seat.team_id)):
+            streaks = season.get_streaks(element, finish__exact=1)
+            self.assertEqual(streaks[item_id], (1, 1))
+            # key is built from the element and the filters only
+            cache_str = season.get_name_cache_rank('streaks', {'element': element, 'filters': {'finish__exact': 1}})
+            self.assertEqual(rank_cache.get(cache_str), streaks)
+
+    def test_single_flight(self):
+        computations = []
+
+        def compute_rank():
+            computations.append(1)
+            time.sleep(0.2)
+            return [{'points': 25}]
+
+        ranks = []
+        cache_str = 'single_flight_{time}'.format(time=time.time())
+        threads = [threading.Thread(target=lambda: ranks.append(rank_cache.get_or_set(cache_str, compute_rank)))
+                   for index in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(computations), 1)
+        self.assertEqual(ranks, [[{'points': 25}]] * 8)
+
+        # after the wait, value is computed without lock
+        lock_key = 'driver27_lock_single_flight_locked'
+        cache.add(lock_key, True)
+        self.assertEqual(rank_cache.get_or_set('single_flight_locked', compute_rank, wait=0.1), [{'points': 25}])
+        self.assertEqual(len(computations), 2)
+        cache.delete(lock_key)
+
+    def test_recompute_queue(self):
+        result = self.get_test_season_result()
+        season = result.race.season
+        competition = season.competition
+
+        recompute_queue = RecomputeQueue(delay=0)
+        for index in range(3):
+            recompute_queue.put_season(season, start_worker=False)
+        # season, competition and global scope, once
+        self.assertEqual(recompute_queue.run_pending(), 3)
+        self.assertEqual(recompute_queue.run_pending(), 0)
+        with self.assertNumQueries(0):
+            self.assertEqual(season.points_rank()[0]['points'], 25)
+            self.assertEqual(competition.team_points_rank()[0]['points'], 25)
+
+    def test_warm_scope(self):
+        result = self.get_test_season_result()
+        season = result.race.season
+        competition = season.competition
+
+        self.assertEqual(get_rank_scopes(), [('season', season.pk), ('competition', competition.pk), ('global', None)])
+        self.assertIsNotNone(warm_scope(('season', season.pk, True)))
+        self.assertTrue(is_warmed(season))
+        self.assertIsNone(warm_scope(('season', season.pk, True)))
+        with self.assertNumQueries(0):
+            season.points_rank()
+            season.stats_rank(finish__exact=1)
+            season.streak_rank(only_actives=True, finish__exact=1)
+
+        result.finish = 2
+        result.save()
+        self.assertFalse(is_warmed(season))
+        self.assertIsNotNone(warm_scope(('season', season.pk, True)))
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+from django.test import TestCase
+from .common import CommonResultTestCase
+from ..clinch import ClinchSolver
+from ..models import Season
+
+
+def get_positions(*positions):
+    positions_count = [0] * 20
+    for position in positions:
+        positions_count[position - 1] += 1
+    return positions_count
+
+
+class ClinchSolverTestCase(TestCase):
+    def test_countback(self):
+        title = ClinchSolver({'a': [25, 25], 'b': [25, 15, 10]},
+                             {'a': get_positions(1, 1), 'b': get_positions(1, 3, 4)}, []).run()
+        self.assertEqual((title['a']['worst_position'], title['b']['best_position']), (1, 2))
+
+    def test_pending_points(self):
+        positions = {'a': get_positions(1, 1, 2), 'b': get_positions(2, 2)}
+        # one point of fastest lap in the pending race
+        title = ClinchSolver({'a': [25, 25, 10], 'b': [18, 17]}, positions, [(4, 26)]).run()
+        self.assertEqual(title['b']['max_points'], 61)
+        self.assertEqual((title['a']['worst_position'], title['b']['best_position']), (2, 1))
+        # only the best two results are counted
+        title = ClinchSolver({'a': [25, 25, 10], 'b': [18, 17]}, positions, [(4, 26)], rounds=2).run()
+        self.assertEqual((title['a']['points'], title['b']['max_points']), (50, 44))
+        self.assertEqual((title['a']['worst_position'], title['b']['best_position']), (1, 2))
+
+    def test_elimination_round(self):
+        title = ClinchSolver({'a': [25, 15], 'b': [18, 12], 'c': [1]},
+                             {'a': get_positions(1, 4), 'b': get_positions(2, 5), 'c': get_positions(10)},
+                             [(3, 25), (4, 25)]).run()
+        self.assertEqual(title['a']['elimination_round'], 4)
+        self.assertEqual(title['b']['elimination_round'], 3)
+        self.assertEqual(title['c']['elimination_round'], 3)
+        self.assertEqual([title[driver_id]['best_position'] for driver_id in 'abc'], [1, 1, 1])
+        self.assertFalse(any(title[driver_id]['eliminated'] for driver_id in 'abc'))
+
+    def test_eliminated(self):
+        title = ClinchSolver({'a': [25, 25, 15], 'b': [18, 12]},
+                             {'a': get_positions(1, 1, 4), 'b': get_positions(2, 5)}, [(4, 25)]).run()
+        # b is already out of the title fight
+        self.assertEqual((title['b']['best_position'], title['b']['elimination_round']), (2, None))
+        self.assertTrue(title['b']['eliminated'])
+        # a can not be eliminated, it is the champion
+        self.assertEqual((title['a']['worst_position'], title['a']['elimination_round']), (1, None))
+        self.assertFalse(title['a']['eliminated'])
+
+
+class SeasonTitleTestCase(TestCase, CommonResultTestCase):
+    def test_season_title(self):
+        seat_a = self.get_test_seat()
+        seat_b = self.get_test_seat_teammate(seat_a)
+        competition = self.get_test_competition()
+        self.get_test_competition_team(competition=competition, team=seat_a.team)
+        season = self.get_test_season(competition=competition, rounds=3)
+        race_1 = self.get_test_race(season=season, round=1)
+        race_2 = self.get_test_race(season=season, round=2)
+        self.get_test_race(season=season, round=3)
+        self.get_test_result(seat=seat_a, race=race_1, qualifying=1, finish=1)
+        self.get_test_result(seat=seat_b, race=race_1, qualifying=2, finish=2)
+        self.get_test_result(seat=seat_a, race=race_2, qualifying=2, finish=2)
+        self.get_test_result(seat=seat_b, race=race_2, qualifying=1, finish=1)
+        season = Season.objects.select_related('competition').get(pk=season.pk)
+        # results and pending races
+        with self.assertNumQueries(2):
+            title = season.get_title()
+        self.assertEqual(title[seat_a.driver.pk]['elimination_round'], 3)
+        self.assertEqual(len(season.only_title_contenders()), 2)
+        self.assertFalse(season.has_champion())
+        # the pending race scores the win of F1-10+6
+        self.assertEqual(season.get_title(punctuation_code='F1-10+6')[seat_b.driver.pk]['max_points'], 26)
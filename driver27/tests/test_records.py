@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from django.test import TestCase
+from .common import CommonResultTestCase
+from ..models import Result, TeamSeason
+from ..records import RecordsCounter, get_record_config
+
+
+class RecordsCounterTestCase(TestCase, CommonResultTestCase):
+    def _get_test_season_with_results(self):
+        seat_a = self.get_test_seat()
+        seat_b = self.get_test_seat_teammate(seat_a)
+        competition = self.get_test_competition()
+        self.get_test_competition_team(competition=competition, team=seat_a.team)
+        season = self.get_test_season(competition=competition)
+        race_1 = self.get_test_race(season=season, round=1, fastest_car=seat_b)
+        race_2 = self.get_test_race(season=season, round=2)
+        self.get_test_result(seat=seat_a, race=race_1, qualifying=3, finish=1)
+        self.get_test_result(seat=seat_b, race=race_1, qualifying=1, finish=2)
+        self.get_test_result(seat=seat_a, race=race_2, qualifying=1, retired=True)
+        return season, seat_a, seat_b
+
+    def test_records_counter(self):
+        season, seat_a, seat_b = self._get_test_season_with_results()
+        records_list = ['RACE', 'POLE', 'WIN', 'PODIUM', 'FASTEST', 'COMEBACK', 'OUT']
+        counter = RecordsCounter.from_records_list(records_list)
+        with self.assertNumQueries(1):
+            counts = counter.count(seat_a.driver.get_results())
+        for record in records_list:
+            self.assertEqual(counts[record], seat_a.driver.get_stats(**get_record_config(record).get('filter')))
+        self.assertEqual(counts['COMEBACK'], 1)
+
+        with self.assertNumQueries(1):
+            counts_by_driver = counter.count_by(Result.wizard(season=season), 'seat__driver_id')
+        self.assertEqual(counts_by_driver[seat_b.driver.pk]['FASTEST'], 1)
+        self.assertEqual(counts_by_driver[seat_a.driver.pk]['POLE'], 1)
+
+        # teams count RACE by races
+        team_stats = seat_a.team.get_stats_list(records_list=['RACE', 'PODIUM'])
+        self.assertEqual(team_stats, {'RACE': 2, 'PODIUM': 2})
+
+    def test_stats_rank(self):
+        season, seat_a, seat_b = self._get_test_season_with_results()
+        rank = season.competition.stats_rank(**get_record_config('POLE').get('filter'))
+        self.assertEqual([(entry['driver'], entry['stat']) for entry in rank],
+                         [(seat_a.driver, 1), (seat_b.driver, 1)])
+        rank = season.competition.seasons_rank(**get_record_config('WIN').get('filter'))
+        self.assertEqual([(entry['driver'], entry['season'], entry['stat']) for entry in rank],
+                         [(seat_a.driver, season, 1), (seat_b.driver, season, 0)])
+
+    def test_team_rank(self):
+        season, seat_a, seat_b = self._get_test_season_with_results()
+        podium_filter = get_record_config('PODIUM').get('filter')
+        season = season.__class__.objects.select_related('competition').get(pk=season.pk)
+        team_seasons = list(TeamSeason.objects.filter(season=season).values_list('team_id', 'points'))
+        expected_totals = {'STATS': 2, 'RACES': 1, 'DOUBLES': 1}
+        for rank_type, total in expected_totals.items():
+            # teams and totals of teams
+            with self.assertNumQueries(2):
+                rank = season.get_team_rank(rank_type, **podium_filter)
+            self.assertEqual(rank, [{'stat': total, 'team': seat_a.team}])
+            self.assertEqual(season.competition.get_team_rank(rank_type, **podium_filter)[0]['stat'], total)
+        self.assertEqual(season.get_team_rank('RACES', **get_record_config('RACE').get('filter'))[0]['stat'], 2)
+        # ranks of teams do not save standings
+        self.assertEqual(list(TeamSeason.objects.filter(season=season).values_list('team_id', 'points')), team_seasons)
@@ -2,6 +2,7 @@
 from django.test import TestCase
 from .common import CommonResultTestCase
 from ..models import Result, Seat, TeamSeason, ContenderSeason, SeatPeriod, CompetitionTeam
+from ..models import get_tuple_from_result, get_tuples_from_results, iter_tuples_from_results
 from ..records import get_record_config
 from ..punctuation import get_punctuation_config
 from django.core.exceptions import ValidationError
@@ -70,6 +71,31 @@ class ResultTestCase(TestCase, CommonResultTestCase):
         result.finish = None
         self.assertEqual(str(result), result_str_out)
 
+    def test_result_tuples(self):
+        seat = self.get_test_seat()
+        seat_b = self.get_test_seat_teammate(seat)
+        competition = self.get_test_competition()
+        self.get_test_competition_team(competition=competition, team=seat.team)
+        season = self.get_test_season(competition=competition)
+        circuit = self.get_test_circuit()
+        grand_prix = self.get_test_grandprix(country='BR')
+        race_1 = self.get_test_race(season=season, round=1, circuit=circuit, grand_prix=grand_prix,
+                                    alter_punctuation='double', fastest_car=seat)
+        race_2 = self.get_test_race(season=season, round=2)
+        self.get_test_result(seat=seat, race=race_1, qualifying=1, finish=1)
+        self.get_test_result(seat=seat_b, race=race_1, qualifying=2, finish=2, wildcard=True)
+        self.get_test_result(seat=seat, race=race_2, qualifying=3, retired=True)
+
+        results = Result.wizard(season=season)
+        expected_tuples = [get_tuple_from_result(result) for result in results]
+        # results, circuits, grands prix and competitions
+        with self.assertNumQueries(4):
+            self.assertEqual(get_tuples_from_results(results), expected_tuples)
+        self.assertEqual(list(iter_tuples_from_results(results, chunk_size=1)), expected_tuples)
+        self.assertEqual(get_tuples_from_results(list(results)), expected_tuples)
+        self.assertEqual(expected_tuples[0].country.code, 'BR')
+        self.assertTrue(expected_tuples[0].fastest_lap)
+
     def test_result_seat_exception(self):
         self.assertRaises(ValidationError, self.get_test_result)
 
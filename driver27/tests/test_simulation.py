@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from django.test import TestCase
+from .common import CommonResultTestCase
+from ..models import Season
+from ..simulation import SeasonSimulator, SimulationSnapshot
+
+
+class SimulationTestCase(TestCase, CommonResultTestCase):
+    def _get_test_season(self):
+        seat_a = self.get_test_seat()
+        seat_b = self.get_test_seat_teammate(seat_a)
+        competition = self.get_test_competition()
+        self.get_test_competition_team(competition=competition, team=seat_a.team)
+        season = self.get_test_season(competition=competition, rounds=4)
+        race_1 = self.get_test_race(season=season, round=1)
+        race_2 = self.get_test_race(season=season, round=2)
+        self.get_test_race(season=season, round=3)
+        self.get_test_race(season=season, round=4, alter_punctuation='half')
+        self.get_test_result(seat=seat_a, race=race_1, qualifying=1, finish=1)
+        self.get_test_result(seat=seat_b, race=race_1, qualifying=2, finish=2)
+        self.get_test_result(seat=seat_a, race=race_2, qualifying=1, finish=3)
+        self.get_test_result(seat=seat_b, race=race_2, qualifying=2, finish=1)
+        return Season.objects.get(pk=season.pk), seat_a, seat_b
+
+    def test_simulation_snapshot(self):
+        season, seat_a, seat_b = self._get_test_season()
+        # results and pending races
+        with self.assertNumQueries(2):
+            snapshot = SimulationSnapshot.from_season(season)
+        self.assertEqual(snapshot.driver_ids, sorted([seat_a.driver.pk, seat_b.driver.pk]))
+        self.assertEqual([finish_points[1] for finish_points in snapshot.pending_races], [25, 12.5])
+        self.assertEqual(snapshot.driver_teams, [0, 0])
+
+    def test_simulation(self):
+        season, seat_a, seat_b = self._get_test_season()
+        simulation = season.simulate(simulations=1500, seed=27)
+        driver_a, driver_b = simulation['drivers'][seat_a.driver.pk], simulation['drivers'][seat_b.driver.pk]
+        self.assertAlmostEqual(driver_a['title'] + driver_b['title'], 1)
+        self.assertGreater(driver_b['title'], driver_a['title'])
+        self.assertGreater(driver_a['title'], 0)
+        self.assertEqual(driver_a['podium'], 1)
+        self.assertAlmostEqual(driver_a['positions'][1], 1 - driver_a['title'])
+        self.assertEqual(simulation['teams'][seat_a.team.pk]['title'], 1)
+
+        # the same seed gives the same result, with any number of workers
+        snapshot = SimulationSnapshot.from_season(season)
+        self.assertEqual(SeasonSimulator(snapshot, simulations=1500, seed=27, workers=2).run(), simulation)
+        self.assertNotEqual(SeasonSimulator(snapshot, simulations=1500, seed=28).run(), simulation)
+
+        # without pending races, the leader is the champion
+        for race_round in (3, 4):
+            self.get_test_result(seat=seat_a, race=season.races.get(round=race_round), qualifying=1, finish=2)
+        simulation = season.simulate(simulations=100)
+        self.assertEqual(simulation['drivers'][seat_a.driver.pk]['title'], 1)
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+from importlib import import_module
+
+from django.apps import apps
+from django.test import TestCase, TransactionTestCase
+from .common import CommonResultTestCase
+from .test_views import get_fixtures_test
+from ..models import Competition, ContenderSeason, DriverSeason, Result, Season, TeamSeason
+from ..punctuation import get_punctuation_config
+from ..standings import ComparedStandings, Standings
+
+
+class StandingsTestCase(TestCase, CommonResultTestCase):
+    def _get_test_season_with_results(self):
+        seat_a = self.get_test_seat()
+        seat_b = self.get_test_seat_teammate(seat_a)
+        competition = self.get_test_competition()
+        self.get_test_competition_team(competition=competition, team=seat_a.team)
+        season = self.get_test_season(competition=competition, rounds=3)
+        race_1 = self.get_test_race(season=season, round=1)
+        race_2 = self.get_test_race(season=season, round=2, alter_punctuation='double')
+        self.get_test_result(seat=seat_a, race=race_1, qualifying=2, finish=1)
+        self.get_test_result(seat=seat_b, race=race_1, qualifying=1, finish=3)
+        self.get_test_result(seat=seat_a, race=race_2, qualifying=1, finish=2)
+        self.get_test_result(seat=seat_b, race=race_2, qualifying=3, finish=1, wildcard=True)
+        return season, seat_a, seat_b
+
+    def test_standings_driver_rank(self):
+        season, seat_a, seat_b = self._get_test_season_with_results()
+        team_season = TeamSeason.objects.get(season=season, team=seat_a.team)
+        team_season.sponsor_name = 'Sponsored Team'
+        team_season.save()
+        rank = dict((entry['driver'], entry) for entry in season.get_standings().driver_rank())
+        for seat in (seat_a, seat_b):
+            contender_season = ContenderSeason(driver=seat.driver, season=season)
+            self.assertEqual(rank[seat.driver]['points'], contender_season.get_points())
+            self.assertEqual(rank[seat.driver]['pos_list'], contender_season.get_positions_count_list())
+            self.assertEqual(rank[seat.driver]['teams'], 'Sponsored Team')
+        teams_verbose = dict((driver.pk, entry['teams']) for driver, entry in rank.items())
+        self.assertEqual(Standings(season).teams_verbose(), teams_verbose)
+        self.assertEqual(season.get_teams_verbose(), teams_verbose)
+        self.assertEqual(rank[seat_a.driver]['points'], 25 + 36)
+        self.assertEqual(rank[seat_b.driver]['points'], 15 + 50)
+
+        punctuation_config = get_punctuation_config('F1-10+6')
+        rank = dict((entry['driver'], entry)
+                    for entry in season.get_standings(punctuation_config=punctuation_config).driver_rank())
+        self.assertEqual(rank[seat_a.driver]['points'], 10 + 12)
+        self.assertEqual(rank[seat_b.driver]['points'], 4 + 20)
+
+    def test_standings_team_rank(self):
+        season, seat_a, seat_b = self._get_test_season_with_results()
+        rank = season.get_standings().team_rank()
+        self.assertEqual(len(rank), 1)
+        team_season, created = TeamSeason.objects.get_or_create(season=season, team=seat_a.team)
+        # wildcard results are not counted in team points
+        self.assertEqual(rank[0]['points'], team_season.get_points())
+        self.assertEqual(rank[0]['points'], 25 + 15 + 36)
+        self.assertEqual(rank[0]['pos_list'][:3], [2, 1, 1])
+
+        competition_rank = season.competition.get_standings().team_rank()
+        self.assertEqual(competition_rank[0]['points'], rank[0]['points'])
+
+    def test_compared_standings(self):
+        season, seat_a, seat_b = self._get_test_season_with_results()
+        punctuation_configs = get_punctuation_config()
+        season = Season.objects.get(pk=season.pk)
+        compared_standings = ComparedStandings(season, punctuation_configs=punctuation_configs)
+        # results, competition, drivers, teams and sponsor names, for every punctuation
+        with self.assertNumQueries(5):
+            driver_rank = dict((entry['driver'], entry) for entry in compared_standings.driver_rank())
+        team_rank = compared_standings.team_rank()
+        for code, punctuation_config in punctuation_configs.items():
+            standings = Standings(season, punctuation_config=punctuation_config)
+            for entry in standings.driver_rank():
+                self.assertEqual(driver_rank[entry['driver']]['points'][code], entry['points'])
+                self.assertEqual(driver_rank[entry['driver']]['pos_str'], entry['pos_str'])
+            self.assertEqual(team_rank[0]['points'][code], standings.team_rank()[0]['points'])
+        self.assertEqual(driver_rank[seat_a.driver]['points']['F1-10+6'], 10 + 12)
+        self.assertEqual(driver_rank[seat_a.driver]['positions']['F1-25'], 2)
+        self.assertEqual(driver_rank[seat_b.driver]['positions']['F1-25'], 1)
+
+    def test_points_progression(self):
+        season, seat_a, seat_b = self._get_test_season_with_results()
+        race_3 = self.get_test_race(season=season, round=3)
+        self.get_test_result(seat=seat_b, race=race_3, qualifying=1, finish=1)
+        season.rounds = 2
+        season.save()
+        season = Season.objects.select_related('competition').get(pk=season.pk)
+        # results and drivers
+        with self.assertNumQueries(2):
+            progression = season.points_progression()
+        self.assertEqual(progression['rounds'], [1, 2, 3])
+        for entry in progression['rank']:
+            contender_season = ContenderSeason(driver=entry['driver'], season=season)
+            self.assertEqual(entry['points'], [contender_season.get_points(
+                limit_races=race_round, punctuation_config=season.get_punctuation_config())
+                for race_round in progression['rounds']])
+        # best two results of seat_b: 50 + 25
+        self.assertEqual([(entry['driver'], entry['points'], entry['positions']) for entry in progression['rank']],
+                         [(seat_b.driver, [15, 65, 75], [2, 1, 1]), (seat_a.driver, [25, 61, 61], [1, 2, 2])])
+
+        team_progression = season.points_progression(team=True, punctuation_code='F1-10+6')
+        self.assertEqual(team_progression['rank'][0]['points'], [10 + 4, 10 + 4 + 12, 10 + 4 + 12 + 10])
+
+    def test_standings_num_queries(self):
+        season, seat_a, seat_b = self._get_test_season_with_results()
+        season = Season.objects.get(pk=season.pk)
+        # results, competition, drivers, teams and sponsor names
+        with self.assertNumQueries(5):
+            Standings(season).driver_rank()
+        # results, drivers and seats
+        with self.assertNumQueries(3):
+            Standings(season.competition).driver_rank()
+        # results and teams (competition is already loaded)
+        with self.assertNumQueries(2):
+            Standings(season).team_rank()
+
+    def test_saved_standings(self):
+        season, seat_a, seat_b = self._get_test_season_with_results()
+        # standings of season are saved with its results
+        self.assertTrue(DriverSeason.objects.filter(season=season).exists())
+        self.assertEqual(season.get_standings().driver_rank(), Standings(season).driver_rank())
+        driver_season = DriverSeason.objects.get(season=season, driver=seat_a.driver)
+        self.assertEqual((driver_season.points, driver_season.races, driver_season.wins, driver_season.poles),
+                         (25 + 36, 2, 1, 1))
+        self.assertEqual(driver_season.pos_list[:3], [1, 1, 0])
+        team_season = TeamSeason.objects.get(season=season, team=seat_a.team)
+        self.assertEqual((team_season.points, team_season.races, team_season.wins), (25 + 15 + 36, 4, 2))
+
+        race_1 = season.races.get(round=1)
+        result = race_1.results.get(seat=seat_b)
+        result.finish = 10
+        result.save()
+        race_1.fastest_car = seat_a
+        race_1.alter_punctuation = 'double'
+        race_1.save()
+        driver_season = DriverSeason.objects.get(season=season, driver=seat_b.driver)
+        self.assertEqual(driver_season.points, 2 + 50)
+        self.assertEqual(DriverSeason.objects.get(season=season, driver=seat_a.driver).fastest_laps, 1)
+        for element in ('driver_rank', 'team_rank'):
+            self.assertEqual(getattr(season.get_standings(), element)(), getattr(Standings(season), element)())
+
+        season.rounds = 1
+        season.save()
+        self.assertEqual(DriverSeason.objects.get(season=season, driver=seat_a.driver).points, 50)
+
+        result.delete()
+        race_1.results.get(seat=seat_a).delete()
+        self.assertFalse(DriverSeason.objects.filter(season=season, driver=seat_b.driver, races__gt=1).exists())
+        self.assertEqual(season.competition.get_standings().team_rank(), Standings(season.competition).team_rank())
+
+    def test_saved_standings_num_queries(self):
+        season, seat_a, seat_b = self._get_test_season_with_results()
+        season = Season.objects.get(pk=season.pk)
+        # driver seasons and competition
+        with self.assertNumQueries(2):
+            season.get_standings().driver_rank()
+        # driver seasons, drivers and seats
+        with self.assertNumQueries(3):
+            season.competition.get_standings().driver_rank()
+        # team seasons (competition is already loaded)
+        with self.assertNumQueries(1):
+            season.get_standings().team_rank()
+        # driver seasons, without drivers
+        with self.assertNumQueries(1):
+            season.get_teams_verbose()
+
+
+class FillSeasonStandingsTestCase(TestCase):
+    # results of fixture were saved before standings
+    fixtures = get_fixtures_test()
+
+    def test_fill_season_standings(self):
+        self.assertTrue(Result.objects.exists())
+        self.assertFalse(DriverSeason.objects.exists())
+        fill_season_standings_migration = import_module('driver27.migrations.0003_fill_season_standings')
+        fill_season_standings_migration.fill_season_standings(apps, None)
+        for season in Season.objects.all():
+            for element in ('driver_rank', 'team_rank'):
+                self.assertEqual(getattr(season.get_standings(), element)(), getattr(Standings(season), element)())
+        for competition in Competition.objects.all():
+            self.assertEqual(competition.get_standings().driver_rank(), Standings(competition).driver_rank())
+        self.assertTrue(DriverSeason.objects.filter(points__gt=0).exists())
+
+
+class DeletedResultStandingsTestCase(TransactionTestCase, CommonResultTestCase):
+    # standings of results deleted without Result.delete are refreshed when the transaction commits
+
+    def test_cascade_delete(self):
+        seat_a = self.get_test_seat()
+        seat_b = self.get_test_seat_teammate(seat_a)
+        competition = self.get_test_competition()
+        self.get_test_competition_team(competition=competition, team=seat_a.team)
+        season = self.get_test_season(competition=competition)
+        race_1 = self.get_test_race(season=season, round=1)
+        race_2 = self.get_test_race(season=season, round=2)
+        self.get_test_result(seat=seat_a, race=race_1, qualifying=1, finish=1)
+        self.get_test_result(seat=seat_b, race=race_1, qualifying=2, finish=2)
+        self.get_test_result(seat=seat_a, race=race_2, qualifying=2, finish=2)
+        self.get_test_result(seat=seat_b, race=race_2, qualifying=1, finish=1)
+        self.assertEqual(TeamSeason.objects.get(season=season, team=seat_a.team).points, 2 * (25 + 18))
+
+        # results of seat are deleted by cascade
+        seat_b.delete()
+        self.assertFalse(DriverSeason.objects.filter(season=season, driver=seat_b.driver).exists())
+        self.assertEqual(TeamSeason.objects.get(season=season, team=seat_a.team).points, 25 + 18)
+        self.assertEqual([entry['driver'] for entry in season.points_rank() if entry['points']], [seat_a.driver])
+
+        Result.objects.filter(race=race_1).delete()
+        self.assertEqual(DriverSeason.objects.get(season=season, driver=seat_a.driver).points, 18)
+
+        # results of driver are deleted by cascade of its seats
+        seat_a.driver.delete()
+        self.assertFalse(DriverSeason.objects.filter(season=season).exists())
+        self.assertEqual(TeamSeason.objects.get(season=season, team=seat_a.team).points, 0)
+        self.assertEqual(season.team_points_rank(), [])
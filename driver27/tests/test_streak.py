@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from collections import namedtuple
+
+from django.db.models import F
+from django.test import TestCase
+
+from .common import CommonResultTestCase
+from ..models import Result
+from ..records import get_record_config
+from ..streak import Streak, StreakMatrix
+
+StreakResult = namedtuple('StreakResult', 'race_id qualifying finish fastest_lap retired')
+
+
+class StreakTestCase(TestCase):
+    def test_compile_filters(self):
+        comeback = Streak.compile_filters(get_record_config('COMEBACK').get('filter'))
+        self.assertTrue(comeback(StreakResult(1, qualifying=10, finish=3, fastest_lap=False, retired=False)))
+        self.assertFalse(comeback(StreakResult(1, qualifying=3, finish=10, fastest_lap=False, retired=False)))
+        # as in a queryset, a retired driver without finish is not in podium
+        podium = Streak.compile_filters(get_record_config('PODIUM').get('filter'))
+        self.assertFalse(podium(StreakResult(1, qualifying=1, finish=None, fastest_lap=False, retired=True)))
+        fastest = Streak.compile_filters({'race__fastest_car': F('seat')})
+        self.assertTrue(fastest(StreakResult(1, qualifying=1, finish=None, fastest_lap=True, retired=True)))
+
+    def test_streak_unique_by_race(self):
+        results = [StreakResult(3, 1, 1, False, False), StreakResult(2, 2, 5, False, False),
+                   StreakResult(3, 2, 2, False, False), StreakResult(2, 1, 4, False, False),
+                   StreakResult(1, 1, 1, False, False)]
+        streak = Streak(results=results, unique_by_race=True)
+        self.assertEqual([[result.race_id for result in race_results] for race_results in streak.get_results_by_race()],
+                         [[3, 3], [2, 2], [1]])
+        self.assertEqual(streak.run({'finish__lte': 4}), 3)
+        self.assertEqual(streak.run({'finish__lte': 3}), 1)
+        self.assertEqual(Streak(results=results, unique_by_race=True, max_streak=True).run({'finish': 1}), 1)
+        self.assertEqual(Streak(results=results).run({'qualifying__lte': 2}), 5)
+
+
+class StreakMatrixTestCase(TestCase, CommonResultTestCase):
+    def test_streak_matrix(self):
+        seat_a = self.get_test_seat()
+        seat_b = self.get_test_seat_teammate(seat_a)
+        competition = self.get_test_competition()
+        self.get_test_competition_team(competition=competition, team=seat_a.team)
+        season = self.get_test_season(competition=competition)
+        positions = [(1, 2), (1, 3), (4, 1), (1, None), (2, 1)]
+        for race_round, (finish_a, finish_b) in enumerate(positions, start=1):
+            race = self.get_test_race(season=season, round=race_round)
+            self.get_test_result(seat=seat_a, race=race, finish=finish_a, retired=finish_a is None)
+            self.get_test_result(seat=seat_b, race=race, finish=finish_b, retired=finish_b is None)
+
+        records = dict((code, get_record_config(code).get('filter')) for code in ('WIN', 'PODIUM', 'OUT'))
+        with self.assertNumQueries(1):
+            streaks = StreakMatrix(Result.wizard(season=season)).run(records)
+        for code, filters in records.items():
+            for seat in (seat_a, seat_b):
+                self.assertEqual(streaks[code][seat.driver.pk],
+                                 (seat.driver.get_streak(**filters), seat.driver.get_streak(max_streak=True, **filters)))
+        self.assertEqual(streaks['WIN'][seat_a.driver.pk], (0, 2))
+
+        team_streaks = StreakMatrix(Result.wizard(season=season), key='team_id').run(records)
+        self.assertEqual(team_streaks['WIN'][seat_a.team.pk], (5, 5))
+        self.assertEqual(team_streaks['OUT'][seat_a.team.pk], (0, 1))
+        self.assertEqual(season.streak_team_rank(max_streak=True, **records['WIN'])[0]['stat'], 5)
@@ -1,6 +1,8 @@
 from django.conf import settings
 from django.contrib.admin.sites import AdminSite
+from django.db import connection
 from django.test import TestCase, Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
 
 try:
     from django.urls import reverse
@@ -17,7 +19,8 @@ from ..admin import RaceInline, ResultInline, SeatInline
 from ..admin.forms import RaceAdminForm
 from ..admin.formsets import RaceFormSet
 from ..admin.common import get_circuit_id_from_gp, GrandPrixWidget
-from ..punctuation import get_punctuation_config
+from ..punctuation import get_punctuation_config, get_punctuation_label_dict
+from ..summary import get_seasons_summary
 from rest_framework.test import APITestCase
 from ..common import DRIVER27_NAMESPACE, DRIVER27_API_NAMESPACE
 from django import forms
@@ -154,6 +157,33 @@ class ViewTest(FixturesTest):
         self._test_competition_view()
         self._test_season_view()
 
+    def test_global_tpl(self):
+        self._GET_request('global:tpl')
+        self._GET_request('global:tpl', data={'competition': 1})
+        for season in Season.objects.all():
+            season.invalidate_cache()
+        # seasons, saved standings of drivers and teams, results and pending races
+        with self.assertNumQueries(5):
+            get_seasons_summary(Season.objects.all())
+        # champion status of seasons is cached
+        with self.assertNumQueries(3):
+            summary = get_seasons_summary(Season.objects.all())
+        for season_summary in summary:
+            season = season_summary['season']
+            self.assertEqual(season_summary['leader'], season.leader)
+            self.assertEqual(season_summary['team_leader'], season.team_leader)
+            self.assertEqual(season_summary['has_champion'], season.has_champion())
+
+        # only the changed season is read again
+        season = Season.objects.get(pk=1)
+        season.invalidate_cache()
+        with CaptureQueriesContext(connection) as queries:
+            summary = get_seasons_summary(Season.objects.all())
+        self.assertEqual(len(queries), 5)
+        self.assertIn('IN ({pk})'.format(pk=season.pk), queries[-1]['sql'])
+        for season_summary in summary:
+            self.assertEqual(season_summary['has_champion'], season_summary['season'].has_champion())
+
     def test_profiles_view(self):
 
         self._GET_request('global:driver-profile', kwargs={'driver_id': 1})
@@ -485,6 +515,19 @@ class DR27Api(APITestCase):
         self._GET_request('result-list')
         self._GET_request('result-detail', kwargs={'pk': 1})
 
+    def test_api_race_results_bulk(self):
+        race = Race.objects.get(pk=1)
+        first, second = race.results.filter(finish__isnull=False).order_by('finish')[:2]
+        grid = [{'seat': second.seat_id, 'finish': first.finish}, {'seat': first.seat_id, 'finish': second.finish}]
+        request_url = reverse(':'.join([DRIVER27_NAMESPACE, DRIVER27_API_NAMESPACE, 'race-results-bulk']),
+                              kwargs={'pk': race.pk})
+        response = self.client.post(request_url, grid, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([result['seat'] for result in response.data], [second.seat_id, first.seat_id])
+        self.assertEqual(race.results.get(pk=second.pk).finish, first.finish)
+        response = self.client.post(request_url, [{'seat': first.seat_id}, {'seat': first.seat_id}], format='json')
+        self.assertEqual(response.status_code, 400)
+
     def test_api_season(self):
         self._GET_request('season-list')
         self._GET_request('season-detail', kwargs={'pk': 1})
@@ -494,10 +537,40 @@ class DR27Api(APITestCase):
         self._GET_request('season-seats', kwargs={'pk': 1})
         self._GET_request('season-standings', kwargs={'pk': 1})
         self._GET_request('season-standings-team', kwargs={'pk': 1})
+        self._GET_request('season-standings-compared', kwargs={'pk': 1})
+        self._GET_request('season-standings-progression', kwargs={'pk': 1})
+        self._GET_request('season-simulation', kwargs={'pk': 1})
         self._GET_request('season-teams', kwargs={'pk': 1})
         self._GET_request('season-drivers', kwargs={'pk': 1})
         self._GET_request('season-title', kwargs={'pk': 1})
 
+    def test_api_season_simulation(self):
+        request_url = reverse(':'.join([DRIVER27_NAMESPACE, DRIVER27_API_NAMESPACE, 'season-simulation']),
+                              kwargs={'pk': 1})
+        response = self.client.get(request_url, {'simulations': 1000, 'seed': 27}, format='json')
+        self.assertEqual(response.status_code, 200)
+        # seed is not chosen by clients
+        self.assertEqual((response.data['simulations'], response.data['seed']), (1000, 0))
+        for params in ({'simulations': 50000}, {'simulations': 'all'}, {'punctuation': 'UNKNOWN'}):
+            response = self.client.get(request_url, params, format='json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_api_season_standings_compared_without_punctuation(self):
+        season = Season.objects.get(pk=1)
+        season.punctuation = None
+        season.save()
+        request_url = reverse(':'.join([DRIVER27_NAMESPACE, DRIVER27_API_NAMESPACE, 'season-standings-compared']),
+                              kwargs={'pk': season.pk})
+        response = self.client.get(request_url, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.data['punctuation'])
+        # ordered by the first configured punctuation
+        order_code = get_punctuation_label_dict()[0][0]
+        for rank_key in ('standings', 'standings_team'):
+            positions = [entry['positions'][order_code] for entry in response.data[rank_key]]
+            self.assertTrue(positions)
+            self.assertEqual(positions, sorted(positions))
+
     def test_api_seat(self):
         self._GET_request('seat-list')
         self._GET_request('seat-detail', kwargs={'pk': 1})
@@ -14,6 +14,7 @@ except ImportError:
 from .models import Competition, Season, Race, RankModel, Driver, Team, get_tuples_from_results
 from .records import get_record_config, get_record_label_dict
 from .punctuation import get_punctuation_label_dict
+from .summary import get_seasons_summary
 from django.shortcuts import render, get_object_or_404
 
 from .common import DRIVER27_NAMESPACE
@@ -38,7 +39,7 @@ def global_tpl(request, competition=None):
     if competition:
         seasons = seasons.filter(competition=competition)
     seasons = seasons.order_by('year', 'competition')
-    context = {'seasons': seasons}
+    context = {'seasons': get_seasons_summary(seasons)}
     tpl = 'driver27/global/_season_list.html'
     return render(request, tpl, context)
 